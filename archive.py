@@ -0,0 +1,256 @@
+"""Background recompression of older capture folders.
+
+    python slide_snap.py --recompress-archive --archive-after 30 --archive-format webp
+
+Screenshots are written with fast default compression so capturing never
+waits for the encoder. Once a date folder is older than min_age_days,
+ArchiveRecompressor re-encodes its captures on a process pool:
+
+* "png": PNG at the highest compression level, pixel for pixel the same,
+* "webp": lossless WebP, usually a good deal smaller than PNG,
+* "palette": PNG with a palette of at most 256 colors (needs Pillow). Exact
+  for flat slides with few colors, slightly lossy for photos and gradients.
+
+A file is only replaced when the result is smaller. The new file keeps the
+capture name stem and the original access and modification times; only the
+extension changes, for WebP. It is written to a temporary name, flushed and
+renamed into place, and the original is removed only after that, so a
+crash never loses a capture. Finished files are recorded in a state file
+in each date folder, so an interrupted run resumes where it stopped and
+later runs only look at new files. Delta captures (see delta_store.py)
+are already small and left as they are.
+
+While busy() returns True (e.g. while capturing), the job keeps the CPU
+time of its workers below cpu_budget of the whole machine by pausing
+between files. The workers also run at a lower scheduling priority.
+"""
+import io
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, datetime, timedelta
+
+from capture_index import parse_capture_name
+from delta_store import is_delta
+from image_writer import write_atomic
+
+TARGETS = {"png": ".png", "webp": ".webp", "palette": ".png"}
+STATE_FILENAME = ".slide_snap_recompressed.json"
+STATE_SAVE_EVERY = 50  # Files between state file writes
+
+
+# --- Worker process side ---
+def _lower_priority():
+    if hasattr(os, "nice"):
+        try:
+            os.nice(10)
+        except OSError:
+            pass
+
+
+def _encode(image, target):
+    """Returns the encoded bytes of image in target, or None if it can't be encoded."""
+    import cv2
+    if target == "png":
+        ok, encoded = cv2.imencode(".png", image, [cv2.IMWRITE_PNG_COMPRESSION, 9])
+        return encoded.tobytes() if ok else None
+    if target == "webp":
+        ok, encoded = cv2.imencode(".webp", image, [cv2.IMWRITE_WEBP_QUALITY, 101])  # Lossless
+        return encoded.tobytes() if ok else None
+
+    from PIL import Image
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2RGBA if image.shape[2] == 4 else cv2.COLOR_BGR2RGB)
+    paletted = Image.fromarray(image).quantize(colors=256, method=Image.Quantize.FASTOCTREE,
+                                               dither=Image.Dither.NONE)
+    buffer = io.BytesIO()
+    paletted.save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def recompress(path, target):
+    """Re-encodes one capture. Returns (path now holding it, bytes before, bytes after, CPU seconds)."""
+    import cv2
+    started = time.process_time()
+    stat = os.stat(path)
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    data = None
+    if image is not None and image.dtype.name == "uint8":  # Leaves 16-bit images alone
+        data = _encode(image, target)
+    del image
+    if data is None or len(data) >= stat.st_size:
+        return path, stat.st_size, stat.st_size, time.process_time() - started
+
+    new_path = os.path.splitext(path)[0] + TARGETS[target]
+    write_atomic(new_path, data, times_ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    if new_path != path:
+        os.remove(path)  # Only once the new file is complete
+    return new_path, stat.st_size, len(data), time.process_time() - started
+
+
+# --- Scheduling side ---
+def load_state(folder, target):
+    """Returns {filename: [size, mtime_ns]} of the files already done in target, or {}."""
+    try:
+        with open(os.path.join(folder, STATE_FILENAME), encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(state, dict) or state.get("target") != target:
+        return {}  # Another target, everything is redone
+    return state.get("files", {})
+
+
+def save_state(folder, target, done):
+    data = json.dumps({"target": target, "files": done}).encode("utf-8")
+    try:
+        write_atomic(os.path.join(folder, STATE_FILENAME), data)
+    except OSError as e:
+        print(f"Could not save recompression state in {folder}: {e}")
+
+
+class ArchiveRecompressor:
+    """Recompresses the date folders of an output folder that are older than min_age_days.
+
+    on_replaced(old_path, new_path) is called from the thread running run()
+    for every file that was rewritten (new_path == old_path unless the
+    extension changed), e.g. to update the capture index.
+    """
+
+    def __init__(self, base_output_path, target="webp", min_age_days=30, workers=None, cpu_budget=0.25,
+                 busy=None, on_replaced=None):
+        if target not in TARGETS:
+            raise ValueError(f"Unknown archive format: {target}")
+        self.base_output_path = base_output_path
+        self.target = target
+        self.min_age_days = max(1, min_age_days)
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.cpu_budget = cpu_budget
+        self.busy = busy
+        self.on_replaced = on_replaced
+        self._stop_event = threading.Event()
+        self._throttle_started = None
+        self._throttle_cpu = 0.0
+
+    def stop(self):
+        """Asks a running run() to return after the files in progress."""
+        self._stop_event.set()
+
+    def folders(self):
+        """Returns the date folders old enough to recompress, oldest first."""
+        cutoff = date.today() - timedelta(days=self.min_age_days)
+        folders = []
+        for name in os.listdir(self.base_output_path):
+            path = os.path.join(self.base_output_path, name)
+            try:
+                folder_date = datetime.strptime(name, "%Y.%m.%d").date()
+            except ValueError:
+                continue
+            if folder_date <= cutoff and os.path.isdir(path):
+                folders.append(path)
+        return sorted(folders)
+
+    def pending(self, folder, done):
+        """Returns the captures in folder not yet recorded in done. Cleans up after interrupted runs.
+
+        Entries of files that no longer exist are dropped from done.
+        """
+        captures = {}
+        for entry in os.scandir(folder):
+            if entry.name.startswith("screenshot_") and entry.name.endswith(".part"):
+                os.remove(entry.path)  # Left by a crash, the original is still there
+            elif entry.is_file() and parse_capture_name(entry.name) is not None and not is_delta(entry.name):
+                captures.setdefault(os.path.splitext(entry.name)[0], []).append(entry)
+
+        paths = []
+        names = set()
+        extension = TARGETS[self.target]
+        for stem, entries in sorted(captures.items()):
+            if len(entries) > 1:
+                # Interrupted between the rename and the removal: the target file is complete
+                # and was given the original's modification time
+                target = next((entry for entry in entries if entry.name.endswith(extension)), None)
+                if target is not None:
+                    leftovers = [entry for entry in entries if entry is not target
+                                 and entry.stat().st_mtime_ns == target.stat().st_mtime_ns]
+                    for entry in leftovers:
+                        os.remove(entry.path)
+                        if self.on_replaced is not None:
+                            self.on_replaced(entry.path, target.path)
+                    entries = [entry for entry in entries if entry not in leftovers]
+            for entry in entries:
+                names.add(entry.name)
+                stat = entry.stat()
+                if done.get(entry.name) != [stat.st_size, stat.st_mtime_ns]:
+                    paths.append(entry.path)
+        for name in set(done) - names:
+            del done[name]
+        return paths
+
+    def _throttle(self, cpu_seconds):
+        """Sleeps as long as needed to keep the workers' CPU time within the budget while busy."""
+        if self.busy is None or not self.busy():
+            self._throttle_started = None
+            return
+        now = time.monotonic()
+        if self._throttle_started is None:
+            self._throttle_started, self._throttle_cpu = now, 0.0
+        self._throttle_cpu += cpu_seconds
+        capacity = self.cpu_budget * (os.cpu_count() or 1)  # CPU seconds per second
+        ahead = self._throttle_cpu / capacity - (now - self._throttle_started)
+        if ahead > 0:
+            self._stop_event.wait(ahead)
+
+    def run(self):
+        """Recompresses every pending file. Returns {"files", "replaced", "bytes_before", "bytes_after"}."""
+        summary = {"files": 0, "replaced": 0, "bytes_before": 0, "bytes_after": 0}
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_lower_priority) as executor:
+            for folder in self.folders():
+                if self._stop_event.is_set():
+                    break
+                self._run_folder(executor, folder, summary)
+        return summary
+
+    def _run_folder(self, executor, folder, summary):
+        done = load_state(folder, self.target)
+        paths = self.pending(folder, done)
+        if not paths:
+            return
+        queue = iter(paths)
+        running = {}  # Future -> path
+        unsaved = 0
+        try:
+            while True:
+                while len(running) < self.workers and not self._stop_event.is_set():
+                    path = next(queue, None)
+                    if path is None:
+                        break
+                    running[executor.submit(recompress, path, self.target)] = path
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path = running.pop(future)
+                    try:
+                        new_path, before, after, cpu_seconds = future.result()
+                    except Exception as e:
+                        print(f"Could not recompress {path}: {e}")
+                        continue
+                    stat = os.stat(new_path)
+                    done[os.path.basename(new_path)] = [stat.st_size, stat.st_mtime_ns]
+                    summary["files"] += 1
+                    summary["bytes_before"] += before
+                    summary["bytes_after"] += after
+                    if after < before:
+                        summary["replaced"] += 1
+                        if self.on_replaced is not None:
+                            self.on_replaced(path, new_path)
+                    self._throttle(cpu_seconds)
+                    unsaved += 1
+                if unsaved >= STATE_SAVE_EVERY:
+                    save_state(folder, self.target, done)
+                    unsaved = 0
+        finally:
+            save_state(folder, self.target, done)
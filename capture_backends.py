@@ -0,0 +1,313 @@
+"""Screen capture backends for Slide Snap.
+
+Every backend grabs the whole virtual desktop, or a region of it, and
+returns it as a NumPy array in BGR or BGRA channel order, so frames can go
+straight to OpenCV without intermediate PIL images. CaptureRegion picks the
+region: one monitor, a fixed rectangle, or a window followed by title.
+
+Run this module directly to benchmark the backends available on this
+machine:
+
+    python capture_backends.py --benchmark
+"""
+import argparse
+import importlib.util
+import sys
+import time
+
+# OpenCV and NumPy are imported where frames are handled, so listing the
+# backends, monitors and windows at GUI startup doesn't load them.
+try:
+    import mss
+except ImportError:  # Optional, pyautogui is used instead
+    mss = None
+
+
+class CaptureBackend:
+    """Base class for screen capture backends.
+
+    Backends may hold per-thread resources (X11 connections, GDI handles), so
+    create them on the thread that calls grab().
+    """
+    name = "base"
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def grab(self, region=None):
+        """Returns the screen as a BGR or BGRA uint8 array.
+
+        region is a (left, top, width, height) box in desktop coordinates,
+        None grabs the whole desktop.
+        """
+        raise NotImplementedError
+
+    def desktop(self):
+        """Returns the (left, top, width, height) bounding box of all monitors."""
+        raise NotImplementedError
+
+    def monitors(self):
+        """Returns the (left, top, width, height) box of each monitor."""
+        return [self.desktop()]
+
+    def to_gray(self, frame, out=None):
+        """Converts a frame returned by grab() to grayscale.
+
+        out is an optional uint8 array of the frame's height and width to
+        convert into instead of allocating a new one.
+        """
+        import cv2
+        if frame.ndim == 2:
+            return frame
+        if frame.shape[2] == 4:
+            return cv2.cvtColor(frame, cv2.COLOR_BGRA2GRAY, dst=out)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=out)
+
+    def close(self):
+        pass
+
+
+class MSSBackend(CaptureBackend):
+    """Shared-memory capture through mss.
+
+    On Linux/X11 mss grabs through the MIT-SHM extension when the server
+    supports it. The returned array is a view on the BGRA buffer mss filled,
+    no copy is made.
+    """
+    name = "mss"
+
+    @classmethod
+    def is_available(cls):
+        return mss is not None
+
+    def __init__(self):
+        self.sct = mss.mss()
+        self.monitor = self.sct.monitors[0]  # Bounding box of all monitors
+
+    def grab(self, region=None):
+        if region is None:
+            area = self.monitor
+        else:
+            left, top, width, height = region
+            area = {"left": left, "top": top, "width": width, "height": height}
+        import numpy as np
+        shot = self.sct.grab(area)  # Only the requested pixels are copied out of the X server
+        return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+    @staticmethod
+    def _box(monitor):
+        return (monitor["left"], monitor["top"], monitor["width"], monitor["height"])
+
+    def desktop(self):
+        return self._box(self.monitor)
+
+    def monitors(self):
+        return [self._box(monitor) for monitor in self.sct.monitors[1:]]
+
+    def close(self):
+        self.sct.close()
+
+
+class PyAutoGUIBackend(CaptureBackend):
+    """Portable fallback through pyautogui.screenshot()."""
+    name = "pyautogui"
+
+    @classmethod
+    def is_available(cls):
+        # Importing pyautogui loads pyscreeze and PIL, only look for it here.
+        # Without a display it fails in __init__, which create_backend() reports
+        return importlib.util.find_spec("pyautogui") is not None
+
+    def __init__(self):
+        import pyautogui
+        self.pyautogui = pyautogui
+
+    def grab(self, region=None):
+        import cv2
+        import numpy as np
+        rgb = np.asarray(self.pyautogui.screenshot(region=region))
+        return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+    def desktop(self):
+        width, height = self.pyautogui.size()  # Primary monitor only
+        return (0, 0, width, height)
+
+
+class CaptureRegion:
+    """The part of the desktop to capture.
+
+    kind is one of:
+
+    * "desktop": everything, the default,
+    * "monitor": one monitor, value is its 1-based number,
+    * "rect": value is a fixed (left, top, width, height) box,
+    * "window": value is a window title (substring match). The window is
+      looked up on every grab, so the capture follows it when it moves.
+
+    Regions are stored in settings as the strings spec() returns, e.g.
+    "monitor:2", "rect:0,0,1280,720" or "window:PowerPoint".
+    """
+    KINDS = ("desktop", "monitor", "rect", "window")
+
+    def __init__(self, kind="desktop", value=None):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown capture region: {kind}")
+        self.kind = kind
+        self.value = value
+
+    @classmethod
+    def from_spec(cls, spec):
+        kind, _, value = (spec or "desktop").partition(":")
+        if kind == "monitor":
+            return cls(kind, int(value))
+        if kind == "rect":
+            box = tuple(int(part) for part in value.split(","))
+            if len(box) != 4 or box[2] <= 0 or box[3] <= 0:
+                raise ValueError(f"Invalid capture rectangle: {value}")
+            return cls(kind, box)
+        if kind == "window":
+            if not value:
+                raise ValueError("A window region needs a title")
+            return cls(kind, value)
+        return cls(kind)
+
+    def spec(self):
+        if self.kind == "desktop":
+            return "desktop"
+        if self.kind == "rect":
+            return "rect:" + ",".join(str(part) for part in self.value)
+        return f"{self.kind}:{self.value}"
+
+    def __str__(self):
+        if self.kind == "desktop":
+            return "Whole desktop"
+        if self.kind == "monitor":
+            return f"Monitor {self.value}"
+        if self.kind == "rect":
+            return "Region {2}x{3} at {0},{1}".format(*self.value)
+        return f"Window '{self.value}'"
+
+    def resolve(self, backend):
+        """Returns the (left, top, width, height) box to grab, or None for the whole desktop.
+
+        Raises LookupError when the monitor or window is not there (anymore).
+        """
+        if self.kind == "desktop":
+            return None
+        if self.kind == "monitor":
+            monitors = backend.monitors()
+            if not 1 <= self.value <= len(monitors):
+                raise LookupError(f"Monitor {self.value} not found")
+            return monitors[self.value - 1]
+        if self.kind == "rect":
+            box = self.value
+        else:
+            box = find_window(self.value)
+        return clip_box(box, backend.desktop())
+
+
+def find_window(title):
+    """Returns the (left, top, width, height) box of the first visible window matching title."""
+    try:
+        import pygetwindow  # Optional, only needed for window regions
+    except Exception as e:  # Raises NotImplementedError on unsupported platforms
+        raise RuntimeError(f"Window capture is not available: {e}")
+
+    for window in pygetwindow.getWindowsWithTitle(title):
+        if window.width > 0 and window.height > 0 and not getattr(window, "isMinimized", False):
+            return (window.left, window.top, window.width, window.height)
+    raise LookupError(f"Window '{title}' not found")
+
+
+def window_titles():
+    """Returns the titles of the open windows, or an empty list when they can't be listed."""
+    try:
+        import pygetwindow
+        return sorted({title for title in pygetwindow.getAllTitles() if title.strip()})
+    except Exception:  # Not installed, or not supported on this platform
+        return []
+
+
+def clip_box(box, bounds):
+    """Clips a (left, top, width, height) box to bounds. Raises LookupError when nothing is left."""
+    left, top = max(box[0], bounds[0]), max(box[1], bounds[1])
+    right = min(box[0] + box[2], bounds[0] + bounds[2])
+    bottom = min(box[1] + box[3], bounds[1] + bounds[3])
+    if right <= left or bottom <= top:
+        raise LookupError("Capture region is off screen")
+    return (left, top, right - left, bottom - top)
+
+
+BACKENDS = {backend.name: backend for backend in (MSSBackend, PyAutoGUIBackend)}
+AUTO_ORDER = ("mss", "pyautogui")  # Fastest first
+
+
+def available_backends():
+    """Returns the names of the backends that can be used on this machine."""
+    return [name for name in AUTO_ORDER if BACKENDS[name].is_available()]
+
+
+def create_backend(name="auto"):
+    """Creates a capture backend by name, "auto" picks the fastest available one."""
+    if name != "auto":
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown capture backend: {name}")
+        return BACKENDS[name]()
+
+    for candidate in available_backends():
+        try:
+            return BACKENDS[candidate]()
+        except Exception as e:
+            print(f"Capture backend '{candidate}' unavailable: {e}")
+    raise RuntimeError("No screen capture backend is available.")
+
+
+def benchmark(frames=30, names=None, region=None):
+    """Times grab + grayscale for each backend and prints the results.
+
+    region is an optional CaptureRegion to grab instead of the whole desktop.
+    """
+    results = {}
+    for name in names or available_backends():
+        try:
+            backend = create_backend(name)
+        except Exception as e:
+            print(f"{name:>10}: unavailable ({e})")
+            continue
+        try:
+            box = region.resolve(backend) if region is not None else None
+            backend.to_gray(backend.grab(box))  # Warm up
+            start = time.perf_counter()
+            for _ in range(frames):
+                frame = backend.grab(box)
+                backend.to_gray(frame)
+            elapsed = time.perf_counter() - start
+        finally:
+            backend.close()
+
+        height, width = frame.shape[:2]
+        results[name] = elapsed / frames
+        print(f"{name:>10}: {frames / elapsed:6.1f} fps  {1000 * elapsed / frames:7.1f} ms/grab  ({width}x{height})")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Slide Snap screen capture backends")
+    parser.add_argument("--benchmark", action="store_true", help="benchmark the available backends")
+    parser.add_argument("--frames", type=int, default=30, help="frames to grab per backend")
+    parser.add_argument("--backend", action="append", choices=sorted(BACKENDS),
+                        help="only benchmark this backend (repeatable)")
+    parser.add_argument("--region", default="desktop",
+                        help='what to grab: "desktop", "monitor:N", "rect:LEFT,TOP,WIDTH,HEIGHT" or "window:TITLE"')
+    args = parser.parse_args(argv)
+
+    if not args.benchmark:
+        print("Available backends: " + ", ".join(available_backends()))
+        return 0
+    benchmark(args.frames, args.backend, CaptureRegion.from_spec(args.region))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
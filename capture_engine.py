@@ -0,0 +1,930 @@
+"""Capture, compare and save engine for Slide Snap.
+
+Everything needed to watch the screen and save slides lives here, without
+any Qt dependency: the video detector, the frame comparator and the
+CaptureEngine that ties them to a capture backend and an ImageWriter. The
+GUI drives the engine from a QTimer on a worker thread; the headless CLI
+(slide_snap.py) drives it with CaptureEngine.run().
+"""
+import collections
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from capture_backends import create_backend
+from delta_store import read_capture
+from image_writer import ImageWriter
+from metrics import Metrics
+from slide_hashes import SlideHashStore, dhash
+
+
+class VideoDetector:
+    """Classifies video playback from the frames of the regular capture loop.
+
+    Keeps a short ring of downscaled grayscale frames. A slide change is a
+    single burst of change followed by a still screen, while a playing video
+    keeps changing the same region tick after tick, so the decision looks at
+    both the rate of change over the ring and how long it has persisted.
+    """
+    def __init__(self, history=6, width=320, pixel_threshold=25, change_fraction=0.005,
+                 persistent_fraction=0.002, min_change_rate=0.6, min_persistence=3):
+        self.width = width
+        self.pixel_threshold = pixel_threshold  # Per-pixel intensity delta counted as change
+        self.change_fraction = change_fraction  # Fraction of changed pixels for a changed pair
+        self.persistent_fraction = persistent_fraction  # Fraction changing in every recent pair
+        self.min_change_rate = min_change_rate
+        self.min_persistence = min_persistence
+        self.frames = collections.deque(maxlen=history)
+        self.change_masks = collections.deque(maxlen=history - 1)
+
+    def reset(self):
+        self.frames.clear()
+        self.change_masks.clear()
+
+    def add_frame(self, gray):
+        """Adds a grayscale frame from the capture loop to the ring."""
+        height, width = gray.shape
+        scale = self.width / float(width)
+        small = cv2.resize(gray, (self.width, max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+
+        if self.frames and self.frames[-1].shape != small.shape:
+            self.reset()  # Resolution changed, old frames are not comparable
+        if self.frames:
+            self.change_masks.append(cv2.absdiff(self.frames[-1], small) > self.pixel_threshold)
+        self.frames.append(small)
+
+    def is_video(self):
+        """Returns True when recent frames show sustained, localized change."""
+        if len(self.change_masks) < self.min_persistence:
+            return False
+
+        changed = [np.count_nonzero(mask) / mask.size > self.change_fraction for mask in self.change_masks]
+        rate = sum(changed) / len(changed)
+
+        persistence = 0
+        for pair_changed in reversed(changed):
+            if not pair_changed:
+                break
+            persistence += 1
+
+        if rate < self.min_change_rate or persistence < self.min_persistence:
+            return False
+
+        # The same pixels must keep changing, not a different region each time
+        persistent = np.logical_and.reduce(list(self.change_masks)[-self.min_persistence:])
+        return np.count_nonzero(persistent) / persistent.size > self.persistent_fraction
+
+
+# region is the (x, y, width, height) bounding box of the changed tiles, or None
+CompareResult = collections.namedtuple("CompareResult", ["changed", "score", "diff_pixels", "level", "region"],
+                                       defaults=(None,))
+
+SSIM_WINDOW = 7  # compare_ssim's default window size
+SSIM_C1 = (0.01 * 255) ** 2  # compare_ssim's constants for uint8 data
+SSIM_C2 = (0.03 * 255) ** 2
+
+
+class BufferPool:
+    """Reusable arrays keyed by name, shape and dtype.
+
+    get() hands out the same array for the same key on every call, so code
+    that writes its intermediates into pooled arrays allocates nothing once
+    the first frame of a resolution has been processed. Callers must be
+    done with a buffer before asking for it again.
+    """
+
+    def __init__(self):
+        self._buffers = {}
+        self.allocations = 0
+
+    def get(self, name, shape, dtype=np.float32):
+        key = (name, tuple(shape), np.dtype(dtype).str)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = np.empty(shape, dtype)
+            self.allocations += 1
+        return buffer
+
+    def clear(self):
+        self._buffers.clear()
+
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+
+def ssim(previous, current, pool, prefix="ssim"):
+    """Returns (mean SSIM, SSIM map) of two uint8 frames of the same size.
+
+    Computes what compare_ssim(previous, current, full=True) does (7x7
+    uniform window, sample covariance, reflected borders), with OpenCV box
+    filters writing into float32 arrays from pool instead of allocating a
+    dozen float64 frames. The returned map is a pooled buffer, valid until
+    the next call with the same prefix and shape.
+    """
+    shape = current.shape
+    x, y, t, ux, uy, uxx, uyy, uxy = (pool.get(f"{prefix}.{name}", shape)
+                                      for name in ("x", "y", "t", "ux", "uy", "uxx", "uyy", "uxy"))
+    window = (SSIM_WINDOW, SSIM_WINDOW)
+    cov_norm = SSIM_WINDOW ** 2 / (SSIM_WINDOW ** 2 - 1.0)
+
+    def box(src, dst):
+        cv2.boxFilter(src, -1, window, dst=dst, normalize=True, borderType=cv2.BORDER_REFLECT)
+
+    np.copyto(x, previous)
+    np.copyto(y, current)
+    box(x, ux)
+    box(y, uy)
+    np.multiply(x, x, out=t)
+    box(t, uxx)
+    np.multiply(y, y, out=t)
+    box(t, uyy)
+    np.multiply(x, y, out=t)
+    box(t, uxy)
+
+    # Variances and covariance, in place of the second moments
+    np.multiply(ux, ux, out=t)
+    uxx -= t
+    uxx *= cov_norm
+    np.multiply(uy, uy, out=t)
+    uyy -= t
+    uyy *= cov_norm
+    np.multiply(ux, uy, out=t)
+    uxy -= t
+    uxy *= cov_norm
+
+    # Numerator (2 ux uy + C1)(2 vxy + C2) into x
+    np.multiply(t, 2, out=x)
+    x += SSIM_C1
+    np.multiply(uxy, 2, out=y)
+    y += SSIM_C2
+    x *= y
+    # Denominator (ux^2 + uy^2 + C1)(vx + vy + C2) into ux
+    np.multiply(ux, ux, out=ux)
+    np.multiply(uy, uy, out=uy)
+    ux += uy
+    ux += SSIM_C1
+    uxx += uyy
+    uxx += SSIM_C2
+    ux *= uxx
+    np.divide(x, ux, out=x)
+
+    pad = (SSIM_WINDOW - 1) // 2  # compare_ssim averages away from the borders
+    score = float(x[pad:shape[0] - pad, pad:shape[1] - pad].mean(dtype=np.float64))
+    return score, x
+
+
+def otsu_count(hist):
+    """Returns how many pixels cv2's THRESH_BINARY_INV | THRESH_OTSU would set.
+
+    Works from a 256-bin histogram, so diff maps computed piecewise can be
+    thresholded as if they were one image.
+    """
+    hist = hist.astype(np.float64)
+    bins = np.arange(256)
+    below = np.cumsum(hist)
+    above = below[-1] - below
+    below_sum = np.cumsum(hist * bins)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_below = below_sum / below
+        mean_above = (below_sum[-1] - below_sum) / above
+        between = np.nan_to_num(below * above * (mean_below - mean_above) ** 2)
+    threshold = int(np.argmax(between))
+    return int(below[threshold])  # Pixels at or below the threshold become 255
+
+
+class FrameComparator:
+    """Decides whether the current grayscale frame differs from the previous one.
+
+    In "full" mode every comparison runs SSIM on the full-resolution frames.
+    In "pyramid" mode the frames are compared at the coarsest level first and
+    the decision is taken there whenever the score is clearly above or below
+    the sensitivity; only scores inside the ambiguity band escalate to the
+    next finer level and, last, to full resolution.
+    In "tiles" mode the frame is split into a grid of tiles with a small
+    block-mean signature each; only tiles whose signature changed are run
+    through SSIM, so the cost follows the changed area instead of the
+    resolution. Every mode reports the bounding box of the changed tiles.
+
+    Ahead of any mode, is_unchanged() offers a cheap prefilter: a checksum
+    of a block-mean thumbnail that lets identical ticks skip SSIM entirely.
+
+    Full-resolution SSIM and the Otsu threshold are timed as the "ssim" and
+    "threshold" stages of metrics; CaptureEngine shares its own Metrics.
+    """
+    MODES = ("full", "pyramid", "tiles")
+
+    def __init__(self, mode="full", pyramid_levels=(8, 4), ambiguity_band=0.5,
+                 prefilter=True, fingerprint_grid=64, fingerprint_quantization=2,
+                 tile_size=128, tile_tolerance=3, tile_change_threshold=0.01, metrics=None):
+        self.mode = mode
+        self.pyramid_levels = tuple(sorted(pyramid_levels, reverse=True))  # Downscale factors, coarsest first
+        self.ambiguity_band = ambiguity_band  # Relative half-width of the band around the thresholds
+        self.prefilter = prefilter
+        self.fingerprint_grid = fingerprint_grid  # Thumbnail is grid x grid block means
+        self.fingerprint_quantization = fingerprint_quantization  # Low bits dropped to ignore noise
+        self.tile_size = tile_size  # Pixels per tile side
+        self.tile_tolerance = tile_tolerance  # Max block-mean delta for a tile to count as clean
+        self.tile_change_threshold = tile_change_threshold  # SSIM loss for a dirty tile to count as changed
+        self.level_hits = collections.Counter()  # Downscale factor -> decisions taken there (1 = full)
+        self.prefilter_checks = 0
+        self.prefilter_skips = 0
+        self._levels = {}  # id(frame) -> (frame, {factor: downscaled frame})
+        self.pool = BufferPool()  # SSIM intermediates, reused from tick to tick
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._frame_shape = None
+
+    def is_unchanged(self, previous, current):
+        """Returns True when both frames have the same fingerprint.
+
+        A match means the comparison, and everything derived from it, can be
+        skipped for this tick.
+        """
+        if not self.prefilter:
+            return False
+        self.prefilter_checks += 1
+        if previous.shape == current.shape and self._fingerprint(previous) == self._fingerprint(current):
+            self.prefilter_skips += 1
+            self._forget_except(previous, current)
+            return True
+        return False
+
+    def skip_ratio(self):
+        """Returns the fraction of prefiltered ticks that skipped SSIM."""
+        if not self.prefilter_checks:
+            return 0.0
+        return self.prefilter_skips / self.prefilter_checks
+
+    def compare(self, previous, current, sensitivity, min_diff_pixels):
+        """Returns a CompareResult for two grayscale frames of the same size."""
+        if current.shape != self._frame_shape:
+            self.pool.clear()  # Buffers for the old resolution won't be used again
+            self._frame_shape = current.shape
+        if min(current.shape) < self.tile_size:
+            mode = "full"  # Frame too small for tiling or downscaling
+        else:
+            mode = self.mode
+
+        if mode == "tiles":
+            result = self._compare_tiles(previous, current, sensitivity, min_diff_pixels)
+        elif mode == "pyramid":
+            result = self._compare_pyramid(previous, current, sensitivity, min_diff_pixels)
+        else:
+            result = None
+        if result is None:
+            score, diff_pixels = self._ssim(previous, current)
+            changed = (1 - score) > sensitivity and diff_pixels > min_diff_pixels
+            result = CompareResult(changed, score, diff_pixels, 1)
+        if result.changed and result.region is None:
+            result = result._replace(region=self._dirty_region(previous, current))
+        self.level_hits[result.level] += 1
+        self._forget_except(previous, current)
+        return result
+
+    def hit_rates(self):
+        """Returns the fraction of decisions taken at each level, coarsest first."""
+        total = sum(self.level_hits.values())
+        if not total:
+            return {}
+        return {level: self.level_hits[level] / total
+                for level in sorted(self.level_hits, reverse=True)}
+
+    def new_frame(self, shape):
+        """Returns a uint8 buffer for the next gray frame, or None to let OpenCV allocate one."""
+        return None
+
+    def close(self):
+        """Releases resources held outside this object (worker processes, shared memory)."""
+
+    def forget(self, frame):
+        """Drops everything cached for frame. Call before reusing its buffer for new pixels."""
+        self._levels.pop(id(frame), None)
+
+    def reset_stats(self):
+        self.level_hits.clear()
+        self.prefilter_checks = 0
+        self.prefilter_skips = 0
+
+    def _compare_pyramid(self, previous, current, sensitivity, min_diff_pixels):
+        low_change = sensitivity * (1 - self.ambiguity_band)
+        high_change = sensitivity * (1 + self.ambiguity_band)
+        low_pixels = min_diff_pixels * (1 - self.ambiguity_band)
+        high_pixels = min_diff_pixels * (1 + self.ambiguity_band)
+
+        for factor in self.pyramid_levels:
+            if factor <= 1:
+                continue
+            previous_small = self._downscaled(previous, factor)
+            current_small = self._downscaled(current, factor)
+            if min(current_small.shape) < 7:
+                continue  # Too small for the SSIM window
+
+            score, diff_pixels = self._ssim(previous_small, current_small)
+            diff_pixels *= factor * factor  # Estimate in full-resolution pixels
+            change = 1 - score
+
+            if change < low_change or diff_pixels < low_pixels:
+                return CompareResult(False, score, diff_pixels, factor)
+            if change > high_change and diff_pixels > high_pixels:
+                return CompareResult(True, score, diff_pixels, factor)
+        return None  # Still ambiguous, decide at full resolution
+
+    def _cache(self, frame):
+        # Each frame is fingerprinted/downscaled once: as the current frame on
+        # one tick and reused as the previous frame on the next.
+        entry = self._levels.get(id(frame))
+        if entry is None or entry[0] is not frame:
+            entry = (frame, {})
+            self._levels[id(frame)] = entry
+        return entry[1]
+
+    def _fingerprint(self, frame):
+        cache = self._cache(frame)
+        if "fingerprint" not in cache:
+            grid = self.fingerprint_grid
+            thumbnail = cv2.resize(frame, (grid, grid), interpolation=cv2.INTER_AREA)
+            thumbnail >>= self.fingerprint_quantization
+            cache["fingerprint"] = zlib.crc32(thumbnail.tobytes())
+        return cache["fingerprint"]
+
+    def _tile_signatures(self, frame):
+        """Returns a (rows, cols, 16) array of 4x4 block means per tile."""
+        cache = self._cache(frame)
+        key = ("tiles", self.tile_size)
+        if key not in cache:
+            tile = self.tile_size
+            height, width = frame.shape
+            rows, cols = -(-height // tile), -(-width // tile)
+            padded = frame
+            if rows * tile != height or cols * tile != width:
+                padded = cv2.copyMakeBorder(frame, 0, rows * tile - height, 0, cols * tile - width,
+                                            cv2.BORDER_REPLICATE)
+            # Integer factor, so INTER_AREA gives exact block means
+            blocks = cv2.resize(padded, (cols * 4, rows * 4), interpolation=cv2.INTER_AREA)
+            cache[key] = blocks.reshape(rows, 4, cols, 4).transpose(0, 2, 1, 3).reshape(rows, cols, 16)
+        return cache[key]
+
+    def _dirty_tiles(self, previous, current):
+        """Returns a (rows, cols) boolean array of tiles whose signature changed."""
+        delta = cv2.absdiff(self._tile_signatures(previous), self._tile_signatures(current))
+        return delta.max(axis=2) > self.tile_tolerance
+
+    def _tiles_region(self, tiles, shape):
+        rows, cols = np.nonzero(tiles)
+        if not len(rows):
+            return None
+        tile = self.tile_size
+        height, width = shape
+        x0, y0 = int(cols.min()) * tile, int(rows.min()) * tile
+        x1, y1 = min(width, (int(cols.max()) + 1) * tile), min(height, (int(rows.max()) + 1) * tile)
+        return (x0, y0, x1 - x0, y1 - y0)
+
+    def _dirty_region(self, previous, current):
+        return self._tiles_region(self._dirty_tiles(previous, current), current.shape)
+
+    def _compare_tiles(self, previous, current, sensitivity, min_diff_pixels):
+        tile = self.tile_size
+        height, width = current.shape
+        dirty = self._dirty_tiles(previous, current)
+        changed_tiles = np.zeros_like(dirty)
+        hist = np.zeros(256, dtype=np.int64)
+        ssim_loss = 0.0
+        compared_pixels = 0
+
+        for row in range(dirty.shape[0]):
+            dirty_cols = np.flatnonzero(dirty[row])
+            if not len(dirty_cols):
+                continue
+            # Consecutive dirty tiles in a row share one SSIM call
+            runs = np.split(dirty_cols, np.flatnonzero(np.diff(dirty_cols) != 1) + 1)
+            y0, y1 = row * tile, min(height, (row + 1) * tile)
+            for run in runs:
+                x0, x1 = int(run[0]) * tile, min(width, (int(run[-1]) + 1) * tile)
+                inner = self._ssim_map(previous, current, y0, y1, x0, x1)
+
+                ssim_loss += float(np.sum(1.0 - inner))
+                compared_pixels += inner.size
+                hist += np.bincount((inner * 255).astype("uint8").ravel(), minlength=256)
+                for col in run:
+                    tile_map = inner[:, (col - run[0]) * tile:(col - run[0] + 1) * tile]
+                    changed_tiles[row, col] = 1.0 - tile_map.mean() > self.tile_change_threshold
+
+        # Clean tiles are taken as identical: SSIM of 1, i.e. 255 in the diff map
+        hist[255] += height * width - compared_pixels
+        score = 1.0 - ssim_loss / (height * width)
+        diff_pixels = otsu_count(hist) if compared_pixels else 0
+        changed = bool(changed_tiles.any()) and (1 - score) > sensitivity and diff_pixels > min_diff_pixels
+        return CompareResult(changed, score, diff_pixels, 1, self._tiles_region(changed_tiles, current.shape))
+
+    def _ssim_map(self, previous, current, y0, y1, x0, x1):
+        """Returns the SSIM map of a region, identical to the full-frame map there.
+
+        The map is a pooled buffer, valid until the next region of the same size.
+        """
+        height, width = current.shape
+        pad = SSIM_WINDOW // 2
+
+        def padded(low, high, limit):
+            low, high = max(0, low - pad), min(limit, high + pad)
+            if high - low < SSIM_WINDOW:
+                low = max(0, high - SSIM_WINDOW)
+                high = min(limit, low + SSIM_WINDOW)
+            return low, high
+
+        py0, py1 = padded(y0, y1, height)
+        px0, px1 = padded(x0, x1, width)
+        _, diff = ssim(previous[py0:py1, px0:px1], current[py0:py1, px0:px1], self.pool, prefix="tile")
+        return diff[y0 - py0:y1 - py0, x0 - px0:x1 - px0]
+
+    def _downscaled(self, frame, factor):
+        levels = self._cache(frame)
+        if factor not in levels:
+            height, width = frame.shape
+            size = (max(1, width // factor), max(1, height // factor))
+            levels[factor] = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        return levels[factor]
+
+    def _forget_except(self, *frames):
+        keep = {id(frame) for frame in frames}
+        for key in [key for key in self._levels if key not in keep]:
+            del self._levels[key]
+
+    def _ssim(self, previous, current):
+        with self.metrics.span("ssim"):
+            score, diff = ssim(previous, current, self.pool)
+        with self.metrics.span("threshold"):
+            shape = current.shape
+            scaled = self.pool.get("diff.scaled", shape)
+            diff_uint8 = self.pool.get("diff.uint8", shape, np.uint8)
+            diff_binary = self.pool.get("diff.binary", shape, np.uint8)
+            np.multiply(diff, 255, out=scaled)
+            np.copyto(diff_uint8, scaled, casting="unsafe")  # Truncates like astype("uint8")
+            cv2.threshold(diff_uint8, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU, dst=diff_binary)
+            return score, cv2.countNonZero(diff_binary)
+
+
+class AdaptiveScheduler:
+    """Chooses the delay before each capture.
+
+    A detected change drops the interval to min_interval, so build
+    animations and quick slide flips are caught. Every unchanged tick then
+    multiplies it by backoff, up to max_interval. While a video is playing
+    the base interval is kept, so the video detector sees evenly spaced
+    frames. With adaptive off the interval stays fixed.
+
+    A tick that runs past its interval does not queue the ticks it missed:
+    the schedule skips ahead to the next slot after the tick finished, and
+    the skipped slots are counted.
+    """
+
+    def __init__(self, interval=5, min_interval=1, max_interval=10, backoff=2.0, adaptive=True):
+        self.interval = interval  # Base interval, used when not adaptive
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.adaptive = adaptive
+        self.current = interval
+        self.overruns = 0  # Ticks that ran longer than their interval
+        self.skipped = 0  # Slots skipped because of them
+
+    def reset(self):
+        self.current = self.interval
+        self.overruns = 0
+        self.skipped = 0
+
+    def update(self, changed, video=False):
+        """Adjusts the interval from the outcome of a tick. Returns the new interval."""
+        low = min(self.min_interval, self.max_interval)
+        high = max(self.min_interval, self.max_interval)
+        if not self.adaptive or video:
+            self.current = self.interval
+        elif changed:
+            self.current = low
+        else:
+            self.current = max(low, min(high, self.current * self.backoff))
+        return self.current
+
+    def delay(self, duration):
+        """Returns how long to wait after a tick that took duration seconds."""
+        interval = max(self.current, 0.001)
+        if duration <= interval:
+            return interval - duration
+        missed = int(duration // interval)
+        self.overruns += 1
+        self.skipped += missed
+        return (missed + 1) * interval - duration
+
+
+class CaptureEngine:
+    """Grabs the screen, compares it with the last frame and saves slide changes.
+
+    tick() runs one capture and sets next_delay from the AdaptiveScheduler;
+    run() keeps ticking on the calling thread until stop() is called. Captures go to a YYYY.MM.DD folder under output_folder,
+    picked per capture so long-running sessions roll over at midnight.
+
+    Results are reported through optional callbacks:
+
+    * on_saved(filepath, region) from the writer thread once a file is on disk,
+    * on_revisit(filepath) when a change shows a slide saved earlier,
+    * on_region_missing(message) when the capture region's monitor or window
+      disappears; ticks are skipped until it is back,
+    * on_video_paused() and on_video_resumed() around video playback,
+    * on_sensitivity(value) when adaptive sensitivity picks a threshold,
+    * on_stats(summary) after every tick,
+    * on_error(message) when capturing or writing fails; the engine stops.
+
+    region is a CaptureRegion limiting what is grabbed, None is the whole
+    desktop. Everything downstream (video detection, comparison, saving)
+    only ever sees the region's pixels.
+
+    clock supplies the current time in seconds since the epoch, so the engine
+    can run against recorded frames and simulated time. With save_captures
+    off, changes are detected and reported but nothing is written.
+
+    With dedup on, every saved slide is remembered in the date folder's
+    SlideHashStore. A change whose hash is within dedup_distance bits of a
+    slide saved earlier that day, and which the comparator finds unchanged
+    against that file's pixels, is recorded as a revisit of that file
+    instead of being encoded and written again.
+
+    metrics (a metrics.Metrics, created when not given) times every stage
+    of a tick and counts ticks, changes, saves, skips, video pauses,
+    revisits and errors. It is shared with the comparator and the writer.
+    set_profile() runs the ticks under a cProfile.Profile (see profiling.py).
+
+    retention (a retention.RetentionManager) is asked to free disk space
+    before every write and to enforce its policy after every save.
+    """
+
+    def __init__(self, output_folder, interval=5, sensitivity=0.005, adaptive_sensitivity=True,
+                 video_detection=True, video_check_interval=5, min_diff_pixels=10000, comparator=None,
+                 capture_backend="auto", writer_options=None, region=None, adaptive_interval=True,
+                 min_interval=1.0, max_interval=10.0, dedup=False, dedup_distance=8, save_captures=True,
+                 clock=time.time, on_saved=None, on_revisit=None, on_region_missing=None,
+                 on_video_paused=None, on_video_resumed=None, on_sensitivity=None, on_stats=None,
+                 on_error=None, metrics=None, retention=None):
+        self.output_folder = output_folder
+        self.scheduler = AdaptiveScheduler(interval, min_interval, max_interval, adaptive=adaptive_interval)
+        self.next_delay = interval
+        self.sensitivity = sensitivity
+        self.adaptive_sensitivity = adaptive_sensitivity
+        self.video_detection = video_detection
+        self.video_check_interval = video_check_interval
+        self.min_diff_pixels = min_diff_pixels
+        self.dedup = dedup
+        self.dedup_distance = dedup_distance
+        self.save_captures = save_captures
+        self.clock = clock
+
+        self.on_saved = on_saved
+        self.on_revisit = on_revisit
+        self.on_region_missing = on_region_missing
+        self.on_video_paused = on_video_paused
+        self.on_video_resumed = on_video_resumed
+        self.on_sensitivity = on_sensitivity
+        self.on_stats = on_stats
+        self.on_error = on_error
+
+        self.is_running = False
+        self.previous_screenshot = None
+        self.paused_for_video = False
+        self.last_video_check_time = 0
+        self.video_detector = VideoDetector()
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.comparator = comparator if comparator is not None else FrameComparator()
+        self.comparator.metrics = self.metrics
+        self.capture_backend = capture_backend
+        self.region = region
+        self.region_missing = False
+        self.backend = None  # Created in start(), backends are bound to the thread that uses them
+        self.hash_store = None  # Store of the date folder captures currently go to
+        self.last_revisit = None  # File the last processed frame revisited, if any
+        self._pending_hashes = {}  # Submitted file path -> (store, hash), added once written
+        self._memory_frames = {}  # Key -> PNG of gray frames remembered without save_captures
+        self._spare_gray = None  # Gray frame buffer free for the next tick
+        self._stop_event = threading.Event()
+        self.profile = None  # cProfile.Profile enabled around each tick, see set_profile()
+        self._profile_lock = threading.Lock()
+        self.retention = retention
+
+        # One writer thread keeps files in capture order
+        self.writer = ImageWriter(on_saved=self._saved, on_error=self._write_error, on_dropped=self._dropped,
+                                  metrics=self.metrics,
+                                  make_room=retention.make_room if retention is not None else None,
+                                  **(writer_options or {}))
+
+    def start(self):
+        """Creates the capture backend. Must run on the thread that will tick."""
+        try:
+            self.backend = create_backend(self.capture_backend)
+        except Exception as e:
+            raise RuntimeError(f"Could not start screen capture: {e}")
+        self._stop_event.clear()
+        self.scheduler.reset()
+        self.next_delay = self.scheduler.current
+        self.is_running = True
+
+    @property
+    def interval(self):
+        return self.scheduler.interval
+
+    @interval.setter
+    def interval(self, interval):
+        self.scheduler.interval = interval
+
+    def stop(self):
+        """Stops ticking. Safe to call from any thread or a signal handler."""
+        self.is_running = False
+        self._stop_event.set()
+
+    def close(self, wait=True):
+        """Releases the backend and the writer. With wait=True, queued frames are still written."""
+        self.stop()
+        if self.backend is not None:
+            self.backend.close()
+            self.backend = None
+        self.writer.close(wait)
+        self.comparator.close()
+
+    def run(self):
+        """Ticks on the calling thread until stop() is called."""
+        if not self.is_running:
+            self.start()
+        while self.is_running:
+            self.tick()
+            if self._stop_event.wait(self.next_delay):
+                break
+
+    def set_profile(self, profile):
+        """Profiles the following ticks with a cProfile.Profile, None stops.
+
+        Safe to call from any thread, waits for a profiled tick in progress
+        so the profile can be dumped right after.
+        """
+        with self._profile_lock:
+            self.profile = profile
+
+    def tick(self):
+        """Grabs one frame, processes it and schedules the next tick. Errors stop the engine."""
+        profile = self.profile
+        if profile is None:
+            return self._tick()
+        with self._profile_lock:
+            profile.enable()
+            try:
+                return self._tick()
+            finally:
+                profile.disable()
+
+    def _tick(self):
+        if not self.is_running:
+            return None
+        started = time.perf_counter()
+        self.metrics.increment("ticks")
+        try:
+            with self.metrics.span("region"):
+                box = self.region.resolve(self.backend) if self.region is not None else None
+        except LookupError as e:
+            # Window closed or minimized, monitor unplugged: wait for it to come back
+            if not self.region_missing:
+                self.region_missing = True
+                self._notify(self.on_region_missing, str(e))
+            self.metrics.increment("region_missing")
+            self.next_delay = self.scheduler.update(False, video=True)
+            return None
+        except Exception as e:
+            self._fail(str(e))
+            return None
+        self.region_missing = False
+
+        try:
+            with self.metrics.span("grab"):
+                screenshot = self.backend.grab(box)
+            # The gray frame goes into whichever buffer the last tick let go of
+            spare = self._spare_gray
+            if spare is not None and spare.shape != screenshot.shape[:2]:
+                spare = None  # Resolution changed
+            if spare is not None:
+                self.comparator.forget(spare)
+            else:
+                spare = self.comparator.new_frame(screenshot.shape[:2])
+            with self.metrics.span("gray"):
+                screenshot_gray = self.backend.to_gray(screenshot, out=spare)
+            previous = self.previous_screenshot
+            result = self.process(screenshot, screenshot_gray)
+            # previous and current are swapped by reference, the one not kept is reused next tick
+            self._spare_gray = previous if self.previous_screenshot is screenshot_gray else screenshot_gray
+            if self._spare_gray is screenshot:
+                self._spare_gray = None  # Backend returned gray directly, its buffer isn't ours
+        except Exception as e:
+            self._fail(str(e))
+            return None
+
+        self.scheduler.update(result is not None and result.changed, video=self.paused_for_video)
+        duration = time.perf_counter() - started
+        self.metrics.record("tick", duration, started)
+        self.next_delay = self.scheduler.delay(duration)
+        self._notify(self.on_stats, self.compare_summary())
+        return result
+
+    def process(self, screenshot, screenshot_gray):
+        """Runs detection on one frame. Returns the CompareResult, or None when nothing was compared."""
+        self.last_revisit = None
+        # 1. Check for Video FIRST, every frame feeds the detector even while paused
+        if self.video_detection:
+            was_paused = self.paused_for_video
+            with self.metrics.span("video"):
+                self.video_detector.add_frame(screenshot_gray)
+                video_playing = self.is_video_playing()
+            if video_playing:
+                self.metrics.increment("video_ticks")
+                if not was_paused:
+                    self.metrics.increment("video_pauses")
+                self._notify(self.on_video_paused)
+                return None  # Exit if video is playing
+
+            # 2. If we WERE paused (but are no longer), report the resume.
+            if was_paused:
+                self._notify(self.on_video_resumed)
+
+        # 3. Proceed with screenshot comparison (if not paused for video)
+        result = None
+        if self.previous_screenshot is not None and self.previous_screenshot.shape != screenshot_gray.shape:
+            # The captured window was resized: nothing to compare against, save the new layout
+            result = CompareResult(True, 0.0, screenshot_gray.size, 1)
+            self._record_change(screenshot, screenshot_gray, result, self.sensitivity)
+        elif self.previous_screenshot is not None:
+            # --- Fingerprint Prefilter ---
+            with self.metrics.span("prefilter"):
+                unchanged = self.comparator.is_unchanged(self.previous_screenshot, screenshot_gray)
+            if unchanged:
+                self.metrics.increment("skipped")
+                return None  # Identical frame, previous_screenshot stays valid
+
+            # --- Adaptive Sensitivity Logic ---
+            if self.adaptive_sensitivity:
+                with self.metrics.span("sensitivity"):
+                    current_sensitivity = self._calculate_adaptive_sensitivity(screenshot_gray)
+                self._notify(self.on_sensitivity, current_sensitivity)
+            else:
+                current_sensitivity = self.sensitivity  # Use the user-set value
+
+            # --- SSIM Comparison ---
+            with self.metrics.span("compare"):
+                result = self.comparator.compare(self.previous_screenshot, screenshot_gray,
+                                                 current_sensitivity, self.min_diff_pixels)
+
+            # ---  Change Detection Decision ---
+            if result.changed:
+                self._record_change(screenshot, screenshot_gray, result, current_sensitivity)
+
+        self.previous_screenshot = screenshot_gray
+        return result
+
+    def _record_change(self, screenshot, screenshot_gray, result, sensitivity):
+        """Saves a changed frame, or records it as a revisit of a slide saved earlier."""
+        now = self.clock()
+        self.metrics.increment("changes")
+        store = None
+        if self.dedup:
+            with self.metrics.span("dedup"):
+                store = self._hash_store(now)
+                value = dhash(screenshot_gray)
+                match = store.find(value, lambda path: self._same_slide(path, screenshot_gray, sensitivity))
+            if match is not None:
+                store.record_revisit(match, now)
+                self.last_revisit = match
+                self.metrics.increment("revisits")
+                self._notify(self.on_revisit, match)
+                return
+
+        if self.save_captures:
+            with self.metrics.span("submit"):  # Only waits with the "block" writer policy
+                filepath = self.writer.submit(screenshot, self.capture_path(now), result.region)
+            if store is not None:
+                self._pending_hashes[filepath] = (store, value)
+        elif store is not None:
+            # Nothing is written, remember the frame in memory
+            key = f"frame@{now:.3f}"
+            self._memory_frames[key] = cv2.imencode(".png", screenshot_gray)[1]
+            store.add(value, key)
+
+    def _same_slide(self, path, screenshot_gray, sensitivity):
+        """Returns True when the slide saved as path compares as unchanged with the frame.
+
+        Slides sharing a layout often hash only a bit or two apart, so a hash
+        match is only a candidate until the pixels agree as well.
+        """
+        encoded = self._memory_frames.get(path)
+        if encoded is not None:
+            saved = cv2.imdecode(encoded, cv2.IMREAD_GRAYSCALE)
+        else:
+            saved = read_capture(path)
+            if saved is not None:
+                saved = cv2.cvtColor(saved, cv2.COLOR_BGR2GRAY)
+        if saved is None or saved.shape != screenshot_gray.shape:
+            return False
+        return not self.comparator.compare(saved, screenshot_gray, sensitivity, self.min_diff_pixels).changed
+
+    def _hash_store(self, timestamp):
+        if not self.save_captures:
+            if self.hash_store is None:
+                self.hash_store = SlideHashStore(None, self.dedup_distance)
+            return self.hash_store
+        folder = self.date_folder(timestamp)
+        if self.hash_store is None or self.hash_store.folder != folder:
+            self.hash_store = SlideHashStore(folder, self.dedup_distance)  # New day, new folder
+        return self.hash_store
+
+    def date_folder(self, timestamp=None):
+        """Returns (and creates) the date folder for a capture taken at timestamp."""
+        now = datetime.fromtimestamp(self.clock() if timestamp is None else timestamp)
+        folder = os.path.join(self.output_folder, now.strftime("%Y.%m.%d"))
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    def capture_path(self, timestamp=None):
+        """Returns the path, without extension, for a capture taken at timestamp (default now)."""
+        timestamp = self.clock() if timestamp is None else timestamp
+        now = datetime.fromtimestamp(timestamp)
+        return os.path.join(self.date_folder(timestamp), f'screenshot_{now.strftime("%Y%m%d_%H%M%S")}')
+
+    def is_video_playing(self):
+        current_time = self.clock()
+        if current_time - self.last_video_check_time < self.video_check_interval:
+            return self.paused_for_video  # Use existing state if within interval
+
+        self.last_video_check_time = current_time
+
+        try:
+            # Decided from the frames the capture loop already took, no extra grabs
+            self.paused_for_video = self.video_detector.is_video()
+            return self.paused_for_video
+
+        except Exception as e:
+            print(f"Error in video detection: {e}")
+            return False  # Assume no video, continue checking
+
+    def _calculate_adaptive_sensitivity(self, image):
+        """Calculates an adaptive sensitivity based on image content."""
+        # Convert the image to grayscale if it's not already
+        if len(image.shape) == 3:  # Check if it's a color image (3 channels)
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        else:
+            gray = image  # Already grayscale
+
+        # Calculate the standard deviation of the pixel intensities (no float copy of the frame)
+        std_dev = float(cv2.meanStdDev(gray)[1][0, 0])
+
+        adaptive_sensitivity = max(0.001, min(0.05, 0.03 - (std_dev / 255) * 0.02 )) # scale and clamp
+
+        return adaptive_sensitivity
+
+    def compare_summary(self):
+        """Returns the comparator, writer and scheduler counters."""
+        return {
+            "hit_rates": self.comparator.hit_rates(),
+            "prefilter_checks": self.comparator.prefilter_checks,
+            "prefilter_skips": self.comparator.prefilter_skips,
+            "skip_ratio": self.comparator.skip_ratio(),
+            "written": self.writer.written,
+            "dropped": self.writer.dropped,
+            "coalesced": self.writer.coalesced,
+            "interval": self.scheduler.current,
+            "overruns": self.scheduler.overruns,
+            "skipped_ticks": self.scheduler.skipped,
+            "revisits": self.hash_store.revisits if self.hash_store is not None else 0,
+            "buffer_allocations": self.comparator.pool.allocations,
+            "buffer_bytes": self.comparator.pool.nbytes(),
+            "parallel_compares": getattr(self.comparator, "parallel_compares", 0),
+        }
+
+    @staticmethod
+    def _notify(callback, *args):
+        if callback is not None:
+            callback(*args)
+
+    def _saved(self, filepath, region):
+        pending = self._pending_hashes.pop(filepath, None)
+        if pending is not None:
+            store, value = pending
+            store.add(value, filepath)
+        self.metrics.increment("saved")
+        self._notify(self.on_saved, filepath, region)
+        if self.retention is not None:
+            self.retention.request()
+
+    def _dropped(self, filepath, region):
+        self._pending_hashes.pop(filepath, None)  # Never written, so never a revisit target
+
+    def _write_error(self, message):
+        self._fail(message)
+
+    def _fail(self, message):
+        self.metrics.increment("errors")
+        self.stop()
+        self._notify(self.on_error, message)
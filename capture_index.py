@@ -0,0 +1,250 @@
+"""Persistent SQLite index of the captures in a Slide Snap output folder.
+
+The index lives in the output folder itself and records the path, capture
+time, size and dimensions of every screenshot, so history queries don't
+have to walk the date folders. New captures are added incrementally;
+reconcile() brings the index back in line with files that were added,
+changed or removed behind the application's back. The keyframes of delta
+captures (see delta_store.py) are kept in a table of their own: they are
+not captures, but count towards the disk usage.
+"""
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from delta_store import KEYFRAME_FOLDER, capture_size, is_delta, keyframe_of
+from image_writer import CAPTURE_EXTENSIONS
+
+CAPTURE_NAME_FORMAT = "screenshot_%Y%m%d_%H%M%S"
+
+
+def parse_capture_name(filename):
+    """Returns the capture time encoded in a screenshot filename, or None."""
+    stem, extension = os.path.splitext(os.path.basename(filename))
+    if extension not in CAPTURE_EXTENSIONS:
+        return None
+    try:
+        return datetime.strptime(stem, CAPTURE_NAME_FORMAT)
+    except ValueError:
+        return None
+
+
+def image_dimensions(filepath):
+    """Reads (width, height) from the image header, or (None, None)."""
+    if is_delta(filepath):
+        return capture_size(filepath)
+    try:
+        from PIL import Image
+        with Image.open(filepath) as image:  # Only parses the header
+            return image.size
+    except Exception:
+        return None, None
+
+
+class CaptureIndex:
+    """Index of the captures under one output folder.
+
+    Paths are stored relative to the output folder and returned absolute.
+    The connection is shared between threads behind a lock, so the GUI can
+    query while reconcile() runs in the background.
+    """
+    FILENAME = ".slide_snap_index.sqlite3"
+
+    def __init__(self, base_output_path):
+        self.base_output_path = base_output_path
+        self.db_path = os.path.join(base_output_path, self.FILENAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS captures (
+                    path TEXT PRIMARY KEY,
+                    timestamp REAL NOT NULL,
+                    date TEXT NOT NULL,
+                    hour TEXT NOT NULL,
+                    size INTEGER,
+                    width INTEGER,
+                    height INTEGER,
+                    mtime REAL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS captures_by_time ON captures (date, hour, timestamp)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS captures_by_age ON captures (timestamp)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS keyframes (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER,
+                    mtime REAL
+                )
+            """)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _relative(self, filepath):
+        return os.path.relpath(filepath, self.base_output_path).replace(os.sep, "/")
+
+    def _absolute(self, relative_path):
+        return os.path.join(self.base_output_path, *relative_path.split("/"))
+
+    def _row(self, filepath, width=None, height=None):
+        dt = parse_capture_name(filepath)
+        if dt is None:
+            return None
+        stat = os.stat(filepath)
+        if width is None or height is None:
+            width, height = image_dimensions(filepath)
+        return (self._relative(filepath), dt.timestamp(), dt.strftime("%Y.%m.%d"), dt.strftime("%H"),
+                stat.st_size, width, height, stat.st_mtime)
+
+    def add(self, filepath, width=None, height=None):
+        """Adds or updates one capture. Returns False for non-capture files."""
+        try:
+            row = self._row(filepath, width, height)
+        except OSError as e:
+            print(f"Could not index {filepath}: {e}")
+            return False
+        if row is None:
+            return False
+        keyframe = None
+        if is_delta(filepath):
+            keyframe_path = keyframe_of(filepath)
+            try:
+                keyframe = self._keyframe_row(keyframe_path) if keyframe_path is not None else None
+            except OSError as e:
+                print(f"Could not index keyframe {keyframe_path}: {e}")
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO captures VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+            if keyframe is not None:
+                self._conn.execute("INSERT OR REPLACE INTO keyframes VALUES (?, ?, ?)", keyframe)
+        return True
+
+    def _keyframe_row(self, filepath):
+        stat = os.stat(filepath)
+        return self._relative(filepath), stat.st_size, stat.st_mtime
+
+    def remove(self, filepath):
+        """Removes a capture, or a keyframe, from the index."""
+        relative_path = self._relative(filepath)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM captures WHERE path = ?", (relative_path,))
+            self._conn.execute("DELETE FROM keyframes WHERE path = ?", (relative_path,))
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def count(self):
+        return self._query("SELECT COUNT(*) FROM captures")[0][0]
+
+    def usage(self):
+        """Returns (captures, total bytes) as recorded in the index. The bytes include keyframes."""
+        count, total = self._query("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM captures")[0]
+        keyframe_bytes = self._query("SELECT COALESCE(SUM(size), 0) FROM keyframes")[0][0]
+        return count, total + keyframe_bytes
+
+    def oldest(self, limit, before=None, date=None):
+        """Returns up to limit (absolute path, size) pairs, oldest capture first.
+
+        before (seconds since the epoch) and date (YYYY.MM.DD) narrow the
+        captures considered.
+        """
+        conditions, params = [], []
+        if before is not None:
+            conditions.append("timestamp < ?")
+            params.append(before)
+        if date is not None:
+            conditions.append("date = ?")
+            params.append(date)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        rows = self._query(f"SELECT path, COALESCE(size, 0) FROM captures {where}"
+                           "ORDER BY timestamp, path LIMIT ?", (*params, limit))
+        return [(self._absolute(path), size) for path, size in rows]
+
+    def crowded_dates(self, max_files):
+        """Returns {date: count} of the dates with more than max_files captures."""
+        return dict(self._query("SELECT date, COUNT(*) FROM captures GROUP BY date HAVING COUNT(*) > ?",
+                                (max_files,)))
+
+    def dates(self):
+        """Returns the capture dates (YYYY.MM.DD), newest first."""
+        return [row[0] for row in self._query("SELECT DISTINCT date FROM captures ORDER BY date DESC")]
+
+    def hours(self, date):
+        """Returns the hours (HH) with captures on a date, newest first."""
+        return [row[0] for row in self._query(
+            "SELECT DISTINCT hour FROM captures WHERE date = ? ORDER BY hour DESC", (date,))]
+
+    def files(self, date, hour=None):
+        """Returns the absolute paths captured on a date (and hour), newest first."""
+        if hour is None:
+            rows = self._query("SELECT path FROM captures WHERE date = ? ORDER BY timestamp DESC, path DESC",
+                               (date,))
+        else:
+            rows = self._query("SELECT path FROM captures WHERE date = ? AND hour = ? "
+                               "ORDER BY timestamp DESC, path DESC", (date, hour))
+        return [self._absolute(row[0]) for row in rows]
+
+    def grouped(self):
+        """Returns {date: {hour: [path, ...]}} for every capture, newest first."""
+        groups = {}
+        for path, date, hour in self._query(
+                "SELECT path, date, hour FROM captures ORDER BY date DESC, hour DESC, timestamp DESC, path DESC"):
+            groups.setdefault(date, {}).setdefault(hour, []).append(self._absolute(path))
+        return groups
+
+    def reconcile(self):
+        """Syncs the index with the files on disk. Returns (added, removed).
+
+        Only files whose size or modification time changed are re-read, so a
+        reconcile of an unchanged archive costs one stat per file.
+        """
+        with self._lock:
+            known = {path: (size, mtime) for path, size, mtime in
+                     self._conn.execute("SELECT path, size, mtime FROM captures")}
+            known_keyframes = {path: (size, mtime) for path, size, mtime in
+                               self._conn.execute("SELECT path, size, mtime FROM keyframes")}
+
+        updates = []
+        keyframe_updates = []
+        seen = set()
+        for date_folder in os.listdir(self.base_output_path):
+            date_path = os.path.join(self.base_output_path, date_folder)
+            if not os.path.isdir(date_path):
+                continue
+            for entry in os.scandir(date_path):
+                if not entry.is_file() or parse_capture_name(entry.name) is None:
+                    continue
+                relative_path = self._relative(entry.path)
+                seen.add(relative_path)
+                stat = entry.stat()
+                if known.get(relative_path) != (stat.st_size, stat.st_mtime):
+                    try:
+                        updates.append(self._row(entry.path))
+                    except OSError:
+                        continue  # Vanished while scanning
+
+            keyframe_folder = os.path.join(date_path, KEYFRAME_FOLDER)
+            if not os.path.isdir(keyframe_folder):
+                continue
+            for entry in os.scandir(keyframe_folder):
+                if not entry.is_file() or entry.name.endswith(".part"):
+                    continue
+                relative_path = self._relative(entry.path)
+                seen.add(relative_path)
+                stat = entry.stat()
+                if known_keyframes.get(relative_path) != (stat.st_size, stat.st_mtime):
+                    keyframe_updates.append((relative_path, stat.st_size, stat.st_mtime))
+
+        removed = [(path,) for path in known if path not in seen]
+        removed_keyframes = [(path,) for path in known_keyframes if path not in seen]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO captures VALUES (?, ?, ?, ?, ?, ?, ?, ?)", updates)
+            self._conn.executemany("DELETE FROM captures WHERE path = ?", removed)
+            self._conn.executemany("INSERT OR REPLACE INTO keyframes VALUES (?, ?, ?)", keyframe_updates)
+            self._conn.executemany("DELETE FROM keyframes WHERE path = ?", removed_keyframes)
+        return len(updates), len(removed)
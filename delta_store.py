@@ -0,0 +1,279 @@
+"""Keyframe plus delta storage of captures.
+
+    python slide_snap.py --headless --delta-storage
+
+When a slide build adds one bullet, nearly all of the new capture matches
+the one before. In delta mode the ImageWriter stores full frames only as
+keyframes, and every capture as a small delta file holding just the
+rectangles that differ from its keyframe:
+
+    2024.05.02/screenshot_20240502_101500.sdelta    # One per capture
+    2024.05.02/.keyframes/screenshot_20240502_101500.png
+
+A .sdelta file is MAGIC, one JSON line {"keyframe", "width", "height",
+"patches": [[x, y, width, height, length], ...]} and the patches, encoded
+in the capture format, back to back. The changed rectangles come from an
+exact pixel comparison with the keyframe, merged on a TILE grid, so the
+reconstruction is lossless with PNG and WebP. The comparator's SSIM diff
+map is deliberately not used: it is thresholded and taken against the
+previous frame rather than the keyframe, so its boxes can miss changes. A new keyframe is written
+for the first capture of a session or date folder, after a resolution
+change, and once more than keyframe_ratio of the tiles differ from it.
+
+Each delta depends on its keyframe only, never on other deltas, so
+captures can be deleted in any order; release_keyframe() removes a
+keyframe once no capture uses it. keyframe_of() names a delta's keyframe,
+so the capture index can count keyframes towards the disk usage. read_capture() returns any capture,
+delta or plain image, as a full frame.
+"""
+import bisect
+import functools
+import json
+import os
+import tempfile
+import threading
+
+MAGIC = b"SLIDESNAP-DELTA 1\n"
+DELTA_EXTENSION = ".sdelta"
+KEYFRAME_FOLDER = ".keyframes"
+TILE = 32  # Pixels per side of the grid changes are merged on
+KEYFRAME_RATIO = 0.5  # Changed tile fraction from which a new keyframe is cheaper
+
+_active_keyframes = set()  # Keyframes writers are still adding deltas to
+_active_lock = threading.Lock()
+
+
+def is_delta(path):
+    return path.endswith(DELTA_EXTENSION)
+
+
+def changed_rects(keyframe, image, tile=TILE):
+    """Returns the (x, y, width, height) rectangles covering every pixel that differs, and the changed tile fraction.
+
+    Rows of changed tiles are merged into runs, and runs spanning the same
+    columns in consecutive tile rows into one rectangle.
+    """
+    import cv2
+    import numpy as np
+
+    diff = cv2.absdiff(keyframe, image)
+    if diff.ndim == 3:
+        diff = diff.max(axis=2)
+    height, width = diff.shape
+    tiles = np.maximum.reduceat(np.maximum.reduceat(diff, np.arange(0, height, tile), axis=0),
+                                np.arange(0, width, tile), axis=1) > 0
+    rows = tiles.shape[0]
+
+    rects = []
+    active = {}  # (first column, end column) -> first tile row with that run
+    for row in range(rows + 1):
+        runs = set()
+        if row < rows:
+            edges = np.flatnonzero(np.diff(np.concatenate(([0], tiles[row].view(np.int8), [0]))))
+            runs = set(zip(edges[0::2].tolist(), edges[1::2].tolist()))
+        for run in [run for run in active if run not in runs]:
+            rects.append((run, active.pop(run), row))
+        for run in runs:
+            active.setdefault(run, row)
+
+    boxes = []
+    for (c0, c1), r0, r1 in rects:
+        x, y = c0 * tile, r0 * tile
+        boxes.append((x, y, min(width, c1 * tile) - x, min(height, r1 * tile) - y))
+    return boxes, float(tiles.mean())
+
+
+def pack(keyframe_name, shape, patches):
+    """Returns the bytes of a delta file for [((x, y, width, height), encoded bytes), ...]."""
+    header = {"keyframe": keyframe_name, "width": shape[1], "height": shape[0],
+              "patches": [[*rect, len(data)] for rect, data in patches]}
+    return b"".join([MAGIC, json.dumps(header).encode("utf-8"), b"\n"] + [data for _, data in patches])
+
+
+def unpack(data):
+    """Returns (header, offset of the first patch) of a delta file's bytes."""
+    if not data.startswith(MAGIC):
+        raise ValueError("Not a delta capture")
+    end = data.index(b"\n", len(MAGIC))
+    return json.loads(data[len(MAGIC):end]), end + 1
+
+
+class DeltaEncoder:
+    """Turns frames into keyframes and deltas. Used from the ImageWriter's thread only."""
+
+    def __init__(self, keyframe_ratio=KEYFRAME_RATIO, tile=TILE):
+        self.keyframe_ratio = keyframe_ratio
+        self.tile = tile
+        self.keyframe = None  # Frame the deltas are taken against
+        self.keyframe_path = None
+
+    def encode(self, image, filepath, extension, params):
+        """Returns the (path, bytes) to write, in order, for a capture saved as filepath.
+
+        The first is a new keyframe when one is needed. Call reset() if
+        writing them fails.
+        """
+        import cv2
+
+        folder = os.path.dirname(filepath)
+        writes = []
+        rects = None
+        if (self.keyframe is not None and self.keyframe.shape == image.shape
+                and os.path.dirname(os.path.dirname(self.keyframe_path)) == folder):
+            rects, ratio = changed_rects(self.keyframe, image, self.tile)
+            if ratio > self.keyframe_ratio:
+                rects = None
+        if rects is None:
+            ok, encoded = cv2.imencode(extension, image, params)
+            if not ok:
+                raise IOError(f"Could not encode keyframe for {os.path.basename(filepath)}")
+            stem = os.path.splitext(os.path.basename(filepath))[0]
+            self.reset()
+            self.keyframe = image
+            self.keyframe_path = os.path.join(folder, KEYFRAME_FOLDER, stem + extension)
+            with _active_lock:
+                _active_keyframes.add(self.keyframe_path)
+            writes.append((self.keyframe_path, encoded.tobytes()))
+            rects = []
+
+        patches = []
+        for x, y, width, height in rects:
+            ok, encoded = cv2.imencode(extension, image[y:y + height, x:x + width], params)
+            if not ok:
+                raise IOError(f"Could not encode {os.path.basename(filepath)}")
+            patches.append(((x, y, width, height), encoded.tobytes()))
+        writes.append((filepath, pack(os.path.basename(self.keyframe_path), image.shape, patches)))
+        return writes
+
+    def reset(self):
+        """Forgets the keyframe, the next capture starts a new one."""
+        if self.keyframe_path is not None:
+            with _active_lock:
+                _active_keyframes.discard(self.keyframe_path)
+        self.keyframe = self.keyframe_path = None
+
+
+@functools.lru_cache(maxsize=2)
+def _keyframe(path, mtime_ns):
+    """Decoded keyframe, cached: consecutive captures usually share one."""
+    import cv2
+
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise IOError(f"Could not read keyframe {path}")
+    image.flags.writeable = False  # Shared between callers, they paste onto a copy
+    return image
+
+
+def read_capture(path):
+    """Returns a capture as a BGR image, rebuilding delta captures. None if it can't be read, like cv2.imread."""
+    import cv2
+    import numpy as np
+
+    if not is_delta(path):
+        return cv2.imread(path, cv2.IMREAD_COLOR)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()  # Deltas are small
+        header, offset = unpack(data)
+        keyframe_path = os.path.join(os.path.dirname(path), KEYFRAME_FOLDER, header["keyframe"])
+        image = _keyframe(keyframe_path, os.stat(keyframe_path).st_mtime_ns).copy()
+        for x, y, width, height, length in header["patches"]:
+            patch = cv2.imdecode(np.frombuffer(data, np.uint8, length, offset), cv2.IMREAD_COLOR)
+            if patch is None:
+                raise ValueError(f"Damaged patch at {x},{y}")
+            image[y:y + height, x:x + width] = patch
+            offset += length
+        return image
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Could not read {path}: {e}")
+        return None
+
+
+def read_header(path):
+    """Returns the header of a delta capture without reading its patches, or None."""
+    try:
+        with open(path, "rb") as f:
+            header, _ = unpack(f.readline() + f.readline())
+        return header
+    except (OSError, ValueError):
+        return None
+
+
+def capture_size(path):
+    """Returns (width, height) of a delta capture from its header, or (None, None)."""
+    header = read_header(path)
+    if header is None or "width" not in header or "height" not in header:
+        return None, None
+    return header["width"], header["height"]
+
+
+def keyframe_of(path):
+    """Returns the path of the keyframe a delta capture is rebuilt from, or None."""
+    header = read_header(path)
+    if header is None or "keyframe" not in header:
+        return None
+    return os.path.join(os.path.dirname(path), KEYFRAME_FOLDER, header["keyframe"])
+
+
+def materialize(path):
+    """Returns the path of a plain image of a capture, for other programs.
+
+    Delta captures are rebuilt into a PNG in the temporary folder, reused
+    while it is newer than the capture. Other captures are returned as is.
+    """
+    if not is_delta(path):
+        return path
+    import cv2
+
+    folder = os.path.join(tempfile.gettempdir(), "slide_snap")
+    output_path = os.path.join(folder, os.path.splitext(os.path.basename(path))[0] + ".png")
+    if os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(path):
+        return output_path
+    image = read_capture(path)
+    if image is None:
+        raise IOError(f"Could not rebuild {os.path.basename(path)}")
+    os.makedirs(folder, exist_ok=True)
+    if not cv2.imwrite(output_path, image):
+        raise IOError(f"Could not write {output_path}")
+    return output_path
+
+
+def release_keyframe(delta_path):
+    """Deletes the keyframe of a removed delta capture once no other capture uses it.
+
+    Returns (keyframe path, bytes freed) if it was deleted, otherwise None.
+
+    Deltas always refer to the newest keyframe of their folder when they
+    are written, so a keyframe is used by the deltas from its own capture
+    time up to the next keyframe. Keyframes a writer still adds to are kept.
+    """
+    folder = os.path.dirname(delta_path)
+    keyframe_folder = os.path.join(folder, KEYFRAME_FOLDER)
+    try:
+        keyframes = sorted(name for name in os.listdir(keyframe_folder) if not name.endswith(".part"))
+    except FileNotFoundError:
+        return None
+    stems = [os.path.splitext(name)[0] for name in keyframes]
+    stem = os.path.splitext(os.path.basename(delta_path))[0]
+    position = bisect.bisect_right(stems, stem) - 1
+    if position < 0:
+        return None
+    keyframe_path = os.path.join(keyframe_folder, keyframes[position])
+    with _active_lock:
+        if keyframe_path in _active_keyframes:
+            return None
+    low = stems[position]
+    high = stems[position + 1] if position + 1 < len(stems) else None
+    for name in os.listdir(folder):
+        if name.endswith(DELTA_EXTENSION):
+            user = name[:-len(DELTA_EXTENSION)]
+            if user >= low and (high is None or user < high):
+                return None
+    try:
+        size = os.path.getsize(keyframe_path)
+        os.remove(keyframe_path)
+    except OSError as e:
+        print(f"Could not remove keyframe {keyframe_path}: {e}")
+        return None
+    return keyframe_path, size
@@ -0,0 +1,232 @@
+"""Background encoding and writing of captured frames for Slide Snap.
+
+Frames are handed to an ImageWriter, which encodes and writes them on its
+own thread through a bounded queue, so a burst of slide changes never stalls
+detection or the GUI. Files are written to a temporary name, flushed to disk
+and renamed into place before the saved callback fires, so consumers only
+ever see complete files.
+"""
+import collections
+import errno
+import os
+import threading
+import time
+
+from delta_store import DELTA_EXTENSION, DeltaEncoder
+
+# name -> (file extension, OpenCV parameter name, default level, valid level range).
+# OpenCV itself is only imported to encode, the GUI and the capture index
+# use this module for the extensions at startup.
+FORMATS = {
+    "png": (".png", "IMWRITE_PNG_COMPRESSION", 3, (0, 9)),
+    "webp": (".webp", "IMWRITE_WEBP_QUALITY", 101, (1, 101)),  # Quality above 100 is lossless
+    "jpeg": (".jpg", "IMWRITE_JPEG_QUALITY", 95, (0, 100)),
+}
+IMAGE_EXTENSIONS = tuple(extension for extension, _, _, _ in FORMATS.values())
+CAPTURE_EXTENSIONS = IMAGE_EXTENSIONS + (DELTA_EXTENSION,)  # Captures may also be deltas, see delta_store.py
+
+POLICIES = ("block", "drop_oldest", "coalesce")
+
+
+def encode_params(image_format, level=None):
+    """Returns the file extension and cv2.imencode parameters for a format."""
+    if image_format not in FORMATS:
+        raise ValueError(f"Unknown image format: {image_format}")
+    import cv2
+    extension, param, default_level, (low, high) = FORMATS[image_format]
+    level = default_level if level is None else max(low, min(high, int(level)))
+    return extension, [getattr(cv2, param), level]
+
+
+def write_atomic(filepath, data, times_ns=None):
+    """Writes bytes to filepath through a temporary file and a rename.
+
+    times_ns, an (atime, mtime) pair in nanoseconds, is set on the file
+    before it is renamed into place.
+    """
+    temp_path = filepath + ".part"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    if times_ns is not None:
+        os.utime(temp_path, ns=times_ns)
+    os.replace(temp_path, filepath)
+    if hasattr(os, "O_DIRECTORY"):  # Make the rename itself durable (POSIX only)
+        fd = os.open(os.path.dirname(filepath) or ".", os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class ImageWriter:
+    """Encodes and writes frames on a background thread.
+
+    At most max_pending frames wait in the queue. When it is full, submit()
+    applies the backpressure policy:
+
+    * "block" (the default) waits until the writer has made room, so no
+      capture is ever lost,
+    * "drop_oldest" discards the oldest frame still waiting,
+    * "coalesce" replaces the newest waiting frame, so a burst of changes
+      collapses into its final state.
+
+    on_saved(filepath, metadata) is called from the writer thread once the
+    file is on disk, on_error(message) when encoding or writing fails.
+    on_dropped(filepath, metadata) is called for every frame discarded
+    before it was written, from the thread that discarded it. With
+    a metrics.Metrics, encoding and writing are timed as the "encode" and
+    "write" stages and discarded frames are counted.
+
+    make_room(nbytes), e.g. RetentionManager.make_room, is called with the
+    size of each encoded file before it is written, to free disk space. If
+    the disk is full anyway, it is called once more and the write retried.
+
+    With delta on, frames are stored as keyframes plus .sdelta files of the
+    rectangles that changed (see delta_store.py), and the paths returned by
+    submit() and passed to on_saved end in .sdelta.
+    """
+
+    def __init__(self, image_format="png", level=None, max_pending=4, policy="block",
+                 on_saved=None, on_error=None, metrics=None, make_room=None, delta=False, on_dropped=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.image_format = image_format
+        self.level = level
+        self.max_pending = max(1, max_pending)
+        self.policy = policy
+        self.on_saved = on_saved
+        self.on_error = on_error
+        self.on_dropped = on_dropped
+        self.metrics = metrics
+        self.make_room = make_room
+        self.delta = DeltaEncoder() if delta else None
+
+        self.written = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+        self._pending = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="slide-snap-writer", daemon=True)
+        self._thread.start()
+
+    def extension(self):
+        return encode_params(self.image_format, self.level)[0]
+
+    def submit(self, image, path_stem, metadata=None):
+        """Queues a BGR(A) frame to be written as path_stem + the format's extension.
+
+        Returns the final file path.
+        """
+        extension, params = encode_params(self.image_format, self.level)
+        filepath = path_stem + (DELTA_EXTENSION if self.delta is not None else extension)
+        item = (image, filepath, extension, params, metadata)
+        discarded = None
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("ImageWriter is closed")
+            if len(self._pending) >= self.max_pending:
+                if self.policy == "block":
+                    while len(self._pending) >= self.max_pending and not self._closed:
+                        self._condition.wait()
+                    if self._closed:
+                        raise RuntimeError("ImageWriter is closed")
+                elif self.policy == "drop_oldest":
+                    discarded = self._pending.popleft()
+                    self.dropped += 1
+                    self._count("dropped")
+                else:
+                    discarded = self._pending.pop()
+                    self.coalesced += 1
+                    self._count("coalesced")
+            self._pending.append(item)
+            self._condition.notify_all()
+        if discarded is not None:
+            self._discard([discarded])
+        return filepath
+
+    def pending(self):
+        with self._condition:
+            return len(self._pending)
+
+    def close(self, wait=True):
+        """Stops the writer. With wait=True, frames already queued are written first."""
+        discarded = []
+        with self._condition:
+            self._closed = True
+            if not wait:
+                discarded = list(self._pending)
+                self._pending.clear()
+            self._condition.notify_all()
+        self._discard(discarded)
+        if wait:
+            self._thread.join()
+
+    def _write(self, filepath, data):
+        if self.make_room is None:
+            write_atomic(filepath, data)
+            return
+        self.make_room(len(data))
+        try:
+            write_atomic(filepath, data)
+        except OSError as e:
+            if e.errno != errno.ENOSPC or not self.make_room(len(data) * 2):
+                raise
+            write_atomic(filepath, data)  # Space was freed, try once more
+
+    def _discard(self, items):
+        if self.on_dropped is not None:
+            for _, filepath, _, _, metadata in items:
+                self.on_dropped(filepath, metadata)
+
+    def _count(self, counter):
+        if self.metrics is not None:
+            self.metrics.increment(counter)
+
+    def _run(self):
+        import cv2
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    if self.delta is not None:
+                        self.delta.reset()  # Its last keyframe may be released now
+                    return  # Closed and drained
+                image, filepath, extension, params, metadata = self._pending.popleft()
+                self._condition.notify_all()  # Wake a blocked submit()
+
+            try:
+                started = time.perf_counter()
+                if image.ndim == 3 and image.shape[2] == 4:
+                    image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+                if self.delta is not None:
+                    writes = self.delta.encode(image, filepath, extension, params)
+                    self._count("keyframes" if len(writes) > 1 else "deltas")
+                else:
+                    ok, encoded = cv2.imencode(extension, image, params)
+                    if not ok:
+                        raise IOError(f"Could not encode {os.path.basename(filepath)}")
+                    writes = [(filepath, encoded.tobytes())]
+                encoded_at = time.perf_counter()
+                for path, data in writes:
+                    if path != filepath:
+                        os.makedirs(os.path.dirname(path), exist_ok=True)  # The keyframe folder
+                    self._write(path, data)
+                if self.metrics is not None:
+                    self.metrics.record("encode", encoded_at - started)
+                    self.metrics.record("write", time.perf_counter() - encoded_at)
+            except Exception as e:
+                if self.delta is not None:
+                    self.delta.reset()  # Don't refer later deltas to a keyframe that may be missing
+                if self.on_error is not None:
+                    self.on_error(str(e))
+                continue
+
+            self.written += 1
+            if self.on_saved is not None:
+                self.on_saved(filepath, metadata)
@@ -0,0 +1,208 @@
+"""Per-stage timings and event counters for Slide Snap.
+
+Every capture tick runs through a fixed set of stages (grab, grayscale,
+prefilter, SSIM, ...). The engine wraps each one in Metrics.span(), which
+keeps the duration in a window of recent samples per stage, and counts
+events (ticks, saves, skips, errors) with Metrics.increment(). snapshot()
+turns both into plain numbers for the GUI panel and the log, and
+MetricsExporter writes them to a JSON lines or Prometheus text file on a
+schedule so capture performance can be collected across machines.
+"""
+import collections
+import json
+import math
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+EXPORT_FORMATS = ("jsonl", "prometheus")
+
+
+def percentile(ordered, fraction):
+    """Returns the nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = min(len(ordered), max(1, math.ceil(fraction * len(ordered)))) - 1
+    return ordered[rank]
+
+
+class StageStats:
+    """Durations of one stage: all-time count, sum and max, plus recent samples for percentiles."""
+
+    def __init__(self, window):
+        self.samples = collections.deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        return {
+            "count": self.count,
+            "total": self.total,
+            "p50": percentile(ordered, 0.50),
+            "p95": percentile(ordered, 0.95),
+            "max": self.max,
+        }
+
+
+class _Span:
+    __slots__ = ("metrics", "stage", "started")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.stage, time.perf_counter() - self.started, self.started)
+        return False
+
+
+class Metrics:
+    """Thread-safe stage timings and counters.
+
+    Percentiles are taken over the last window samples of each stage, so
+    they follow the current workload; count, sum and max cover the whole
+    session. Stages and counters appear the first time they are used.
+
+    While tracer is set (see profiling.Profiler), every span and increment
+    is also handed to it as a trace event.
+    """
+
+    def __init__(self, window=512):
+        self.window = window
+        self.started = time.time()
+        self._stages = {}  # Stage name -> StageStats, in first-use order
+        self._counters = collections.Counter()
+        self._lock = threading.Lock()
+        self.tracer = None
+
+    def span(self, stage):
+        """Returns a context manager that records the time spent inside it as stage."""
+        return _Span(self, stage)
+
+    def record(self, stage, seconds, started=None):
+        """Adds a duration. started is its perf_counter() start, needed for tracing."""
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = StageStats(self.window)
+            stats.add(seconds)
+        tracer = self.tracer
+        if tracer is not None and started is not None:
+            tracer.span(stage, started, seconds)
+
+    def increment(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] += amount
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.instant(counter, amount)
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self._stages.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        """Returns {"uptime", "stages": {stage: {count, total, p50, p95, max}}, "counters"}, in seconds."""
+        with self._lock:
+            stages = {stage: stats.summary() for stage, stats in self._stages.items()}
+            counters = dict(self._counters)
+            uptime = time.time() - self.started
+        return {"uptime": uptime, "stages": stages, "counters": counters}
+
+
+def to_jsonl(snapshot):
+    """Returns one JSON line for a snapshot, tagged with the time and host."""
+    record = {"time": datetime.now().isoformat(timespec="seconds"), "host": socket.gethostname()}
+    record.update(snapshot)
+    return json.dumps(record) + "\n"
+
+
+def to_prometheus(snapshot, prefix="slide_snap"):
+    """Returns a snapshot in the Prometheus text exposition format."""
+    lines = [f"# HELP {prefix}_stage_seconds Time spent per capture stage.",
+             f"# TYPE {prefix}_stage_seconds summary"]
+    for stage, stats in snapshot["stages"].items():
+        label = f'stage="{stage}"'
+        lines.append(f'{prefix}_stage_seconds{{{label},quantile="0.5"}} {stats["p50"]:.6f}')
+        lines.append(f'{prefix}_stage_seconds{{{label},quantile="0.95"}} {stats["p95"]:.6f}')
+        lines.append(f"{prefix}_stage_seconds_sum{{{label}}} {stats['total']:.6f}")
+        lines.append(f"{prefix}_stage_seconds_count{{{label}}} {stats['count']}")
+    lines += [f"# HELP {prefix}_stage_max_seconds Slowest run of each capture stage.",
+              f"# TYPE {prefix}_stage_max_seconds gauge"]
+    for stage, stats in snapshot["stages"].items():
+        lines.append(f'{prefix}_stage_max_seconds{{stage="{stage}"}} {stats["max"]:.6f}')
+    lines += [f"# HELP {prefix}_events_total Capture events since start.",
+              f"# TYPE {prefix}_events_total counter"]
+    for counter, value in sorted(snapshot["counters"].items()):
+        lines.append(f'{prefix}_events_total{{event="{counter}"}} {value}')
+    lines += [f"# HELP {prefix}_uptime_seconds Seconds since capturing started.",
+              f"# TYPE {prefix}_uptime_seconds gauge",
+              f"{prefix}_uptime_seconds {snapshot['uptime']:.1f}"]
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """Writes Metrics snapshots to a file every interval seconds on a background thread.
+
+    "jsonl" appends one line per export, a time series of the session.
+    "prometheus" replaces the file each time, for node_exporter's textfile
+    collector; the file is renamed into place, so scrapers never read half
+    of it. A last export is written on close().
+    """
+
+    def __init__(self, metrics, path, export_format="jsonl", interval=60.0):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown metrics format: {export_format}")
+        self.metrics = metrics
+        self.path = path
+        self.export_format = export_format
+        self.interval = max(1.0, interval)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="slide-snap-metrics", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.export()
+
+    def export(self):
+        """Writes one snapshot now. Errors are printed, not raised."""
+        snapshot = self.metrics.snapshot()
+        try:
+            if self.export_format == "jsonl":
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(to_jsonl(snapshot))
+            else:
+                temp_path = self.path + ".part"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    f.write(to_prometheus(snapshot))
+                os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Could not export metrics: {e}")
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.export()
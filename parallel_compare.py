@@ -0,0 +1,193 @@
+"""Multi-process SSIM for very large frames.
+
+compare_ssim and its OpenCV counterpart run on one core. On multi-monitor
+and 8K captures a single full-resolution comparison can take longer than
+the capture interval. ParallelFrameComparator splits the comparison into
+horizontal bands and hands them to a persistent process pool:
+
+* Gray frames live in multiprocessing.shared_memory blocks. The capture
+  engine converts each grab straight into one (see new_frame()), so the
+  workers read the pixels in place and no frame is ever pickled.
+* Each band is extended by SSIM_WINDOW // 2 rows on both sides, so its SSIM
+  map is exactly the full-frame map on the band's own rows.
+* Workers return the band's SSIM sum and a 256-bin histogram of its diff
+  map. The sums give the same mean score as the single-process code, and
+  the merged histogram gives the same Otsu diff-pixel count.
+"""
+import collections
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from capture_engine import SSIM_WINDOW, BufferPool, FrameComparator, otsu_count, ssim
+
+# --- Worker process side ---
+_attached = collections.OrderedDict()  # Shared memory name -> SharedMemory, most recent last
+_worker_pool = BufferPool()
+
+
+def _attach(name):
+    block = _attached.get(name)
+    if block is None:
+        try:
+            block = shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+        except TypeError:
+            from multiprocessing import resource_tracker
+            # Workers started by multiprocessing inherit the capture process's tracker, where
+            # the block is already registered and unregistering would drop the creator's entry.
+            # Only a tracker of the worker's own would unlink the block when the worker exits.
+            own_tracker = resource_tracker._resource_tracker._fd is None
+            block = shared_memory.SharedMemory(name=name)
+            if own_tracker:
+                resource_tracker.unregister(block._name, "shared_memory")
+        _attached[name] = block
+        while len(_attached) > 8:  # Frames of old resolutions or scratch blocks
+            _attached.popitem(last=False)[1].close()
+    else:
+        _attached.move_to_end(name)
+    return block
+
+
+def _band_stats(previous_name, current_name, shape, y0, y1):
+    """Returns (SSIM sum, pixels summed, diff histogram) for rows y0:y1 of two shared frames."""
+    height, width = shape
+    pad = SSIM_WINDOW // 2
+    top, bottom = max(0, y0 - pad), min(height, y1 + pad)
+    previous = np.ndarray(shape, np.uint8, buffer=_attach(previous_name).buf)[top:bottom]
+    current = np.ndarray(shape, np.uint8, buffer=_attach(current_name).buf)[top:bottom]
+
+    _, ssim_map = ssim(previous, current, _worker_pool)
+    band = ssim_map[y0 - top:y1 - top]
+
+    # The score averages the map away from the frame's borders
+    r0, r1 = max(y0, pad), min(y1, height - pad)
+    total, count = 0.0, 0
+    if r1 > r0 and width > 2 * pad:
+        total = float(ssim_map[r0 - top:r1 - top, pad:width - pad].sum(dtype=np.float64))
+        count = (r1 - r0) * (width - 2 * pad)
+
+    scaled = _worker_pool.get("band.scaled", band.shape)
+    diff = _worker_pool.get("band.uint8", band.shape, np.uint8)
+    np.multiply(band, 255, out=scaled)
+    np.copyto(diff, scaled, casting="unsafe")  # Truncates like astype("uint8")
+    hist = cv2.calcHist([diff], [0], None, [256], [0, 256]).ravel().astype(np.int64)
+    return total, count, hist
+
+
+# --- Capture process side ---
+class SharedFrames:
+    """Gray frame buffers in shared memory, addressable by name from other processes."""
+
+    def __init__(self):
+        self._blocks = {}  # id(array) -> (SharedMemory, array)
+        self._scratch = {}  # (role, shape) -> (SharedMemory, array), for frames not allocated here
+        self._retired = []  # Unlinked blocks still referenced by a live array
+
+    def _create(self, shape):
+        block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape))))
+        return block, np.ndarray(shape, np.uint8, buffer=block.buf)
+
+    def allocate(self, shape):
+        """Returns a new uint8 array of shape backed by shared memory."""
+        self._retire(lambda array: array.shape != tuple(shape))
+        block, array = self._create(shape)
+        self._blocks[id(array)] = (block, array)
+        return array
+
+    def share(self, frame, role):
+        """Returns the shared memory name holding frame, copying it into a scratch block if needed."""
+        entry = self._blocks.get(id(frame))
+        if entry is not None and entry[1] is frame:
+            return entry[0].name
+        key = (role, frame.shape)
+        if key not in self._scratch:
+            self._scratch[key] = self._create(frame.shape)
+        block, array = self._scratch[key]
+        np.copyto(array, frame)
+        return block.name
+
+    def _retire(self, predicate):
+        for key, (block, array) in list(self._blocks.items()):
+            if predicate(array):
+                del self._blocks[key]
+                block.unlink()  # The name goes away now, the memory once nobody maps it
+                self._retired.append(block)
+        for key, (block, array) in list(self._scratch.items()):
+            if predicate(array):
+                del self._scratch[key]
+                block.unlink()
+                self._retired.append(block)
+        array = None  # Drop the loop's reference before closing
+        still_used = []
+        for block in self._retired:
+            try:
+                block.close()
+            except BufferError:  # The engine still holds a frame in this block
+                still_used.append(block)
+        self._retired = still_used
+
+    def collect(self):
+        """Frees retired blocks whose frames have been dropped since."""
+        self._retire(lambda array: False)
+
+    def close(self):
+        self._retire(lambda array: True)
+
+
+class ParallelFrameComparator(FrameComparator):
+    """FrameComparator that runs full-size SSIM in bands on a process pool.
+
+    Frames smaller than min_pixels (and the downscaled pyramid levels) are
+    compared in-process, where the pool's overhead would outweigh the gain.
+    workers defaults to the number of CPU cores.
+    """
+
+    def __init__(self, *args, workers=None, min_pixels=4_000_000, **kwargs):
+        super(ParallelFrameComparator, self).__init__(*args, **kwargs)
+        self.workers = workers or os.cpu_count() or 1
+        self.min_pixels = min_pixels
+        self.frames = SharedFrames()
+        self.parallel_compares = 0
+        self._executor = None  # Started on the first large comparison
+
+    def new_frame(self, shape):
+        return self.frames.allocate(shape)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.frames.close()
+
+    def _ssim(self, previous, current):
+        if self.workers < 2 or current.size < self.min_pixels:
+            return super(ParallelFrameComparator, self)._ssim(previous, current)
+        with self.metrics.span("ssim"):  # Bands are thresholded in the workers, there is no separate stage
+            return self._parallel_ssim(previous, current)
+
+    def _parallel_ssim(self, previous, current):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.frames.collect()
+
+        previous_name = self.frames.share(previous, "previous")
+        current_name = self.frames.share(current, "current")
+        height = current.shape[0]
+        bands = min(height, self.workers * 2)  # A few bands per worker evens out uneven content
+        bounds = [height * i // bands for i in range(bands + 1)]
+        futures = [self._executor.submit(_band_stats, previous_name, current_name, current.shape, y0, y1)
+                   for y0, y1 in zip(bounds, bounds[1:]) if y1 > y0]
+
+        total, count = 0.0, 0
+        hist = np.zeros(256, dtype=np.int64)
+        for future in futures:
+            band_total, band_count, band_hist = future.result()
+            total += band_total
+            count += band_count
+            hist += band_hist
+        self.parallel_compares += 1
+        score = total / count if count else 1.0
+        return score, otsu_count(hist)
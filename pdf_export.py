@@ -0,0 +1,175 @@
+"""Export of a capture session to a single PDF handout.
+
+    python slide_snap.py --export-pdf 2024.05.02        # A whole day
+    python slide_snap.py --export-pdf 2024.05.02:14     # One hour
+
+export_pdf() writes one page per capture, in capture order, straight to
+the output file: only the image of the current page is ever in memory, so
+a day of hundreds of full-resolution slides costs no more memory than one.
+Pages are JPEG (DCTDecode) at the given quality, or lossless Flate with
+quality None, optionally downscaled to max_width pixels first. The PDF is
+written to a temporary name and renamed into place when complete.
+"""
+import os
+import zlib
+from datetime import datetime
+
+import cv2
+
+from delta_store import read_capture
+
+POINTS_PER_PIXEL = 0.75  # Pages at 96 dpi
+FLATE_ROWS = 256  # Rows compressed at a time for lossless pages
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def session_files(capture_index, date, hour=None):
+    """Returns the captures of a date (and hour) as the history groups them, oldest first."""
+    return list(reversed(capture_index.files(date, hour)))
+
+
+def parse_session(spec):
+    """Splits "YYYY.MM.DD" or "YYYY.MM.DD:HH" into (date, hour or None)."""
+    date, _, hour = spec.partition(":")
+    try:
+        datetime.strptime(date, "%Y.%m.%d")
+        if hour:
+            hour = f"{int(hour):02d}"
+            if not 0 <= int(hour) < 24:
+                raise ValueError
+    except ValueError:
+        raise ValueError(f'Expected "YYYY.MM.DD" or "YYYY.MM.DD:HH", got "{spec}"')
+    return date, hour or None
+
+
+class PdfWriter:
+    """Writes a PDF page by page to a binary file.
+
+    Objects are written as soon as they are complete; only their offsets
+    and the page object numbers are kept for the cross-reference table.
+    Object 1 is the catalog and object 2 the page tree, written last.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.offsets = {}  # Object number -> byte offset
+        self.pages = []  # Page object numbers
+        self._next_number = 3
+        self.f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _reserve(self):
+        number = self._next_number
+        self._next_number += 1
+        return number
+
+    def _begin(self, number):
+        self.offsets[number] = self.f.tell()
+        self.f.write(b"%d 0 obj\n" % number)
+
+    def _object(self, number, body):
+        self._begin(number)
+        self.f.write(body.encode("latin-1") + b"\nendobj\n")
+
+    def _stream(self, number, dictionary, data):
+        self._begin(number)
+        entries = f"{dictionary} /Length {len(data)}".strip()
+        self.f.write(f"<< {entries} >>\nstream\n".encode("latin-1"))
+        self.f.write(data)
+        self.f.write(b"\nendstream\nendobj\n")
+
+    def add_page(self, image, quality=85):
+        """Adds a page showing a BGR image. quality None stores it losslessly."""
+        height, width = image.shape[:2]
+        image_number, content_number, page_number = self._reserve(), self._reserve(), self._reserve()
+        image_dict = f"/Type /XObject /Subtype /Image /Width {width} /Height {height} " \
+                     f"/ColorSpace /DeviceRGB /BitsPerComponent 8"
+
+        if quality is not None:
+            ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+            if not ok:
+                raise IOError("Could not encode page as JPEG")
+            self._stream(image_number, image_dict + " /Filter /DCTDecode", encoded.tobytes())
+        else:
+            # Compressed band by band, the length is only known afterwards
+            length_number = self._reserve()
+            self._begin(image_number)
+            self.f.write(f"<< {image_dict} /Filter /FlateDecode /Length {length_number} 0 R >>\nstream\n"
+                         .encode("latin-1"))
+            start = self.f.tell()
+            compressor = zlib.compressobj(6)
+            for y in range(0, height, FLATE_ROWS):
+                band = cv2.cvtColor(image[y:y + FLATE_ROWS], cv2.COLOR_BGR2RGB)
+                self.f.write(compressor.compress(band.tobytes()))
+            self.f.write(compressor.flush())
+            length = self.f.tell() - start
+            self.f.write(b"\nendstream\nendobj\n")
+            self._object(length_number, str(length))
+
+        page_width, page_height = width * POINTS_PER_PIXEL, height * POINTS_PER_PIXEL
+        self._stream(content_number, "", f"q {page_width:.2f} 0 0 {page_height:.2f} 0 0 cm /Im0 Do Q"
+                     .encode("latin-1"))
+        self._object(page_number, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.2f} {page_height:.2f}] "
+                                  f"/Resources << /XObject << /Im0 {image_number} 0 R >> >> "
+                                  f"/Contents {content_number} 0 R >>")
+        self.pages.append(page_number)
+
+    def close(self, title=None):
+        """Writes the page tree, catalog, info and cross-reference table."""
+        kids = " ".join(f"{number} 0 R" for number in self.pages)
+        self._object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>")
+        self._object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        info_number = self._reserve()
+        info = "/Producer (Slide Snap)"
+        if title:
+            escaped = title.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            info += f" /Title ({escaped})"
+        self._object(info_number, f"<< {info} >>")
+
+        xref_offset = self.f.tell()
+        count = self._next_number
+        lines = [f"xref\n0 {count}\n", "0000000000 65535 f \n"]
+        lines += [f"{self.offsets[number]:010d} 00000 n \n" for number in range(1, count)]
+        lines.append(f"trailer\n<< /Size {count} /Root 1 0 R /Info {info_number} 0 R >>\n"
+                     f"startxref\n{xref_offset}\n%%EOF\n")
+        self.f.write("".join(lines).encode("latin-1"))
+
+
+def export_pdf(paths, output_path, max_width=None, quality=85, title=None, on_progress=None, cancelled=None):
+    """Writes the images in paths to output_path as one PDF, a page each. Returns the pages written.
+
+    Unreadable images are skipped. on_progress(done, total) is called after
+    every image. cancelled is an optional threading.Event checked between
+    pages; setting it raises ExportCancelled and leaves no file behind.
+    """
+    temp_path = output_path + ".part"
+    total = len(paths)
+    try:
+        with open(temp_path, "wb") as f:
+            writer = PdfWriter(f)
+            for done, path in enumerate(paths, 1):
+                if cancelled is not None and cancelled.is_set():
+                    raise ExportCancelled()
+                image = read_capture(path)  # Also rebuilds delta captures
+                if image is None:
+                    print(f"Skipping unreadable image: {path}")
+                else:
+                    height, width = image.shape[:2]
+                    if max_width and width > max_width:
+                        size = (max_width, max(1, round(height * max_width / width)))
+                        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+                    writer.add_page(image, quality)
+                    del image  # Free this page before the next one is read
+                if on_progress is not None:
+                    on_progress(done, total)
+            writer.close(title)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return len(writer.pages)
@@ -0,0 +1,125 @@
+"""On-demand profiling of a running Slide Snap capture.
+
+A Profiler can be switched on and off while capturing, from the GUI hotkey
+or, for headless capture, with --profile and SIGUSR1. While it is on:
+
+* every Metrics span (the capture stages, encoding and writing on the
+  writer thread, GUI updates) is also recorded as a Chrome trace event,
+  and counter increments as instant events,
+* optionally, each capture tick runs under cProfile.
+
+Stopping writes the trace as JSON, which opens in https://ui.perfetto.dev
+or chrome://tracing, and the cProfile statistics as a .prof file for
+pstats or snakeviz. While off, a span costs one extra attribute check.
+"""
+import cProfile
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+
+class TraceRecorder:
+    """Collects Chrome trace events in memory.
+
+    At most max_events are kept, later events are counted in dropped
+    instead, so a forgotten recording can't exhaust memory.
+    """
+
+    def __init__(self, max_events=1_000_000):
+        self.max_events = max_events
+        self.dropped = 0
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self._events = []
+        self._threads = {}  # Thread ident -> name
+        self._lock = threading.Lock()
+
+    def _append(self, event):
+        thread = threading.current_thread()
+        event["pid"] = self.pid
+        event["tid"] = thread.ident
+        with self._lock:
+            if thread.ident not in self._threads:
+                self._threads[thread.ident] = thread.name
+            if len(self._events) >= self.max_events:
+                self.dropped += 1
+                return
+            self._events.append(event)
+
+    def span(self, name, started, duration):
+        """Records a complete event that began at perf_counter() time started."""
+        self._append({"name": name, "ph": "X", "ts": (started - self.origin) * 1e6, "dur": duration * 1e6})
+
+    def instant(self, name, amount=1):
+        self._append({"name": name, "ph": "i", "s": "t", "ts": (time.perf_counter() - self.origin) * 1e6,
+                      "args": {"amount": amount}})
+
+    def save(self, path):
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+        metadata = [{"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": "Slide Snap"}}]
+        metadata += [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": ident, "args": {"name": name}}
+                     for ident, name in threads.items()]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms",
+                       "otherData": {"dropped_events": self.dropped}}, f)
+
+
+class Profiler:
+    """Toggles trace recording (and cProfile) for a CaptureEngine.
+
+    Files are written to folder as slide_snap_trace_<time>.json and
+    slide_snap_profile_<time>.prof. cProfile only covers the capture
+    ticks, on whichever thread runs them; encoding and writing show up in
+    the trace only.
+    """
+
+    def __init__(self, engine, folder, cprofile=False):
+        self.engine = engine
+        self.folder = folder
+        self.cprofile = cprofile
+        self.tracer = None
+        self.profile = None
+        self.started = None
+
+    @property
+    def active(self):
+        return self.tracer is not None
+
+    def start(self):
+        if self.active:
+            return
+        self.started = datetime.now()
+        self.tracer = TraceRecorder()
+        if self.cprofile:
+            self.profile = cProfile.Profile()
+            self.engine.set_profile(self.profile)  # Enabled around each tick by the capture thread
+        self.engine.metrics.tracer = self.tracer
+
+    def stop(self):
+        """Stops recording. Returns the paths of the files written."""
+        if not self.active:
+            return []
+        self.engine.metrics.tracer = None
+        self.engine.set_profile(None)
+        tracer, profile = self.tracer, self.profile
+        self.tracer = self.profile = None
+
+        os.makedirs(self.folder, exist_ok=True)
+        stamp = self.started.strftime("%Y%m%d_%H%M%S")
+        paths = [os.path.join(self.folder, f"slide_snap_trace_{stamp}.json")]
+        tracer.save(paths[0])
+        if profile is not None:
+            paths.append(os.path.join(self.folder, f"slide_snap_profile_{stamp}.prof"))
+            profile.dump_stats(paths[1])
+        return paths
+
+    def toggle(self):
+        """Starts or stops recording. Returns the paths written when stopping, else []."""
+        if self.active:
+            return self.stop()
+        self.start()
+        return []
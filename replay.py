@@ -0,0 +1,147 @@
+"""Offline replay of recorded footage through the Slide Snap detector.
+
+Frames from a video file or a folder of images are fed through
+CaptureEngine.process(), the same decision logic the live capture loop
+runs, with a simulated clock instead of wall time. Frames are sampled at
+the capture interval, as the live loop would have seen them, and processed
+as fast as the CPU allows, so detector settings can be evaluated on hours
+of footage in minutes.
+
+Run it through the command line entry point, which accepts the same
+settings as headless capture:
+
+    python slide_snap.py --replay lecture.mp4 --interval 2 --no-adaptive
+"""
+import os
+import time
+
+import cv2
+
+from capture_index import parse_capture_name
+from delta_store import read_capture
+from image_writer import CAPTURE_EXTENSIONS
+
+READABLE_EXTENSIONS = CAPTURE_EXTENSIONS + (".jpeg", ".bmp", ".tif", ".tiff")
+
+
+class SimulatedClock:
+    """Clock for CaptureEngine that only moves when the replay advances it."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+def video_frames(path, interval):
+    """Yields (offset seconds, BGR frame) from a video, one frame per interval."""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise IOError(f"Could not open video: {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0  # Some containers don't report it
+    next_offset = 0.0
+    index = 0
+    try:
+        while capture.grab():  # Skipped frames are never converted to BGR
+            offset = index / fps
+            index += 1
+            if offset + 1e-6 < next_offset:
+                continue
+            ok, frame = capture.retrieve()
+            if not ok:
+                break
+            yield offset, frame
+            next_offset += interval
+    finally:
+        capture.release()
+
+
+def image_frames(folder, interval):
+    """Yields (offset seconds, BGR frame) for the images in a folder, in name order.
+
+    Images named like captures (screenshot_YYYYmmdd_HHMMSS) are placed at
+    their capture time, anything else one interval apart.
+    """
+    names = sorted(name for name in os.listdir(folder)
+                   if os.path.splitext(name)[1].lower() in READABLE_EXTENSIONS)
+    start = None
+    for index, name in enumerate(names):
+        frame = read_capture(os.path.join(folder, name))  # Delta captures are rebuilt
+        if frame is None:
+            print(f"Skipping unreadable image: {name}")
+            continue
+        captured = parse_capture_name(name)
+        if captured is not None:
+            if start is None:
+                start = captured.timestamp()
+            offset = captured.timestamp() - start
+        else:
+            offset = index * interval
+        yield offset, frame
+
+
+def open_source(path, interval):
+    """Returns the frame iterator for a video file or an image folder."""
+    if os.path.isdir(path):
+        return image_frames(path, interval)
+    return video_frames(path, interval)
+
+
+def replay(engine, frames, clock, on_frame=None):
+    """Runs frames through engine.process() and returns a summary.
+
+    engine must have been created with clock. on_frame(record) is called
+    for every frame with its offset, score and decision.
+    """
+    base_time = clock.now
+    saved = 0
+    processed = 0
+    last_offset = 0.0
+    sensitivity = [engine.sensitivity]
+    previous_sensitivity_callback = engine.on_sensitivity
+
+    def record_sensitivity(value):
+        sensitivity[0] = value
+        if previous_sensitivity_callback is not None:
+            previous_sensitivity_callback(value)
+
+    engine.on_sensitivity = record_sensitivity
+    start = time.perf_counter()
+    try:
+        for index, (offset, frame) in enumerate(frames):
+            clock.now = base_time + offset
+            had_previous = engine.previous_screenshot is not None
+            result = engine.process(frame, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+            processed += 1
+            last_offset = offset
+
+            saved_frame = result is not None and result.changed and engine.last_revisit is None
+            if saved_frame:
+                saved += 1
+            if on_frame is not None:
+                on_frame({
+                    "frame": index,
+                    "offset": round(offset, 3),
+                    "score": None if result is None else round(float(result.score), 6),
+                    "diff_pixels": None if result is None else int(result.diff_pixels),
+                    "level": None if result is None else result.level,
+                    "sensitivity": None if result is None else round(sensitivity[0], 6),
+                    "saved": saved_frame,
+                    "video": engine.paused_for_video,
+                    "unchanged": result is None and had_previous and not engine.paused_for_video,
+                    "revisit": engine.last_revisit,
+                    "region": list(result.region) if result is not None and result.region else None,
+                })
+    finally:
+        engine.on_sensitivity = previous_sensitivity_callback
+    elapsed = time.perf_counter() - start
+
+    return {
+        "frames": processed,
+        "saved": saved,
+        "duration": round(last_offset, 3),  # Seconds of footage covered
+        "elapsed": round(elapsed, 3),
+        "fps": round(processed / elapsed, 2) if elapsed else None,
+        "speedup": round(last_offset / elapsed, 1) if elapsed else None,  # Footage seconds per wall second
+    }
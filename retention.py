@@ -0,0 +1,195 @@
+"""Disk usage limits for a Slide Snap output folder.
+
+A kiosk capturing for weeks eventually fills the disk, and a failed write
+stops the capture. RetentionManager keeps the output folder within a
+RetentionPolicy by deleting the oldest captures:
+
+* max_age_days: captures older than this are removed,
+* max_files_per_day: only the newest captures of each day are kept,
+* max_bytes: the total size of all captures stays below this,
+* min_free_bytes: at least this much space stays free on the disk, also
+  checked right before every file is written.
+
+Sizes and capture times come from the CaptureIndex, so enforcing a policy
+is a few indexed queries rather than a walk over the date folders. The
+keyframes of delta captures count towards max_bytes, and a keyframe is
+deleted with the last capture using it, so captures are removed one by
+one until the bytes actually freed cover what is needed. The
+policy is enforced on a background thread, woken after every save and
+every few minutes for the age limit. The writer calls make_room() with
+the size of each encoded file before writing it, so space is freed before
+the write instead of the write failing.
+"""
+import os
+import shutil
+import threading
+import time
+
+from delta_store import is_delta, release_keyframe
+
+EVICT_BATCH = 64  # Captures fetched from the index at a time
+THUMBNAIL_FOLDER = ".thumbnails"  # Same as the GUI's ThumbnailCache.SIDECAR_FOLDER
+
+
+def thumbnail_path(image_path):
+    folder, filename = os.path.split(image_path)
+    return os.path.join(folder, THUMBNAIL_FOLDER, os.path.splitext(filename)[0] + ".jpg")
+
+
+class RetentionPolicy:
+    """Limits on the captures of an output folder. None (or 0) disables a limit."""
+
+    def __init__(self, max_bytes=None, max_age_days=None, max_files_per_day=None, min_free_bytes=None):
+        self.max_bytes = max_bytes or None
+        self.max_age_days = max_age_days or None
+        self.max_files_per_day = max_files_per_day or None
+        self.min_free_bytes = min_free_bytes or None
+
+    @property
+    def enabled(self):
+        return any((self.max_bytes, self.max_age_days, self.max_files_per_day, self.min_free_bytes))
+
+
+class RetentionManager:
+    """Enforces a RetentionPolicy on the captures of a CaptureIndex, oldest first.
+
+    Removing a capture deletes the file, its thumbnail and its index row.
+    on_removed(paths) is called from the thread that removed them, with
+    the paths of each batch.
+    """
+
+    def __init__(self, capture_index, policy, on_removed=None, interval=300.0):
+        self.capture_index = capture_index
+        self.policy = policy
+        self.on_removed = on_removed
+        self.interval = interval
+        self.removed = 0
+        self.removed_bytes = 0
+        self._lock = threading.Lock()  # One eviction at a time, writer thread or background thread
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="slide-snap-retention", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def request(self):
+        """Asks the background thread to enforce the policy soon, e.g. after a save."""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop_event.is_set():
+                return
+            try:
+                self.enforce()
+            except Exception as e:  # The index may be closed under us when the folder changes
+                print(f"Could not enforce the retention policy: {e}")
+
+    def free_bytes(self):
+        return shutil.disk_usage(self.capture_index.base_output_path).free
+
+    def _remove(self, captures, needed_bytes=None):
+        """Deletes (path, size) captures in order, until needed_bytes were freed if given.
+
+        Returns the bytes freed, including keyframes released along with
+        delta captures.
+        """
+        removed, freed = [], 0
+        for path, size in captures:
+            if needed_bytes is not None and freed >= needed_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # Dropped from the index all the same so it isn't picked again, a reconcile brings it back
+                print(f"Could not remove {path}: {e}")
+            else:
+                freed += size
+            try:
+                os.remove(thumbnail_path(path))
+            except OSError:
+                pass
+            if is_delta(path):
+                keyframe = release_keyframe(path)
+                if keyframe is not None:
+                    self.capture_index.remove(keyframe[0])
+                    freed += keyframe[1]
+            self.capture_index.remove(path)
+            removed.append(path)
+        self.removed += len(removed)
+        self.removed_bytes += freed
+        if removed and self.on_removed is not None:
+            self.on_removed(removed)
+        return freed
+
+    def enforce(self):
+        """Applies every limit of the policy now. Returns the number of captures removed."""
+        policy = self.policy
+        with self._lock:
+            before = self.removed
+            if policy.max_age_days:
+                cutoff = time.time() - policy.max_age_days * 86400
+                while not self._stop_event.is_set():
+                    batch = self.capture_index.oldest(EVICT_BATCH, before=cutoff)
+                    if not batch:
+                        break
+                    self._remove(batch)
+
+            if policy.max_files_per_day:
+                for date, count in self.capture_index.crowded_dates(policy.max_files_per_day).items():
+                    self._remove(self.capture_index.oldest(count - policy.max_files_per_day, date=date))
+
+            if policy.max_bytes:
+                _, total = self.capture_index.usage()
+                while total > policy.max_bytes and not self._stop_event.is_set():
+                    batch = self.capture_index.oldest(EVICT_BATCH)
+                    if not batch:
+                        break
+                    self._remove(batch, total - policy.max_bytes)  # Only as many as needed
+                    _, total = self.capture_index.usage()
+
+            self._make_room(0)
+            return self.removed - before
+
+    def make_room(self, needed_bytes):
+        """Removes the oldest captures until needed_bytes fit above min_free_bytes.
+
+        Called by the writer before every file. Returns True if anything was
+        removed. Does nothing without a free space limit.
+        """
+        with self._lock:
+            return self._make_room(needed_bytes)
+
+    def _make_room(self, needed_bytes):
+        if not self.policy.min_free_bytes:
+            return False
+        target = self.policy.min_free_bytes + needed_bytes
+        try:
+            free = self.free_bytes()
+        except OSError:
+            return False
+        removed = False
+        while free < target:
+            batch = self.capture_index.oldest(EVICT_BATCH)
+            if not batch:
+                break
+            self._remove(batch, target - free)
+            removed = True
+            try:
+                free = self.free_bytes()  # What the file system actually gave back
+            except OSError:
+                break
+        return removed
@@ -1,24 +1,30 @@
 import sys
-import time
-import numpy as np
-import cv2
-import pyautogui
+import collections
+import functools
+import threading
+import multiprocessing
 from PyQt5 import QtWidgets, QtGui, QtCore
 from datetime import datetime
 import os
 import subprocess
 from pathlib import Path
-from PyQt5.QtCore import Qt, QTimer, QPropertyAnimation, QSettings, QPoint, QEasingCurve, QEvent
-from PyQt5.QtGui import QPixmap, QIcon, QColor, QPalette, QPainter, QBrush, QCursor, QImage
+from PyQt5.QtCore import Qt, QTimer, QPropertyAnimation, QSettings, QEasingCurve, QEvent
+from PyQt5.QtGui import QPixmap, QIcon, QColor, QPainter, QBrush, QCursor, QImage
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
                              QDoubleSpinBox, QSpinBox, QLineEdit, QFileDialog, QGroupBox,
-                             QScrollArea, QListWidget, QListWidgetItem, QMessageBox, QToolTip,
-                             QStyleFactory, QFrame, QSplitter, QGridLayout, QSlider, QMenu, QAction)
+                             QScrollArea, QMessageBox, QToolTip,
+                             QSplitter, QGridLayout, QSlider, QMenu, QAction)
 
-# Important: Import compare_ssim from skimage.metrics
-from skimage.metrics import structural_similarity as compare_ssim
+from capture_backends import CaptureRegion, available_backends, create_backend, window_titles
+from image_writer import CAPTURE_EXTENSIONS, write_atomic
+from delta_store import DELTA_EXTENSION, is_delta, materialize, read_capture, release_keyframe
+from metrics import Metrics, MetricsExporter
+from profiling import Profiler
+from retention import RetentionManager, RetentionPolicy
+from capture_index import CaptureIndex, parse_capture_name
 
 # --- Helper Function for Asset Loading ---
+@functools.lru_cache(maxsize=None)
 def load_asset(filename):
     """Loads an asset from the assets folder."""
     filepath = os.path.join(Path(__file__).resolve().parent, "assets", filename)
@@ -29,6 +35,16 @@ def load_asset(filename):
         print(f"Error: Asset file '{filepath}' not found.")
         return None
 
+def capture_qimage(image_path):
+    """Loads a capture as a QImage, rebuilding delta captures (see delta_store.py)."""
+    if not is_delta(image_path):
+        return QImage(image_path)
+    image = read_capture(image_path)
+    if image is None:
+        return QImage()
+    height, width = image.shape[:2]
+    return QImage(image.data, width, height, image.strides[0], QImage.Format_BGR888).copy()
+
 class NotificationBanner(QWidget):
     def __init__(self, parent=None):
         super(NotificationBanner, self).__init__(parent)
@@ -191,96 +207,442 @@ class HoverButton(QPushButton):
                 self.setCursor(QCursor(Qt.ArrowCursor))
         return super(HoverButton, self).eventFilter(obj, event)
 
-class ThumbnailCard(QWidget):
-    clicked = QtCore.pyqtSignal(str)
+class ThumbnailTaskSignals(QtCore.QObject):
+    done = QtCore.pyqtSignal(str, QImage)
 
-    def __init__(self, image_path, parent=None):
-        super(ThumbnailCard, self).__init__(parent)
-        self.image_path = image_path  # Keep the path for deletion
-        self.setFixedSize(150, 120)
-        self.setMouseTracking(True)
-        self.hover = False
+class ThumbnailTask(QtCore.QRunnable):
+    """Loads or generates the thumbnail of one screenshot on a thread pool."""
+    def __init__(self, image_path, sidecar_path, size, signals):
+        super(ThumbnailTask, self).__init__()
+        self.image_path = image_path
+        self.sidecar_path = sidecar_path
+        self.size = size
+        self.signals = signals
 
-        self.setStyleSheet("""
-            QToolTip {
-                background-color: white;
-                color: black;
-                border: 1px solid #d0d0d0;
-                border-radius: 4px;
-                padding: 4px;
-            }
-        """)
+    def run(self):
+        image = QImage()
+        try:
+            if (os.path.exists(self.sidecar_path)
+                    and os.path.getmtime(self.sidecar_path) >= os.path.getmtime(self.image_path)):
+                image = QImage(self.sidecar_path)
+
+            if image.isNull():
+                if is_delta(self.image_path):
+                    image = capture_qimage(self.image_path)  # Rebuilt in full, so keep the sidecar too
+                    if not image.isNull():
+                        image = image.scaled(self.size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+                else:
+                    reader = QtGui.QImageReader(self.image_path)
+                    reader.setScaledSize(reader.size().scaled(self.size, Qt.KeepAspectRatio))
+                    image = reader.read()
+                if not image.isNull():
+                    # Encoded in memory and renamed into place, a crash never leaves a truncated sidecar
+                    data = QtCore.QByteArray()
+                    buffer = QtCore.QBuffer(data)
+                    buffer.open(QtCore.QIODevice.WriteOnly)
+                    if image.save(buffer, "JPG", 85):
+                        os.makedirs(os.path.dirname(self.sidecar_path), exist_ok=True)
+                        write_atomic(self.sidecar_path, bytes(data))
+        except OSError as e:
+            print(f"Error creating thumbnail for {self.image_path}: {e}")
+        self.signals.done.emit(self.image_path, image)
+
+class PdfExportSignals(QtCore.QObject):
+    progress = QtCore.pyqtSignal(int, int)
+    finished = QtCore.pyqtSignal(str, int)
+    failed = QtCore.pyqtSignal(str)
+
+class PdfExportTask(QtCore.QRunnable):
+    """Writes a session to a PDF on a thread pool, see pdf_export.py."""
+    def __init__(self, paths, output_path, max_width, quality, title, cancelled, signals):
+        super(PdfExportTask, self).__init__()
+        self.paths = paths
+        self.output_path = output_path
+        self.max_width = max_width
+        self.quality = quality
+        self.title = title
+        self.cancelled = cancelled
+        self.signals = signals
+
+    def run(self):
+        import pdf_export
+        try:
+            pages = pdf_export.export_pdf(self.paths, self.output_path, self.max_width, self.quality, self.title,
+                                          on_progress=self.signals.progress.emit, cancelled=self.cancelled)
+        except pdf_export.ExportCancelled:
+            self.signals.failed.emit("")
+        except Exception as e:
+            print(f"Error exporting {self.output_path}: {e}")
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(self.output_path, pages)
+
+class ThumbnailCache(QtCore.QObject):
+    """Scaled thumbnails of screenshots, kept in memory and on disk.
+
+    Thumbnails are generated off the GUI thread and written as JPEG sidecars
+    into a .thumbnails folder next to the screenshot, so they only need to be
+    decoded from the full-size image once. Scaled pixmaps are kept in an LRU
+    bounded by max_bytes. get() never blocks: it returns None and schedules
+    the thumbnail, and thumbnail_ready fires once it is available.
+    """
+    thumbnail_ready = QtCore.pyqtSignal(str)
+
+    SIDECAR_FOLDER = ".thumbnails"
+
+    def __init__(self, size=QtCore.QSize(140, 90), max_bytes=32 * 1024 * 1024, parent=None):
+        super(ThumbnailCache, self).__init__(parent)
+        self.size = size
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.pixmaps = collections.OrderedDict()  # Path -> QPixmap, least recently used first
+        self.pending = set()
+
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(2)
+        self.signals = ThumbnailTaskSignals(self)
+        self.signals.done.connect(self.on_thumbnail_done)
+
+    @classmethod
+    def sidecar_path(cls, image_path):
+        folder, filename = os.path.split(image_path)
+        return os.path.join(folder, cls.SIDECAR_FOLDER, os.path.splitext(filename)[0] + ".jpg")
+
+    def get(self, image_path):
+        """Returns the cached thumbnail, or None while it is being generated."""
+        pixmap = self.pixmaps.get(image_path)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(image_path)
+            return pixmap
+        if image_path not in self.pending:
+            self.pending.add(image_path)
+            self.pool.start(ThumbnailTask(image_path, self.sidecar_path(image_path), self.size, self.signals))
+        return None
 
-        filename = os.path.basename(image_path)
-        self.setToolTip(filename)
+    def invalidate(self, image_path):
+        """Drops a thumbnail from memory and disk, e.g. after its image was deleted."""
+        pixmap = self.pixmaps.pop(image_path, None)
+        if pixmap is not None:
+            self.total_bytes -= self._cost(pixmap)
+        try:
+            os.remove(self.sidecar_path(image_path))
+        except OSError:
+            pass
+
+    def on_thumbnail_done(self, image_path, image):
+        self.pending.discard(image_path)
+        if image.isNull():
+            return  # Unreadable image, cards keep their placeholder
+        pixmap = QPixmap.fromImage(image)  # QPixmap may only be created on the GUI thread
+        self.pixmaps[image_path] = pixmap
+        self.total_bytes += self._cost(pixmap)
+        while self.total_bytes > self.max_bytes and len(self.pixmaps) > 1:
+            _, evicted = self.pixmaps.popitem(last=False)
+            self.total_bytes -= self._cost(evicted)
+        self.thumbnail_ready.emit(image_path)
+
+    @staticmethod
+    def _cost(pixmap):
+        return pixmap.width() * pixmap.height() * 4
+
+class ThumbnailListModel(QtCore.QAbstractListModel):
+    """Screenshot paths for the thumbnail gallery, newest first.
+
+    Rows are populated lazily: the date folders of the output folder are only
+    listed when the view scrolls towards the end (canFetchMore/fetchMore), so
+    opening a large archive costs one directory listing.
+    """
+    BATCH_SIZE = 50
 
-    def paintEvent(self, event):
-        painter = QPainter(self)
+    def __init__(self, parent=None):
+        super(ThumbnailListModel, self).__init__(parent)
+        self.paths = []
+        self.pending_folders = []  # Date folders not listed yet, newest first
+
+    def set_folder(self, base_output_path):
+        """Resets the model to the screenshots under base_output_path."""
+        self.beginResetModel()
+        self.paths = []
+        self.pending_folders = []
+        if os.path.isdir(base_output_path):
+            for date_folder in sorted(os.listdir(base_output_path), reverse=True):
+                date_path = os.path.join(base_output_path, date_folder)
+                if os.path.isdir(date_path):
+                    self.pending_folders.append(date_path)
+        self.endResetModel()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self.paths[index.row()]
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return os.path.basename(path)
+        if role == Qt.UserRole:
+            return path
+        return None
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and bool(self.pending_folders)
+
+    def fetchMore(self, parent):
+        new_paths = []
+        while self.pending_folders and len(new_paths) < self.BATCH_SIZE:
+            date_path = self.pending_folders.pop(0)
+            try:
+                filenames = os.listdir(date_path)
+            except OSError:
+                continue
+            known = set(self.paths)  # A capture may already have been added live
+            for filename in sorted(filenames, reverse=True):
+                if filename.startswith("screenshot_") and os.path.splitext(filename)[1] in CAPTURE_EXTENSIONS:
+                    path = os.path.join(date_path, filename)
+                    if path not in known:
+                        new_paths.append(path)
+        if new_paths:
+            self.beginInsertRows(QtCore.QModelIndex(), len(self.paths), len(self.paths) + len(new_paths) - 1)
+            self.paths.extend(new_paths)
+            self.endInsertRows()
+
+    def add_path(self, path):
+        """Adds a new capture at the front."""
+        if path in self.paths:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), 0, 0)
+        self.paths.insert(0, path)
+        self.endInsertRows()
+
+    def remove_path(self, path):
+        try:
+            row = self.paths.index(path)
+        except ValueError:
+            return
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        del self.paths[row]
+        self.endRemoveRows()
+
+class HistoryNode:
+    """One row of the history tree: a date, an hour or a file."""
+    DATE, HOUR, FILE = range(3)
+
+    def __init__(self, kind, key, parent=None):
+        self.kind = kind
+        self.key = key  # "YYYY.MM.DD", "HH" or the file path
+        self.parent = parent
+        self.children = []
+        self.loaded = kind == HistoryNode.FILE  # Files have no children to fetch
+
+    def row(self):
+        return self.parent.children.index(self) if self.parent is not None else 0
+
+class HistoryModel(QtCore.QAbstractItemModel):
+    """Date -> hour -> file tree over the capture index.
+
+    Only the dates are queried up front. The hours of a date and the files of
+    an hour are fetched when the node is expanded (canFetchMore/fetchMore),
+    and new captures are inserted as single rows, so the cost of the tree
+    follows the visible rows rather than the size of the archive.
+    """
+    def __init__(self, parent=None):
+        super(HistoryModel, self).__init__(parent)
+        self.capture_index = None
+        self.root = HistoryNode(None, None)
+        self.fonts = {
+            HistoryNode.DATE: QtGui.QFont("Arial", 12, QtGui.QFont.Bold),
+            HistoryNode.HOUR: QtGui.QFont("Arial", 11, QtGui.QFont.Bold),
+            HistoryNode.FILE: QtGui.QFont("Arial", 10),
+        }
+
+    def set_capture_index(self, capture_index):
+        """Resets the tree to the dates of capture_index (may be None)."""
+        self.beginResetModel()
+        self.capture_index = capture_index
+        self.root = HistoryNode(None, None)
+        if capture_index is not None:
+            self.root.children = [HistoryNode(HistoryNode.DATE, date, self.root)
+                                  for date in capture_index.dates()]
+        self.root.loaded = True
+        self.endResetModel()
+
+    def node(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        parent_node = self.node(parent)
+        if column != 0 or not 0 <= row < len(parent_node.children):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, parent_node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        parent_node = index.internalPointer().parent
+        if parent_node is None or parent_node is self.root:
+            return QtCore.QModelIndex()
+        return self.createIndex(parent_node.row(), 0, parent_node)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return len(self.node(parent).children)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        node = self.node(parent)
+        return node.kind != HistoryNode.FILE and (not node.loaded or bool(node.children))
+
+    def canFetchMore(self, parent):
+        return not self.node(parent).loaded and self.capture_index is not None
+
+    def fetchMore(self, parent):
+        node = self.node(parent)
+        if node.loaded or self.capture_index is None:
+            return
+        node.loaded = True
+        if node.kind == HistoryNode.DATE:
+            children = [HistoryNode(HistoryNode.HOUR, hour, node) for hour in self.capture_index.hours(node.key)]
+        else:
+            children = [HistoryNode(HistoryNode.FILE, path, node)
+                        for path in self.capture_index.files(node.parent.key, node.key)]
+        if children:
+            self.beginInsertRows(parent, 0, len(children) - 1)
+            node.children = children
+            self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role == Qt.DisplayRole:
+            if node.kind == HistoryNode.DATE:
+                return node.key
+            if node.kind == HistoryNode.HOUR:
+                return f"Hour: {node.key}"
+            return os.path.basename(node.key)
+        if role == Qt.FontRole:
+            return self.fonts[node.kind]
+        if role == Qt.ToolTipRole and node.kind == HistoryNode.FILE:
+            return node.key  # Show filepath as tooltip
+        if role == Qt.UserRole and node.kind == HistoryNode.FILE:
+            return node.key
+        return None
+
+    def _index_of(self, node):
+        return QtCore.QModelIndex() if node is self.root else self.createIndex(node.row(), 0, node)
+
+    def _child(self, node, kind, key, create=True):
+        """Finds the child with key, inserting it in newest-first order if needed."""
+        position = 0
+        for position, child in enumerate(node.children):
+            if child.key == key:
+                return child
+            if child.key < key:
+                break
+        else:
+            position = len(node.children)
+        if not create:
+            return None
+        child = HistoryNode(kind, key, node)
+        self.beginInsertRows(self._index_of(node), position, position)
+        node.children.insert(position, child)
+        self.endInsertRows()
+        return child
+
+    def add_capture(self, filepath):
+        """Inserts one new capture, touching only the nodes that are loaded."""
+        dt = parse_capture_name(filepath)
+        if dt is None or self.capture_index is None:
+            return
+        date_node = self._child(self.root, HistoryNode.DATE, dt.strftime("%Y.%m.%d"))
+        if date_node.loaded:
+            hour_node = self._child(date_node, HistoryNode.HOUR, dt.strftime("%H"))
+            if hour_node.loaded:
+                self._child(hour_node, HistoryNode.FILE, filepath)
+
+    def remove_capture(self, filepath):
+        """Removes one capture, and its hour and date rows once they are empty."""
+        dt = parse_capture_name(filepath)
+        if dt is None:
+            return
+        date_node = self._child(self.root, HistoryNode.DATE, dt.strftime("%Y.%m.%d"), create=False)
+        hour_node = date_node and self._child(date_node, HistoryNode.HOUR, dt.strftime("%H"), create=False)
+        file_node = hour_node and self._child(hour_node, HistoryNode.FILE, filepath, create=False)
+        for node in (file_node, hour_node, date_node):
+            if node is None:
+                continue
+            if node.children or (not node.loaded and node.kind != HistoryNode.FILE):
+                break  # Still has (or may have) other captures
+            parent = node.parent
+            row = node.row()
+            self.beginRemoveRows(self._index_of(parent), row, row)
+            del parent.children[row]
+            self.endRemoveRows()
+
+class ThumbnailDelegate(QtWidgets.QStyledItemDelegate):
+    """Paints gallery cards from the thumbnail cache, with no widget per item."""
+    CARD_SIZE = QtCore.QSize(150, 120)
+
+    def __init__(self, thumbnail_cache, parent=None):
+        super(ThumbnailDelegate, self).__init__(parent)
+        self.thumbnail_cache = thumbnail_cache
+
+    def sizeHint(self, option, index):
+        return self.CARD_SIZE
+
+    def paint(self, painter, option, index):
+        painter.save()
         painter.setRenderHint(QPainter.Antialiasing)
         painter.setRenderHint(QPainter.SmoothPixmapTransform)
 
+        rect = option.rect.adjusted(5, 5, -5, -5)  # Spacing between cards
+        hover = bool(option.state & QtWidgets.QStyle.State_MouseOver)
+
         # Draw card background
         painter.setBrush(QBrush(QColor(255, 255, 255)))
         painter.setPen(Qt.NoPen)
 
-        if self.hover:
+        if hover:
             # Draw shadow
             painter.setBrush(QBrush(QColor(0, 0, 0, 30)))
-            shadow_rect = self.rect().adjusted(3, 3, 3, 3)
-            painter.drawRoundedRect(shadow_rect, 6, 6)
+            painter.drawRoundedRect(rect.adjusted(3, 3, 3, 3), 6, 6)
 
             # Draw highlighted border
             painter.setBrush(QBrush(QColor(255, 255, 255)))
             painter.setPen(QColor(33, 150, 243))  # Blue highlight
-            card_rect = self.rect().adjusted(0, 0, -1, -1)
         else:
             painter.setPen(QColor(220, 220, 220))
-            card_rect = self.rect().adjusted(0, 0, -1, -1)
-
+        card_rect = rect.adjusted(0, 0, -1, -1)
         painter.drawRoundedRect(card_rect, 6, 6)
 
-        # Draw image
-        pixmap = QPixmap(self.image_path)
-        if not pixmap.isNull():
-            # Calculate scaled size for the thumbnail
-            img_rect = QtCore.QRect(5, 5, self.width() - 10, self.height() - 30)
-            scaled_pixmap = pixmap.scaled(img_rect.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
-
+        # Draw image, already scaled by the thumbnail cache
+        img_rect = QtCore.QRect(rect.x() + 5, rect.y() + 5, rect.width() - 10, rect.height() - 30)
+        scaled_pixmap = self.thumbnail_cache.get(index.data(Qt.UserRole))
+        if scaled_pixmap is not None:
             # Center the image in the thumbnail area
             img_x = img_rect.x() + (img_rect.width() - scaled_pixmap.width()) // 2
             img_y = img_rect.y() + (img_rect.height() - scaled_pixmap.height()) // 2
-
             painter.drawPixmap(img_x, img_y, scaled_pixmap)
+        else:
+            # Placeholder until the thumbnail is ready
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(QBrush(QColor(235, 235, 235)))
+            painter.drawRoundedRect(img_rect, 4, 4)
 
-            # Draw filename truncated
-            painter.setPen(QColor(70, 70, 70))
-            font = painter.font()
-            font.setPointSize(8)
-            painter.setFont(font)
-
-            filename = os.path.basename(self.image_path)
-            if len(filename) > 20:
-                filename = filename[:17] + "..."
-
-            text_rect = QtCore.QRect(5, self.height() - 25, self.width() - 10, 20)
-            painter.drawText(text_rect, Qt.AlignCenter, filename)
+        # Draw filename truncated
+        painter.setPen(QColor(70, 70, 70))
+        font = painter.font()
+        font.setPointSize(8)
+        painter.setFont(font)
 
-    def enterEvent(self, event):
-        self.hover = True
-        self.setCursor(QCursor(Qt.PointingHandCursor))
-        self.update()
-        super(ThumbnailCard, self).enterEvent(event)
+        filename = index.data(Qt.DisplayRole)
+        if len(filename) > 20:
+            filename = filename[:17] + "..."
 
-    def leaveEvent(self, event):
-        self.hover = False
-        self.setCursor(QCursor(Qt.ArrowCursor))
-        self.update()
-        super(ThumbnailCard, self).leaveEvent(event)
-
-    def mousePressEvent(self, event):
-        if event.button() == Qt.LeftButton:
-            self.clicked.emit(self.image_path)
-        super(ThumbnailCard, self).mousePressEvent(event)
+        text_rect = QtCore.QRect(rect.x() + 5, rect.bottom() - 25, rect.width() - 10, 20)
+        painter.drawText(text_rect, Qt.AlignCenter, filename)
+        painter.restore()
 
 class ModernCollapsibleBox(QtWidgets.QWidget):
     def __init__(self, title="", parent=None):
@@ -359,6 +721,57 @@ class ModernCollapsibleBox(QtWidgets.QWidget):
         self.animation_2.setEndValue(collapsed_height + content_height)
         self.content_area.setMaximumHeight(content_height)
 
+class RegionSelector(QWidget):
+    """Full-screen overlay to drag out a capture region. Esc cancels."""
+    region_selected = QtCore.pyqtSignal(QtCore.QRect)  # Global, logical coordinates
+
+    def __init__(self):
+        super(RegionSelector, self).__init__(None, Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint | Qt.Tool)
+        self.setAttribute(Qt.WA_TranslucentBackground)
+        self.setAttribute(Qt.WA_DeleteOnClose)
+        self.setCursor(Qt.CrossCursor)
+        geometry = QtCore.QRect()
+        for screen in QApplication.screens():
+            geometry = geometry.united(screen.geometry())
+        self.setGeometry(geometry)
+        self.origin = None
+        self.current = None
+
+    def selection(self):
+        return QtCore.QRect(self.origin, self.current).normalized()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(0, 0, 0, 100))
+        if self.origin is not None:
+            painter.setCompositionMode(QPainter.CompositionMode_Clear)
+            painter.fillRect(self.selection(), Qt.transparent)
+            painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
+            painter.setPen(QtGui.QPen(QColor("#2196F3"), 2))
+            painter.drawRect(self.selection())
+
+    def mousePressEvent(self, event):
+        self.origin = self.current = event.pos()
+        self.update()
+
+    def mouseMoveEvent(self, event):
+        if self.origin is not None:
+            self.current = event.pos()
+            self.update()
+
+    def mouseReleaseEvent(self, event):
+        if self.origin is None:
+            return
+        self.current = event.pos()
+        selection = self.selection()
+        self.close()
+        if selection.width() > 10 and selection.height() > 10:  # Ignore stray clicks
+            self.region_selected.emit(selection.translated(self.geometry().topLeft()))
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Escape:
+            self.close()
+
 class KeyboardShortcutsDialog(QWidget):
     def __init__(self, parent=None):
         super(KeyboardShortcutsDialog, self).__init__(parent, Qt.Dialog)
@@ -383,6 +796,7 @@ class KeyboardShortcutsDialog(QWidget):
             ("Ctrl+Shift+S", "Start Capture"),
             ("Ctrl+Shift+X", "Stop Capture"),
             ("Ctrl+Shift+O", "Open Last Screenshot"),
+            ("Ctrl+Shift+P", "Start/Stop Profiling"),
             ("Ctrl+D", "Toggle Dark/Light Mode"),
             ("Ctrl+H", "Show/Hide Keyboard Shortcuts"),
             ("Ctrl+Q", "Quit Application")
@@ -409,41 +823,174 @@ class KeyboardShortcutsDialog(QWidget):
         close_button.clicked.connect(self.close)
         layout.addWidget(close_button, 0, Qt.AlignRight)
 
+class CaptureWorker(QtCore.QObject):
+    """Runs a CaptureEngine from a timer on a background thread.
+
+    The engine callbacks are re-emitted as signals, so only results cross
+    over to the GUI. Saving is handed off to the engine's ImageWriter queue
+    so encoding never delays the next tick.
+    """
+    screenshot_saved = QtCore.pyqtSignal(str, object)
+    slide_revisited = QtCore.pyqtSignal(str)
+    region_missing = QtCore.pyqtSignal(str)
+    video_paused = QtCore.pyqtSignal()
+    video_resumed = QtCore.pyqtSignal()
+    sensitivity_changed = QtCore.pyqtSignal(float)
+    compare_stats = QtCore.pyqtSignal(object)
+    error = QtCore.pyqtSignal(str)
+
+    def __init__(self, output_folder, interval, sensitivity, adaptive_sensitivity,
+                 video_check_interval, min_diff_pixels=10000, comparator=None, capture_backend="auto",
+                 writer_options=None, engine_options=None):
+        super(CaptureWorker, self).__init__()
+        from capture_engine import CaptureEngine  # Usually loaded already by the startup warm-up
+        # on_saved runs on the writer thread, the signal is queued over to the GUI
+        self.engine = CaptureEngine(output_folder, interval, sensitivity, adaptive_sensitivity,
+                                    video_check_interval=video_check_interval,
+                                    min_diff_pixels=min_diff_pixels, comparator=comparator,
+                                    capture_backend=capture_backend, writer_options=writer_options,
+                                    **(engine_options or {}),
+                                    on_saved=self.screenshot_saved.emit,
+                                    on_revisit=self.slide_revisited.emit,
+                                    on_region_missing=self.region_missing.emit,
+                                    on_video_paused=self.video_paused.emit,
+                                    on_video_resumed=self.video_resumed.emit,
+                                    on_sensitivity=self.sensitivity_changed.emit,
+                                    on_stats=self.compare_stats.emit,
+                                    on_error=self.error.emit)
+        self.timer = None
+
+    @property
+    def is_running(self):
+        return self.engine.is_running
+
+    @is_running.setter
+    def is_running(self, running):
+        self.engine.is_running = running
+
+    @QtCore.pyqtSlot()
+    def start(self):
+        """Starts the tick timer. Must run in the worker thread."""
+        try:
+            self.engine.start()
+        except Exception as e:
+            self.error.emit(str(e))
+            return
+        # Single shot, re-armed after every tick with the scheduler's delay,
+        # so slow frames never queue up behind each other.
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.capture_and_compare)
+        self.timer.start(int(self.engine.next_delay * 1000))
+
+    @QtCore.pyqtSlot()
+    def stop(self):
+        """Stops the tick timer and quits the worker thread."""
+        if self.timer is not None:
+            self.timer.stop()
+        self.engine.close()  # Frames already queued are still written
+        self.thread().quit()
+
+    @QtCore.pyqtSlot(float)
+    def set_interval(self, interval):
+        self.engine.interval = interval  # Used from the next tick on
+
+    @QtCore.pyqtSlot()
+    def capture_and_compare(self):
+        self.engine.tick()
+        if self.engine.is_running:
+            self.timer.start(int(self.engine.next_delay * 1000))
+
 class ScreenshotApp(QtWidgets.QWidget):
     __version__ = "1.1.2"
-    def __init__(self):
+    history_reconciled = QtCore.pyqtSignal()
+    warm_up_done = QtCore.pyqtSignal()
+    monitors_counted = QtCore.pyqtSignal(int)
+    archive_recompressed = QtCore.pyqtSignal(object)  # Summary dict, or None on failure
+    captures_removed = QtCore.pyqtSignal(object)  # Paths deleted by the retention policy
+
+    # Icon data, read on first use (load_asset caches it). Most icons only
+    # appear in notifications, long after startup.
+    start_icon_data = property(lambda self: load_asset("start.png"))
+    stop_icon_data = property(lambda self: load_asset("stop.png"))
+    pause_icon_data = property(lambda self: load_asset("pause.png"))
+    save_icon_data = property(lambda self: load_asset("save.png"))
+    error_icon_data = property(lambda self: load_asset("error.png"))
+    browse_icon_data = property(lambda self: load_asset("browse.png"))
+    open_icon_data = property(lambda self: load_asset("open.png"))
+    copy_icon_data = property(lambda self: load_asset("copy.png"))
+    delete_icon_data = property(lambda self: load_asset("delete.png"))
+
+    def __init__(self, startup_report=None):
         super().__init__()
+        self.startup_report = startup_report  # startup.StartupReport with --startup-report
         self.setWindowTitle('Slide Snap')
         # Start minimized
         self.setWindowState(Qt.WindowMinimized)
         self.setGeometry(100, 100, 1000, 700)
-        self.previous_screenshot = None
         self.screenshot_interval = 5 # Default to 5 seconds
+        # --- Adaptive Interval ---
+        self.adaptive_interval = True  # Poll faster after a change, back off while static
+        self.min_interval = 1.0
+        self.max_interval = 10.0
         self.is_running = False
         self.base_output_path = str(Path.home() / "Screenshots")
         self.current_date_folder = ""
         self.last_screenshot_path = ""
+        self.last_changed_region = None  # (x, y, w, h) of the change that triggered the last capture
         self.paused_for_video = False
-        self.last_video_check_time = 0
         self.video_check_interval = 5
         # --- Sensitivity ---
         self.sensitivity = 0.005  #  sensitivity (0.5% change)  LOWER = MORE SENSITIVE
         self.adaptive_sensitivity = True  # Enable adaptive sensitivity
         self.min_diff_pixels = 10000 #  changed pixels to trigger
+        # --- Multi-resolution Comparison ---
+        self.compare_mode = "full"  # "full", "pyramid" or "tiles"
+        self.pyramid_levels = (8, 4)  # Downscale factors tried before full resolution
+        self.ambiguity_band = 0.5  # Escalate when within +/-50% of the thresholds
+        self.prefilter = True  # Skip SSIM when the frame fingerprint is unchanged
+        self.parallel_compare = False  # Split full-resolution SSIM over a process pool
+        self.compare_workers = 0  # Worker processes, 0 = one per CPU core
+        self.dedup = False  # Record revisited slides instead of saving them again
+        self.dedup_distance = 8  # Max differing hash bits for a revisit
+        self.capture_backend = "auto"  # See capture_backends.py
+        self.capture_region = "desktop"  # CaptureRegion spec: desktop, monitor:N, rect:... or window:TITLE
+        self.monitor_count = 0  # Counted in warm_up(), opening a backend is too slow for startup
+        self.region_selector = None
+        self.region_missing = False
+        # --- Saving ---
+        self.image_format = "png"  # "png", "webp" (lossless) or "jpeg"
+        self.image_level = -1  # PNG compress level / WebP or JPEG quality, -1 = format default
+        self.writer_policy = "block"  # What to do when the write queue is full
+        self.writer_queue_size = 4
+        self.delta_storage = False  # Keyframes plus .sdelta files of the changed rectangles
+        # --- Performance Metrics ---
+        self.metrics = Metrics()  # Replaced by the engine's on every start
+        self.metrics_exporter = None
+        self.metrics_export_format = "off"  # "off", "jsonl" or "prometheus"
+        self.metrics_export_path = ""
+        self.metrics_export_interval = 60  # Seconds between exports
+        self.profiler = None  # Recording a trace of the running engine, see profiling.py
+        self.profile_cprofile = False  # Also run the ticks under cProfile while recording
+        # --- Archive ---
+        self.archive_after_days = 0  # Recompress date folders this old, 0 = off
+        self.archive_format = "webp"  # See archive.TARGETS
+        self.archive_cpu_budget = 25  # Percent of all cores recompression may use while capturing
+        self.archive_recompressor = None
+        self.archive_thread = None
+        # --- Storage Limits (0 = no limit) ---
+        self.retention_max_gb = 0.0  # Total size of all captures
+        self.retention_max_age_days = 0
+        self.retention_max_per_day = 0
+        self.retention_min_free_gb = 0.0  # Free disk space kept
+        self.retention = None  # RetentionManager of the open capture index
+        # --- PDF Export ---
+        self.pdf_preset = 0  # Index into PDF_PRESETS
+        self.pdf_export_cancelled = None  # threading.Event of the running export
 
         # --- Notification Control ---
         self.video_notification_shown = False  # Flag to track if notification has been shown
 
-        # Load icon data
-        self.start_icon_data = load_asset("start.png")
-        self.stop_icon_data = load_asset("stop.png")
-        self.pause_icon_data = load_asset("pause.png")
-        self.save_icon_data = load_asset("save.png")
-        self.error_icon_data = load_asset("error.png")
-        self.browse_icon_data = load_asset("browse.png")
-        self.open_icon_data = load_asset("open.png")
-        self.copy_icon_data = load_asset("copy.png")
-        self.delete_icon_data = load_asset("delete.png")
 
 
         self.notification = NotificationBanner()
@@ -454,11 +1001,9 @@ class ScreenshotApp(QtWidgets.QWidget):
 
         # Initialize UI elements
         #  Removed: self.progress_spinner = QtWidgets.QLabel()
-        self.thumbnail_gallery = QScrollArea()
-        self.thumbnail_widget = QWidget()
-        self.thumbnail_gallery.setWidget(self.thumbnail_widget)
-        self.thumbnail_gallery.setWidgetResizable(True)
-        self.thumbnail_layout = QHBoxLayout(self.thumbnail_widget)
+        self.thumbnail_cache = ThumbnailCache(parent=self)
+        self.thumbnail_model = ThumbnailListModel(self)
+        self.thumbnail_gallery = QtWidgets.QListView()
 
 
         self.history_layout = QVBoxLayout()
@@ -473,19 +1018,41 @@ class ScreenshotApp(QtWidgets.QWidget):
         self.setup_ui()
         self.apply_stylesheet(self.is_dark_mode)
 
-        # --- Timer ---
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.capture_and_compare)
+        # --- Capture Worker ---
+        # Created on start_capture, lives on its own thread until stop_capture
+        self.capture_thread = None
+        self.capture_worker = None
+        self.stopping_workers = []  # Keeps stopped workers alive until their thread exits
 
         # --- REMOVED: Progress Indicator and related code ---
 
         # --- Thumbnail Gallery ---
-        self.thumbnail_layout.setAlignment(Qt.AlignLeft)
-        self.thumbnail_layout.setSpacing(10)
-        self.thumbnail_layout.setContentsMargins(5, 5, 5, 5)
+        # A single horizontal row; the view only paints (and the cache only
+        # loads) the cards that are visible.
+        self.thumbnail_gallery.setModel(self.thumbnail_model)
+        self.thumbnail_gallery.setItemDelegate(ThumbnailDelegate(self.thumbnail_cache, self.thumbnail_gallery))
+        self.thumbnail_gallery.setViewMode(QtWidgets.QListView.IconMode)
+        self.thumbnail_gallery.setFlow(QtWidgets.QListView.LeftToRight)
+        self.thumbnail_gallery.setWrapping(False)
+        self.thumbnail_gallery.setMovement(QtWidgets.QListView.Static)
+        self.thumbnail_gallery.setUniformItemSizes(True)
+        self.thumbnail_gallery.setHorizontalScrollMode(QtWidgets.QAbstractItemView.ScrollPerPixel)
+        self.thumbnail_gallery.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.thumbnail_gallery.setFixedHeight(ThumbnailDelegate.CARD_SIZE.height()
+                                              + self.thumbnail_gallery.horizontalScrollBar().sizeHint().height() + 6)
+        self.thumbnail_gallery.setMouseTracking(True)  # Hover highlight
+        self.thumbnail_gallery.clicked.connect(
+            lambda index: self.thumbnail_clicked_card(index.data(Qt.UserRole)))
+        self.thumbnail_cache.thumbnail_ready.connect(lambda _: self.thumbnail_gallery.viewport().update())
 
         # --- Screenshot History ---
-        self.update_history_list()
+        # The gallery and the history are filled in finish_startup(), once the window is up
+        self.capture_index = None
+        self.history_reconciled.connect(self.update_history_list)
+        self.archive_recompressed.connect(self.on_archive_recompressed)
+        self.captures_removed.connect(self.on_captures_removed)
+        self.warm_up_done.connect(self.on_warm_up_done)
+        self.monitors_counted.connect(self.on_monitors_counted)
 
         # --- Hotkeys ---
         self.start_hotkey = QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+Shift+S"), self)
@@ -494,6 +1061,8 @@ class ScreenshotApp(QtWidgets.QWidget):
         self.stop_hotkey.activated.connect(self.stop_capture)
         self.open_hotkey = QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+Shift+O"), self)
         self.open_hotkey.activated.connect(self.open_last_screenshot)
+        self.profile_hotkey = QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+Shift+P"), self)
+        self.profile_hotkey.activated.connect(self.toggle_profiling)
 
         # Add new hotkeys
         self.dark_mode_hotkey = QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+D"), self)
@@ -518,6 +1087,49 @@ class ScreenshotApp(QtWidgets.QWidget):
 
     # --- REMOVED: def load_spinner(self): ... ---
 
+    def finish_startup(self):
+        """Runs once the event loop is up: everything the first paint doesn't need."""
+        self.mark_startup("window shown")
+        self.thumbnail_model.set_folder(self.base_output_path)
+        self.open_capture_index()
+        self.mark_startup("history loaded")
+        threading.Thread(target=self.warm_up, name="slide-snap-warm-up", daemon=True).start()
+
+    def warm_up(self):
+        """Imports the capture modules and lists the monitors in the background.
+
+        Start Capture then doesn't wait for OpenCV, and the first paint doesn't
+        wait for a capture backend.
+        """
+        try:
+            backend = create_backend(self.capture_backend)
+            try:
+                self.monitors_counted.emit(len(backend.monitors()))
+            finally:
+                backend.close()
+        except Exception as e:
+            print(f"Could not list monitors: {e}")
+        try:
+            import capture_engine  # noqa: F401, loads OpenCV and NumPy
+        except Exception as e:
+            print(f"Could not preload the capture engine: {e}")
+        self.mark_startup("warm-up done")
+        if self.startup_report is not None:
+            self.startup_report.finish()
+        self.warm_up_done.emit()
+
+    def on_monitors_counted(self, count):
+        self.monitor_count = count
+        self.populate_capture_region_combo()
+
+    def on_warm_up_done(self):
+        if self.archive_after_days > 0:
+            self.start_archive_recompression()
+
+    def mark_startup(self, milestone):
+        if self.startup_report is not None:
+            self.startup_report.mark(milestone)
+
     def setup_ui(self):
         # Main layout with splitter
         main_layout = QHBoxLayout(self)
@@ -531,25 +1143,28 @@ class ScreenshotApp(QtWidgets.QWidget):
         history_layout = QVBoxLayout(history_widget)
         history_layout.setContentsMargins(10, 10, 10, 10)
 
-        # Use a QListWidget for the history
-        self.history_list_widget = QListWidget()
-        self.history_list_widget.setStyleSheet("""
-            QListWidget {
+        # Use a lazily populated tree for the history
+        self.history_model = HistoryModel(self)
+        self.history_tree_view = QtWidgets.QTreeView()
+        self.history_tree_view.setModel(self.history_model)
+        self.history_tree_view.setHeaderHidden(True)
+        self.history_tree_view.setUniformRowHeights(True)
+        self.history_tree_view.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.history_tree_view.setStyleSheet("""
+            QTreeView {
                 border: none;
                 background-color: transparent;
             }
-            QListWidget::item {
+            QTreeView::item {
                 margin-bottom: 5px;
             }
 
         """)
 
-        history_layout.addWidget(self.history_list_widget)
-
-        history_scroll = QScrollArea()
-        history_scroll.setWidgetResizable(True)
-        history_scroll.setWidget(self.history_list_widget)
-        history_layout.addWidget(history_scroll)
+        self.history_tree_view.clicked.connect(self.history_item_clicked)
+        self.history_tree_view.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.history_tree_view.customContextMenuRequested.connect(self.show_history_context_menu)
+        history_layout.addWidget(self.history_tree_view)
 
 
         self.splitter.addWidget(history_widget)
@@ -686,12 +1301,16 @@ class ScreenshotApp(QtWidgets.QWidget):
 
         # --- Advanced Settings (Collapsible) ---
         self.advanced_settings_box = ModernCollapsibleBox("Advanced Settings")
-        advanced_layout = QHBoxLayout()
+        advanced_layout = QVBoxLayout()
         advanced_layout.setContentsMargins(5, 10, 5, 10)
 
+        # Detection row
+        detection_layout = QHBoxLayout()
+        advanced_layout.addLayout(detection_layout)
+
         video_check_label = QLabel("Video Detection Interval (s):")
         video_check_label.setToolTip("Set how often to check for playing video")
-        advanced_layout.addWidget(video_check_label)
+        detection_layout.addWidget(video_check_label)
 
         self.video_check_spinbox = QSpinBox()
         self.video_check_spinbox.setRange(1, 60)
@@ -704,26 +1323,440 @@ class ScreenshotApp(QtWidgets.QWidget):
                 border-radius: 4px;
             }
         """)
-        advanced_layout.addWidget(self.video_check_spinbox)
+        detection_layout.addWidget(self.video_check_spinbox)
 
         # Adaptive sensitivity checkbox
         self.adaptive_sensitivity_checkbox = QtWidgets.QCheckBox("Adaptive Sensitivity")
         self.adaptive_sensitivity_checkbox.setChecked(self.adaptive_sensitivity)
         self.adaptive_sensitivity_checkbox.setToolTip("Automatically adjust sensitivity based on image content.")
         self.adaptive_sensitivity_checkbox.stateChanged.connect(self.update_adaptive_sensitivity)
-        advanced_layout.addWidget(self.adaptive_sensitivity_checkbox)
-
+        detection_layout.addWidget(self.adaptive_sensitivity_checkbox)
 
-        advanced_layout.addStretch()
+        detection_layout.addStretch()
 
         # Add keyboard shortcuts button
         self.shortcuts_button = HoverButton(text="Keyboard Shortcuts")
         self.shortcuts_button.clicked.connect(self.show_keyboard_shortcuts)
-        advanced_layout.addWidget(self.shortcuts_button)
+        detection_layout.addWidget(self.shortcuts_button)
+
+        # Comparison row
+        comparison_layout = QHBoxLayout()
+        advanced_layout.addLayout(comparison_layout)
+
+        # Fingerprint prefilter
+        self.prefilter_checkbox = QtWidgets.QCheckBox("Skip Unchanged Frames")
+        self.prefilter_checkbox.setChecked(self.prefilter)
+        self.prefilter_checkbox.setToolTip("Skip the comparison when a cheap fingerprint of the frame has not changed.")
+        self.prefilter_checkbox.stateChanged.connect(self.update_prefilter)
+        comparison_layout.addWidget(self.prefilter_checkbox)
+
+        # Revisited slide deduplication
+        self.dedup_checkbox = QtWidgets.QCheckBox("Skip Revisited Slides")
+        self.dedup_checkbox.setChecked(self.dedup)
+        self.dedup_checkbox.setToolTip("Don't save a slide again when the presenter goes back to it, "
+                                       "only record the revisit.")
+        self.dedup_checkbox.stateChanged.connect(self.update_dedup)
+        comparison_layout.addWidget(self.dedup_checkbox)
+
+        # Comparison mode
+        compare_mode_label = QLabel("Compare Mode:")
+        compare_mode_label.setToolTip("Full: SSIM on the whole frame.\n"
+                                      "Multi-resolution: compare downscaled frames first and only use full resolution when ambiguous.\n"
+                                      "Tiles: only compare the tiles of the screen that changed.")
+        comparison_layout.addWidget(compare_mode_label)
+
+        self.compare_mode_combo = QtWidgets.QComboBox()
+        self.compare_mode_combo.addItem("Full", "full")
+        self.compare_mode_combo.addItem("Multi-resolution", "pyramid")
+        self.compare_mode_combo.addItem("Tiles", "tiles")
+        self.compare_mode_combo.setCurrentIndex(max(0, self.compare_mode_combo.findData(self.compare_mode)))
+        self.compare_mode_combo.currentIndexChanged.connect(self.update_compare_mode)
+        comparison_layout.addWidget(self.compare_mode_combo)
+
+        ambiguity_label = QLabel("Ambiguity Band:")
+        ambiguity_label.setToolTip("How close to the thresholds a score must be to escalate to a finer level")
+        comparison_layout.addWidget(ambiguity_label)
+
+        self.ambiguity_spinbox = QDoubleSpinBox()
+        self.ambiguity_spinbox.setRange(0.0, 1.0)
+        self.ambiguity_spinbox.setDecimals(2)
+        self.ambiguity_spinbox.setSingleStep(0.05)
+        self.ambiguity_spinbox.setValue(self.ambiguity_band)
+        self.ambiguity_spinbox.valueChanged.connect(self.update_ambiguity_band)
+        self.ambiguity_spinbox.setStyleSheet("""
+            QDoubleSpinBox {
+                padding: 5px;
+                border: 1px solid #ccc;
+                border-radius: 4px;
+            }
+        """)
+        comparison_layout.addWidget(self.ambiguity_spinbox)
+
+        self.parallel_compare_checkbox = QtWidgets.QCheckBox("Parallel Compare")
+        self.parallel_compare_checkbox.setChecked(self.parallel_compare)
+        self.parallel_compare_checkbox.setToolTip("Compare very large frames (multi-monitor, 8K) on all CPU cores. "
+                                                  "Applies the next time capturing starts.")
+        self.parallel_compare_checkbox.stateChanged.connect(self.update_parallel_compare)
+        comparison_layout.addWidget(self.parallel_compare_checkbox)
+        comparison_layout.addStretch()
+
+        # Timing row
+        timing_layout = QHBoxLayout()
+        advanced_layout.addLayout(timing_layout)
+
+        self.adaptive_interval_checkbox = QtWidgets.QCheckBox("Adaptive Interval")
+        self.adaptive_interval_checkbox.setChecked(self.adaptive_interval)
+        self.adaptive_interval_checkbox.setToolTip("Capture at the minimum interval right after a change and back "
+                                                   "off towards the maximum while the screen stays the same.")
+        self.adaptive_interval_checkbox.stateChanged.connect(self.update_adaptive_interval)
+        timing_layout.addWidget(self.adaptive_interval_checkbox)
+
+        min_interval_label = QLabel("Min (s):")
+        min_interval_label.setToolTip("Interval used right after a change")
+        timing_layout.addWidget(min_interval_label)
+
+        self.min_interval_spinbox = QDoubleSpinBox()
+        self.min_interval_spinbox.setRange(0.1, 60.0)
+        self.min_interval_spinbox.setDecimals(1)
+        self.min_interval_spinbox.setValue(self.min_interval)
+        self.min_interval_spinbox.valueChanged.connect(self.update_min_interval)
+        self.min_interval_spinbox.setStyleSheet("""
+            QDoubleSpinBox {
+                padding: 5px;
+                border: 1px solid #ccc;
+                border-radius: 4px;
+            }
+        """)
+        timing_layout.addWidget(self.min_interval_spinbox)
+
+        max_interval_label = QLabel("Max (s):")
+        max_interval_label.setToolTip("Longest interval reached while the screen stays unchanged")
+        timing_layout.addWidget(max_interval_label)
+
+        self.max_interval_spinbox = QDoubleSpinBox()
+        self.max_interval_spinbox.setRange(0.1, 300.0)
+        self.max_interval_spinbox.setDecimals(1)
+        self.max_interval_spinbox.setValue(self.max_interval)
+        self.max_interval_spinbox.valueChanged.connect(self.update_max_interval)
+        self.max_interval_spinbox.setStyleSheet("""
+            QDoubleSpinBox {
+                padding: 5px;
+                border: 1px solid #ccc;
+                border-radius: 4px;
+            }
+        """)
+        timing_layout.addWidget(self.max_interval_spinbox)
+        timing_layout.addStretch()
+
+        # Capture row
+        capture_layout = QHBoxLayout()
+        advanced_layout.addLayout(capture_layout)
+
+        capture_backend_label = QLabel("Capture Backend:")
+        capture_backend_label.setToolTip("How the screen is grabbed. Auto picks the fastest backend available.")
+        capture_layout.addWidget(capture_backend_label)
+
+        self.capture_backend_combo = QtWidgets.QComboBox()
+        self.capture_backend_combo.addItem("Auto", "auto")
+        for name in available_backends():
+            self.capture_backend_combo.addItem(name, name)
+        self.capture_backend_combo.setCurrentIndex(max(0, self.capture_backend_combo.findData(self.capture_backend)))
+        self.capture_backend_combo.currentIndexChanged.connect(self.update_capture_backend)
+        capture_layout.addWidget(self.capture_backend_combo)
+
+        capture_region_label = QLabel("Capture Area:")
+        capture_region_label.setToolTip("Only capture one monitor, a region or a window. "
+                                        "Fewer pixels make every check cheaper.")
+        capture_layout.addWidget(capture_region_label)
+
+        self.capture_region_combo = QtWidgets.QComboBox()
+        self.populate_capture_region_combo()  # Monitors are added once warm_up() has counted them
+        self.capture_region_combo.currentIndexChanged.connect(self.update_capture_region)
+        capture_layout.addWidget(self.capture_region_combo)
+
+        image_format_label = QLabel("Save As:")
+        image_format_label.setToolTip("File format used for new screenshots")
+        capture_layout.addWidget(image_format_label)
+
+        self.image_format_combo = QtWidgets.QComboBox()
+        self.image_format_combo.addItem("PNG", "png")
+        self.image_format_combo.addItem("WebP (lossless)", "webp")
+        self.image_format_combo.addItem("JPEG", "jpeg")
+        self.image_format_combo.setCurrentIndex(max(0, self.image_format_combo.findData(self.image_format)))
+        self.image_format_combo.currentIndexChanged.connect(self.update_image_format)
+        capture_layout.addWidget(self.image_format_combo)
+
+        image_level_label = QLabel("Level:")
+        image_level_label.setToolTip("PNG: compression level 0-9. WebP: quality 1-100, 101 = lossless. "
+                                      "JPEG: quality 0-100. Default uses the format's default.")
+        capture_layout.addWidget(image_level_label)
+
+        self.image_level_spinbox = QSpinBox()
+        self.image_level_spinbox.setRange(-1, 101)
+        self.image_level_spinbox.setSpecialValueText("Default")
+        self.image_level_spinbox.setValue(self.image_level)
+        self.image_level_spinbox.valueChanged.connect(self.update_image_level)
+        self.image_level_spinbox.setStyleSheet("""
+            QSpinBox {
+                padding: 5px;
+                border: 1px solid #ccc;
+                border-radius: 4px;
+            }
+        """)
+        capture_layout.addWidget(self.image_level_spinbox)
+
+        self.delta_storage_checkbox = QtWidgets.QCheckBox("Keyframes + Deltas")
+        self.delta_storage_checkbox.setChecked(self.delta_storage)
+        self.delta_storage_checkbox.setToolTip("Store full frames only now and then, and otherwise just the "
+                                               "rectangles that changed. Applied from the next start.")
+        self.delta_storage_checkbox.stateChanged.connect(self.update_delta_storage)
+        capture_layout.addWidget(self.delta_storage_checkbox)
+
+        writer_policy_label = QLabel("When Busy:")
+        writer_policy_label.setToolTip("What to do when screenshots arrive faster than they can be written")
+        capture_layout.addWidget(writer_policy_label)
+
+        self.writer_policy_combo = QtWidgets.QComboBox()
+        self.writer_policy_combo.addItem("Drop Oldest", "drop_oldest")
+        self.writer_policy_combo.addItem("Keep Latest", "coalesce")
+        self.writer_policy_combo.addItem("Wait", "block")
+        self.writer_policy_combo.setCurrentIndex(max(0, self.writer_policy_combo.findData(self.writer_policy)))
+        self.writer_policy_combo.currentIndexChanged.connect(self.update_writer_policy)
+        capture_layout.addWidget(self.writer_policy_combo)
+        capture_layout.addStretch()
+
+        # Archive row
+        archive_layout = QHBoxLayout()
+        advanced_layout.addLayout(archive_layout)
+
+        archive_after_label = QLabel("Recompress After (days):")
+        archive_after_label.setToolTip("Re-encode date folders at least this old more compactly, in the background. "
+                                       "Names and timestamps are kept.")
+        archive_layout.addWidget(archive_after_label)
+
+        self.archive_after_spinbox = QSpinBox()
+        self.archive_after_spinbox.setRange(0, 3650)
+        self.archive_after_spinbox.setSpecialValueText("Off")
+        self.archive_after_spinbox.setValue(self.archive_after_days)
+        self.archive_after_spinbox.valueChanged.connect(self.update_archive_settings)
+        self.archive_after_spinbox.setStyleSheet("""
+            QSpinBox {
+                padding: 5px;
+                border: 1px solid #ccc;
+                border-radius: 4px;
+            }
+        """)
+        archive_layout.addWidget(self.archive_after_spinbox)
+
+        self.archive_format_combo = QtWidgets.QComboBox()
+        self.archive_format_combo.addItem("WebP (lossless)", "webp")
+        self.archive_format_combo.addItem("Optimized PNG", "png")
+        self.archive_format_combo.addItem("Palette PNG (256 colors)", "palette")
+        self.archive_format_combo.setToolTip("Palette PNG is smallest for flat slides, but slightly lossy for photos")
+        self.archive_format_combo.setCurrentIndex(max(0, self.archive_format_combo.findData(self.archive_format)))
+        self.archive_format_combo.currentIndexChanged.connect(self.update_archive_settings)
+        archive_layout.addWidget(self.archive_format_combo)
+
+        archive_budget_label = QLabel("CPU Budget (%):")
+        archive_budget_label.setToolTip("Share of all CPU cores recompression may use while capturing")
+        archive_layout.addWidget(archive_budget_label)
+
+        self.archive_budget_spinbox = QSpinBox()
+        self.archive_budget_spinbox.setRange(5, 100)
+        self.archive_budget_spinbox.setValue(self.archive_cpu_budget)
+        self.archive_budget_spinbox.valueChanged.connect(self.update_archive_settings)
+        self.archive_budget_spinbox.setStyleSheet("""
+            QSpinBox {
+                padding: 5px;
+                border: 1px solid #ccc;
+                border-radius: 4px;
+            }
+        """)
+        archive_layout.addWidget(self.archive_budget_spinbox)
+
+        self.archive_button = QPushButton("Recompress Now")
+        self.archive_button.setToolTip("Recompress folders older than the days set (30 when off) now")
+        self.archive_button.clicked.connect(self.start_archive_recompression)
+        archive_layout.addWidget(self.archive_button)
+        archive_layout.addStretch()
+
+        # Storage limits row
+        retention_layout = QHBoxLayout()
+        advanced_layout.addLayout(retention_layout)
+
+        retention_max_label = QLabel("Max Size (GB):")
+        retention_max_label.setToolTip("Delete the oldest screenshots when all of them together exceed this size")
+        retention_layout.addWidget(retention_max_label)
+
+        self.retention_max_spinbox = QDoubleSpinBox()
+        self.retention_max_spinbox.setRange(0.0, 100000.0)
+        self.retention_max_spinbox.setDecimals(1)
+        self.retention_max_spinbox.setSpecialValueText("No Limit")
+        self.retention_max_spinbox.setValue(self.retention_max_gb)
+        self.retention_max_spinbox.valueChanged.connect(self.update_retention_policy)
+        self.retention_max_spinbox.setStyleSheet("""
+            QDoubleSpinBox {
+                padding: 5px;
+                border: 1px solid #ccc;
+                border-radius: 4px;
+            }
+        """)
+        retention_layout.addWidget(self.retention_max_spinbox)
+
+        retention_age_label = QLabel("Keep (days):")
+        retention_age_label.setToolTip("Delete screenshots older than this")
+        retention_layout.addWidget(retention_age_label)
+
+        self.retention_age_spinbox = QSpinBox()
+        self.retention_age_spinbox.setRange(0, 3650)
+        self.retention_age_spinbox.setSpecialValueText("Forever")
+        self.retention_age_spinbox.setValue(self.retention_max_age_days)
+        self.retention_age_spinbox.valueChanged.connect(self.update_retention_policy)
+        self.retention_age_spinbox.setStyleSheet("""
+            QSpinBox {
+                padding: 5px;
+                border: 1px solid #ccc;
+                border-radius: 4px;
+            }
+        """)
+        retention_layout.addWidget(self.retention_age_spinbox)
+
+        retention_per_day_label = QLabel("Max Per Day:")
+        retention_per_day_label.setToolTip("Keep only the newest screenshots of each day")
+        retention_layout.addWidget(retention_per_day_label)
+
+        self.retention_per_day_spinbox = QSpinBox()
+        self.retention_per_day_spinbox.setRange(0, 100000)
+        self.retention_per_day_spinbox.setSpecialValueText("No Limit")
+        self.retention_per_day_spinbox.setValue(self.retention_max_per_day)
+        self.retention_per_day_spinbox.valueChanged.connect(self.update_retention_policy)
+        self.retention_per_day_spinbox.setStyleSheet("""
+            QSpinBox {
+                padding: 5px;
+                border: 1px solid #ccc;
+                border-radius: 4px;
+            }
+        """)
+        retention_layout.addWidget(self.retention_per_day_spinbox)
+
+        retention_free_label = QLabel("Keep Free (GB):")
+        retention_free_label.setToolTip("Delete the oldest screenshots before the disk gets fuller than this, "
+                                        "so capturing never stops on a full disk")
+        retention_layout.addWidget(retention_free_label)
+
+        self.retention_free_spinbox = QDoubleSpinBox()
+        self.retention_free_spinbox.setRange(0.0, 10000.0)
+        self.retention_free_spinbox.setDecimals(1)
+        self.retention_free_spinbox.setSpecialValueText("Off")
+        self.retention_free_spinbox.setValue(self.retention_min_free_gb)
+        self.retention_free_spinbox.valueChanged.connect(self.update_retention_policy)
+        self.retention_free_spinbox.setStyleSheet("""
+            QDoubleSpinBox {
+                padding: 5px;
+                border: 1px solid #ccc;
+                border-radius: 4px;
+            }
+        """)
+        retention_layout.addWidget(self.retention_free_spinbox)
+        retention_layout.addStretch()
 
         self.advanced_settings_box.setContentLayout(advanced_layout)
         content_layout.addWidget(self.advanced_settings_box)
 
+        # --- Performance Metrics (Collapsible) ---
+        self.metrics_box = ModernCollapsibleBox("Performance Metrics")
+        metrics_layout = QVBoxLayout()
+        metrics_layout.setContentsMargins(5, 10, 5, 10)
+
+        self.metrics_table = QtWidgets.QTableWidget(0, 5)
+        self.metrics_table.setHorizontalHeaderLabels(["Stage", "Count", "p50 (ms)", "p95 (ms)", "Max (ms)"])
+        self.metrics_table.verticalHeader().setVisible(False)
+        self.metrics_table.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
+        self.metrics_table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.metrics_table.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
+        self.metrics_table.setFixedHeight(220)
+        metrics_layout.addWidget(self.metrics_table)
+
+        self.metrics_counters_label = QLabel("No capture running.")
+        self.metrics_counters_label.setWordWrap(True)
+        self.metrics_counters_label.setStyleSheet("font-size: 11px; color: #777;")
+        metrics_layout.addWidget(self.metrics_counters_label)
+
+        # Export row
+        export_layout = QHBoxLayout()
+        metrics_layout.addLayout(export_layout)
+
+        metrics_export_label = QLabel("Export:")
+        metrics_export_label.setToolTip("Periodically write the metrics to a file, e.g. for collection across machines")
+        export_layout.addWidget(metrics_export_label)
+
+        self.metrics_export_combo = QtWidgets.QComboBox()
+        self.metrics_export_combo.addItem("Off", "off")
+        self.metrics_export_combo.addItem("JSON Lines", "jsonl")
+        self.metrics_export_combo.addItem("Prometheus", "prometheus")
+        self.metrics_export_combo.setCurrentIndex(max(0, self.metrics_export_combo.findData(self.metrics_export_format)))
+        self.metrics_export_combo.currentIndexChanged.connect(self.update_metrics_export)
+        export_layout.addWidget(self.metrics_export_combo)
+
+        self.metrics_export_edit = QLineEdit(self.metrics_export_path)
+        self.metrics_export_edit.setReadOnly(True)
+        self.metrics_export_edit.setPlaceholderText("No file selected")
+        self.metrics_export_edit.setStyleSheet("""
+            QLineEdit {
+                padding: 5px;
+                border: 1px solid #ccc;
+                border-radius: 4px;
+                background-color: #f5f5f5;
+            }
+        """)
+        export_layout.addWidget(self.metrics_export_edit)
+
+        self.metrics_export_button = HoverButton(self.browse_icon_data, "Browse...")
+        self.metrics_export_button.clicked.connect(self.browse_metrics_export_path)
+        export_layout.addWidget(self.metrics_export_button)
+
+        metrics_interval_label = QLabel("Every (s):")
+        export_layout.addWidget(metrics_interval_label)
+
+        self.metrics_interval_spinbox = QSpinBox()
+        self.metrics_interval_spinbox.setRange(1, 3600)
+        self.metrics_interval_spinbox.setValue(self.metrics_export_interval)
+        self.metrics_interval_spinbox.valueChanged.connect(self.update_metrics_export)
+        self.metrics_interval_spinbox.setStyleSheet("""
+            QSpinBox {
+                padding: 5px;
+                border: 1px solid #ccc;
+                border-radius: 4px;
+            }
+        """)
+        export_layout.addWidget(self.metrics_interval_spinbox)
+
+        # Profiling row
+        profile_layout = QHBoxLayout()
+        metrics_layout.addLayout(profile_layout)
+
+        self.profile_button = HoverButton(text="Record Profile")
+        self.profile_button.setToolTip("Record a trace of the running capture (Ctrl+Shift+P). "
+                                       "Stop to save it for Perfetto or chrome://tracing.")
+        self.profile_button.clicked.connect(self.toggle_profiling)
+        profile_layout.addWidget(self.profile_button)
+
+        self.profile_cprofile_checkbox = QtWidgets.QCheckBox("Include cProfile")
+        self.profile_cprofile_checkbox.setChecked(self.profile_cprofile)
+        self.profile_cprofile_checkbox.setToolTip("Also profile every function called during the capture ticks "
+                                                  "(.prof file). Adds noticeable overhead while recording.")
+        self.profile_cprofile_checkbox.stateChanged.connect(self.update_profile_cprofile)
+        profile_layout.addWidget(self.profile_cprofile_checkbox)
+        profile_layout.addStretch()
+
+        self.metrics_box.setContentLayout(metrics_layout)
+        content_layout.addWidget(self.metrics_box)
+
+        # Refreshed while the panel is open, independent of the capture interval
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.refresh_metrics_panel)
+        self.metrics_timer.start(1000)
+
         # --- Screenshot Preview ---
         preview_group = QGroupBox("Screenshot Preview")
         preview_layout = QVBoxLayout()
@@ -762,6 +1795,9 @@ class ScreenshotApp(QtWidgets.QWidget):
         # --- Status Area ---
         self.status_label = QLabel("Status: Idle")
         content_layout.addWidget(self.status_label)
+        self.schedule_label = QLabel("")  # Effective interval and overruns while capturing
+        self.schedule_label.setStyleSheet("font-size: 11px; color: #777;")
+        content_layout.addWidget(self.schedule_label)
 
         content_layout.addWidget(self.mode_toggle_button)
 
@@ -781,7 +1817,9 @@ class ScreenshotApp(QtWidgets.QWidget):
         if folder:
             self.base_output_path = folder
             self.output_folder_edit.setText(folder)
-            self.update_history_list()
+            self.stop_archive_recompression()
+            self.open_capture_index()
+            self.thumbnail_model.set_folder(folder)
 
 
     def set_default_preview(self):
@@ -792,17 +1830,296 @@ class ScreenshotApp(QtWidgets.QWidget):
 
     def update_interval(self):
         self.screenshot_interval = self.interval_spinbox.value()
-        if self.is_running:
-            self.timer.setInterval(int(self.screenshot_interval * 1000))
+        if self.capture_worker is not None:
+            QtCore.QMetaObject.invokeMethod(self.capture_worker, "set_interval", Qt.QueuedConnection,
+                                            QtCore.Q_ARG(float, self.screenshot_interval))
+
+    def update_adaptive_interval(self):
+        self.adaptive_interval = self.adaptive_interval_checkbox.isChecked()
+        if self.capture_worker is not None:
+            self.capture_worker.engine.scheduler.adaptive = self.adaptive_interval
+
+    def update_min_interval(self):
+        self.min_interval = self.min_interval_spinbox.value()
+        if self.capture_worker is not None:
+            self.capture_worker.engine.scheduler.min_interval = self.min_interval
+
+    def update_max_interval(self):
+        self.max_interval = self.max_interval_spinbox.value()
+        if self.capture_worker is not None:
+            self.capture_worker.engine.scheduler.max_interval = self.max_interval
 
     def update_sensitivity(self):
         self.sensitivity = self.sensitivity_spinbox.value()
+        if self.capture_worker is not None:
+            self.capture_worker.engine.sensitivity = self.sensitivity
 
     def update_adaptive_sensitivity(self):
         self.adaptive_sensitivity = self.adaptive_sensitivity_checkbox.isChecked()
+        if self.capture_worker is not None:
+            self.capture_worker.engine.adaptive_sensitivity = self.adaptive_sensitivity
 
     def update_video_check_interval(self):
         self.video_check_interval = self.video_check_spinbox.value()
+        if self.capture_worker is not None:
+            self.capture_worker.engine.video_check_interval = self.video_check_interval
+
+    def update_prefilter(self):
+        self.prefilter = self.prefilter_checkbox.isChecked()
+        if self.capture_worker is not None:
+            self.capture_worker.engine.comparator.prefilter = self.prefilter
+
+    def update_parallel_compare(self):
+        # Applied on the next start_capture, the worker processes belong to the comparator
+        self.parallel_compare = self.parallel_compare_checkbox.isChecked()
+
+    def create_comparator(self):
+        """Returns the FrameComparator for the current settings."""
+        from capture_engine import FrameComparator
+        options = (self.compare_mode, self.pyramid_levels, self.ambiguity_band, self.prefilter)
+        if self.parallel_compare:
+            from parallel_compare import ParallelFrameComparator
+            return ParallelFrameComparator(*options, workers=self.compare_workers or None)
+        return FrameComparator(*options)
+
+    def update_dedup(self):
+        self.dedup = self.dedup_checkbox.isChecked()
+        if self.capture_worker is not None:
+            self.capture_worker.engine.dedup = self.dedup
+
+    def update_capture_backend(self):
+        # Applied on the next start_capture, the backend belongs to the worker thread
+        self.capture_backend = self.capture_backend_combo.currentData()
+
+    def populate_capture_region_combo(self):
+        """Fills the capture area selector with the monitors and the current region."""
+        self.capture_region_combo.blockSignals(True)
+        self.capture_region_combo.clear()
+        self.capture_region_combo.addItem("Whole Desktop", "desktop")
+        for number in range(1, self.monitor_count + 1):
+            self.capture_region_combo.addItem(f"Monitor {number}", f"monitor:{number}")
+        region = CaptureRegion.from_spec(self.capture_region)
+        if self.capture_region_combo.findData(self.capture_region) < 0:
+            self.capture_region_combo.addItem(str(region), self.capture_region)
+        self.capture_region_combo.addItem("Draw Region...", "draw")
+        self.capture_region_combo.addItem("Window...", "window")
+        self.capture_region_combo.setCurrentIndex(self.capture_region_combo.findData(self.capture_region))
+        self.capture_region_combo.blockSignals(False)
+
+    def update_capture_region(self):
+        choice = self.capture_region_combo.currentData()
+        if choice == "draw":
+            self.region_selector = RegionSelector()
+            self.region_selector.region_selected.connect(self.on_region_drawn)
+            self.region_selector.destroyed.connect(lambda: self.populate_capture_region_combo())  # Also resets on cancel
+            self.region_selector.show()
+            self.region_selector.activateWindow()
+        elif choice == "window":
+            titles = window_titles()
+            title, ok = QtWidgets.QInputDialog.getItem(self, "Capture Window",
+                                                       "Window title (any part of it):", titles, 0, True)
+            if ok and title.strip():
+                self.set_capture_region(f"window:{title.strip()}")
+            else:
+                self.populate_capture_region_combo()
+        else:
+            self.set_capture_region(choice)
+
+    def on_region_drawn(self, rect):
+        # Qt works in logical pixels, the capture backends in physical ones
+        screen = QApplication.screenAt(rect.center()) or QApplication.primaryScreen()
+        ratio = screen.devicePixelRatio()
+        self.set_capture_region("rect:{},{},{},{}".format(round(rect.x() * ratio), round(rect.y() * ratio),
+                                                          round(rect.width() * ratio),
+                                                          round(rect.height() * ratio)))
+
+    def set_capture_region(self, spec):
+        self.capture_region = spec
+        if self.capture_worker is not None:
+            # Picked up on the next tick, the engine resolves the region every time
+            self.capture_worker.engine.region = CaptureRegion.from_spec(spec)
+        self.populate_capture_region_combo()
+
+    def update_image_format(self):
+        self.image_format = self.image_format_combo.currentData()
+        if self.capture_worker is not None:
+            self.capture_worker.engine.writer.image_format = self.image_format
+
+    def update_image_level(self):
+        self.image_level = self.image_level_spinbox.value()
+        if self.capture_worker is not None:
+            self.capture_worker.engine.writer.level = self.writer_options()["level"]
+
+    def update_delta_storage(self):
+        # Applied on the next start_capture, a running writer keeps its keyframe
+        self.delta_storage = self.delta_storage_checkbox.isChecked()
+
+    def update_archive_settings(self):
+        # Used from the next run on
+        self.archive_after_days = self.archive_after_spinbox.value()
+        self.archive_format = self.archive_format_combo.currentData()
+        self.archive_cpu_budget = self.archive_budget_spinbox.value()
+        if self.archive_recompressor is not None:
+            self.archive_recompressor.cpu_budget = self.archive_cpu_budget / 100
+
+    def start_archive_recompression(self):
+        """Recompresses older date folders on a background thread, see archive.py."""
+        if self.archive_recompressor is not None or self.capture_index is None:
+            return
+        from archive import ArchiveRecompressor
+        capture_index = self.capture_index
+
+        def on_replaced(old_path, new_path):
+            if new_path != old_path:
+                capture_index.remove(old_path)
+            capture_index.add(new_path)
+
+        self.archive_recompressor = ArchiveRecompressor(
+            self.base_output_path, self.archive_format, self.archive_after_days or 30,
+            cpu_budget=self.archive_cpu_budget / 100,
+            busy=lambda: self.capture_worker is not None,  # Full speed while idle
+            on_replaced=on_replaced)
+        self.archive_button.setEnabled(False)
+        self.archive_thread = threading.Thread(target=self.run_archive_recompression,
+                                               args=(self.archive_recompressor,),
+                                               name="slide-snap-archive", daemon=True)
+        self.archive_thread.start()
+
+    def run_archive_recompression(self, recompressor):
+        try:
+            summary = recompressor.run()
+        except Exception as e:
+            print(f"Archive recompression failed: {e}")
+            summary = None
+        self.archive_recompressed.emit(summary)
+
+    def stop_archive_recompression(self):
+        """Stops a running recompression after the files in progress. The next run resumes."""
+        if self.archive_recompressor is not None:
+            self.archive_recompressor.stop()
+            self.archive_thread.join()
+            self.on_archive_recompressed(None)
+
+    def on_archive_recompressed(self, summary):
+        if self.archive_recompressor is None:
+            return  # Already handled by stop_archive_recompression()
+        self.archive_recompressor = None
+        self.archive_thread = None
+        self.archive_button.setEnabled(True)
+        if summary and summary["replaced"]:
+            self.update_history_list()
+            self.thumbnail_model.set_folder(self.base_output_path)
+            saved = (summary["bytes_before"] - summary["bytes_after"]) / (1024 * 1024)
+            self.notification.showMessage(f"Archive recompressed: {summary['replaced']} files, "
+                                          f"{saved:.0f} MB saved.", self.save_icon_data)
+
+    def update_writer_policy(self):
+        self.writer_policy = self.writer_policy_combo.currentData()
+        if self.capture_worker is not None:
+            self.capture_worker.engine.writer.policy = self.writer_policy
+
+    def writer_options(self):
+        """Returns the ImageWriter keyword arguments for the current settings."""
+        return {
+            "image_format": self.image_format,
+            "level": None if self.image_level < 0 else self.image_level,
+            "max_pending": self.writer_queue_size,
+            "policy": self.writer_policy,
+            "delta": self.delta_storage,
+        }
+
+    def browse_metrics_export_path(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Metrics To", self.metrics_export_path or
+                                              os.path.join(self.base_output_path, "slide_snap_metrics.jsonl"),
+                                              "Metrics (*.jsonl *.prom);;All Files (*)")
+        if path:
+            self.metrics_export_path = path
+            self.metrics_export_edit.setText(path)
+            if path.endswith(".prom"):  # node_exporter's textfile collector only reads *.prom
+                self.metrics_export_combo.setCurrentIndex(self.metrics_export_combo.findData("prometheus"))
+            self.update_metrics_export()
+
+    def update_metrics_export(self):
+        self.metrics_export_format = self.metrics_export_combo.currentData()
+        self.metrics_export_interval = self.metrics_interval_spinbox.value()
+        if self.capture_worker is not None:
+            self.start_metrics_exporter()  # Restarted with the new settings
+
+    def start_metrics_exporter(self):
+        """(Re)starts exporting the current session's metrics, if an export is configured."""
+        self.stop_metrics_exporter()
+        if self.metrics_export_format == "off" or not self.metrics_export_path:
+            return
+        self.metrics_exporter = MetricsExporter(self.metrics, self.metrics_export_path,
+                                                self.metrics_export_format, self.metrics_export_interval)
+        self.metrics_exporter.start()
+
+    def stop_metrics_exporter(self):
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.close()  # Writes a last export
+            self.metrics_exporter = None
+
+    def update_profile_cprofile(self):
+        # Used from the next recording on
+        self.profile_cprofile = self.profile_cprofile_checkbox.isChecked()
+
+    def toggle_profiling(self):
+        """Starts recording a profile of the running capture, or stops and saves it."""
+        if self.profiler is not None and self.profiler.active:
+            self.stop_profiling()
+            return
+        if self.capture_worker is None:
+            self.notification.showMessage("Start capturing to record a profile.", self.error_icon_data)
+            return
+        self.profiler = Profiler(self.capture_worker.engine, os.path.join(self.base_output_path, "profiles"),
+                                 self.profile_cprofile)
+        self.profiler.start()
+        self.profile_button.setText("Stop Profiling")
+        self.notification.showMessage("Profiling started. Press Ctrl+Shift+P to stop.", self.start_icon_data)
+
+    def stop_profiling(self):
+        if self.profiler is None or not self.profiler.active:
+            return
+        self.profile_button.setText("Record Profile")
+        try:
+            paths = self.profiler.stop()
+        except OSError as e:
+            self.notification.showMessage(f"Could not save profile: {e}", self.error_icon_data)
+            return
+        self.notification.showMessage(f"Profile saved: {os.path.basename(paths[0])}", self.save_icon_data)
+        print("Profile saved: " + ", ".join(paths))
+
+    def refresh_metrics_panel(self):
+        """Shows the stage timings and counters of the current (or last) session."""
+        if not self.metrics_box.toggle_button.isChecked():
+            return  # Collapsed, nothing to show
+        snapshot = self.metrics.snapshot()
+        stages = snapshot["stages"]
+        self.metrics_table.setRowCount(len(stages))
+        for row, (stage, stats) in enumerate(stages.items()):
+            values = [stage, str(stats["count"])] + [f"{stats[key] * 1000:.1f}" for key in ("p50", "p95", "max")]
+            for column, value in enumerate(values):
+                item = self.metrics_table.item(row, column)
+                if item is None:
+                    item = QtWidgets.QTableWidgetItem()
+                    if column:
+                        item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                    self.metrics_table.setItem(row, column, item)
+                item.setText(value)
+        counters = snapshot["counters"]
+        if counters:
+            self.metrics_counters_label.setText(" | ".join(f"{name.replace('_', ' ').capitalize()}: {value}"
+                                                           for name, value in sorted(counters.items())))
+
+    def update_compare_mode(self):
+        self.compare_mode = self.compare_mode_combo.currentData()
+        if self.capture_worker is not None:
+            self.capture_worker.engine.comparator.mode = self.compare_mode
+
+    def update_ambiguity_band(self):
+        self.ambiguity_band = self.ambiguity_spinbox.value()
+        if self.capture_worker is not None:
+            self.capture_worker.engine.comparator.ambiguity_band = self.ambiguity_band
 
 
     def start_capture(self):
@@ -815,6 +2132,7 @@ class ScreenshotApp(QtWidgets.QWidget):
         self.stop_button.setEnabled(True)
         self.interval_spinbox.setEnabled(False)
         self.browse_button.setEnabled(False)
+        self.capture_backend_combo.setEnabled(False)
         # REMOVED: self.progress_spinner.show() # Show spinner
 
         today_str = datetime.now().strftime("%Y.%m.%d")
@@ -822,7 +2140,7 @@ class ScreenshotApp(QtWidgets.QWidget):
         if not os.path.exists(self.current_date_folder):
             os.makedirs(self.current_date_folder)
 
-        self.timer.start(int(self.screenshot_interval * 1000))
+        self.start_worker()
         self.status_label.setText("Status: Capturing...")
         self.notification.showMessage("Capturing started.", self.start_icon_data)
         self.video_notification_shown = False # Reset notification flag
@@ -838,128 +2156,129 @@ class ScreenshotApp(QtWidgets.QWidget):
         self.stop_button.setEnabled(False)
         self.interval_spinbox.setEnabled(True)
         self.browse_button.setEnabled(True)
-        self.timer.stop()
+        self.capture_backend_combo.setEnabled(True)
+        self.stop_worker()
         self.status_label.setText("Status: Stopped")
+        self.schedule_label.setText("")
         self.notification.showMessage("Capturing stopped.", self.stop_icon_data)
         self.paused_for_video = False  # Ensure this is reset
         # REMOVED: self.progress_spinner.hide()  # Hide spinner
         self.video_notification_shown = False  # Reset on stop
 
-    def is_video_playing(self):
-        current_time = time.time()
-        if current_time - self.last_video_check_time < self.video_check_interval:
-            return self.paused_for_video  # Use existing state if within interval
-
-        self.last_video_check_time = current_time
-
-        try:
-            screenshot1 = pyautogui.screenshot()
-            screenshot1_np = np.array(screenshot1)
-            screenshot1_gray = cv2.cvtColor(screenshot1_np, cv2.COLOR_BGR2GRAY)
-
-            time.sleep(0.5)  # Short delay for video detection
-
-            screenshot2 = pyautogui.screenshot()
-            screenshot2_np = np.array(screenshot2)
-            screenshot2_gray = cv2.cvtColor(screenshot2_np, cv2.COLOR_BGR2GRAY)
-
-            # Use SSIM for video detection as well
-            (score, _) = compare_ssim(screenshot1_gray, screenshot2_gray, full=True)
-
-            # Video is considered playing if the SSIM score is LOW (significant difference)
-            if (1 - score) > 0.1:  #  threshold for video detection (adjust as needed)
-                self.paused_for_video = True
-                return True
-            else:
-                self.paused_for_video = False
-                return False
-
-        except Exception as e:
-            print(f"Error in video detection: {e}")
-            return False  # Assume no video, continue checking
-
-    def _calculate_adaptive_sensitivity(self, image):
-        """Calculates an adaptive sensitivity based on image content."""
-        # Convert the image to grayscale if it's not already
-        if len(image.shape) == 3:  # Check if it's a color image (3 channels)
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = image  # Already grayscale
-
-        # Calculate the standard deviation of the pixel intensities
-        std_dev = np.std(gray)
-
-        adaptive_sensitivity = max(0.001, min(0.05, 0.03 - (std_dev / 255) * 0.02 )) # scale and clamp
-
-        return adaptive_sensitivity
-
-    def capture_and_compare(self):
-        if not self.is_running:
+    def start_worker(self):
+        """Creates the capture worker and moves it onto its own thread."""
+        self.stop_worker()
+
+        self.capture_thread = QtCore.QThread(self)
+        self.metrics = Metrics()
+        self.capture_worker = CaptureWorker(self.base_output_path, self.screenshot_interval,
+                                            self.sensitivity, self.adaptive_sensitivity,
+                                            self.video_check_interval, self.min_diff_pixels,
+                                            self.create_comparator(),
+                                            self.capture_backend, self.writer_options(),
+                                            {"adaptive_interval": self.adaptive_interval,
+                                             "min_interval": self.min_interval,
+                                             "max_interval": self.max_interval,
+                                             "dedup": self.dedup,
+                                             "dedup_distance": self.dedup_distance,
+                                             "region": CaptureRegion.from_spec(self.capture_region),
+                                             "metrics": self.metrics,
+                                             "retention": self.retention})
+        self.capture_worker.moveToThread(self.capture_thread)
+
+        self.capture_worker.screenshot_saved.connect(self.on_screenshot_saved)
+        self.capture_worker.slide_revisited.connect(self.on_slide_revisited)
+        self.capture_worker.region_missing.connect(self.on_region_missing)
+        self.capture_worker.video_paused.connect(self.on_video_paused)
+        self.capture_worker.video_resumed.connect(self.on_video_resumed)
+        self.capture_worker.sensitivity_changed.connect(self.sensitivity_spinbox.setValue)
+        self.capture_worker.compare_stats.connect(self.on_compare_stats)
+        self.capture_worker.error.connect(self.on_capture_error)
+
+        self.capture_thread.started.connect(self.capture_worker.start)
+        self.capture_thread.finished.connect(self.capture_thread.deleteLater)
+        self.capture_thread.start()
+        self.start_metrics_exporter()
+
+    def stop_worker(self, wait=False):
+        """Asks the capture worker to stop. Pending saves still complete."""
+        if self.capture_worker is None:
             return
-
-        # 1. Check for Video FIRST (using SSIM)
-        if self.is_video_playing():
-            if not self.video_notification_shown:  # Only show notification once per pause
-                self.status_label.setText("Status: Paused (video detected)")
-                self.notification.showMessage("Video detected. Capture paused.", self.pause_icon_data)
-                self.video_notification_shown = True
-            return  # Exit if video is playing
-
-        # 2. If we get here, video is NOT currently playing.
-
-        # 3.  If we WERE paused (but are no longer), show the resume message and reset flags.
-        if self.paused_for_video:
-            self.paused_for_video = False       # We are no longer paused
-            self.video_notification_shown = False  # Reset notification for next video
+        self.stop_profiling()
+        self.stop_metrics_exporter()
+        # Checked at the top of every tick, so a queued tick returns immediately
+        self.capture_worker.is_running = False
+        QtCore.QMetaObject.invokeMethod(self.capture_worker, "stop", Qt.QueuedConnection)
+
+        entry = (self.capture_thread, self.capture_worker)
+        self.stopping_workers.append(entry)
+        self.capture_thread.finished.connect(lambda: self.stopping_workers.remove(entry))
+        if wait:
+            self.capture_thread.wait()
+        self.capture_worker = None
+        self.capture_thread = None
+
+    def on_screenshot_saved(self, filepath, region=None):
+        with self.metrics.span("gui_update"):
+            filename = os.path.basename(filepath)
+            self.last_changed_region = region
+            self.notification.showMessage(f'Screenshot saved: {filename}', self.save_icon_data)
+            self.last_screenshot_path = filepath
+            self.update_preview(filepath)
+            self.open_button.setEnabled(True)
+            self.add_to_history(filepath)
+            self.add_thumbnail(filepath)
+
+    def on_slide_revisited(self, filepath):
+        self.notification.showMessage(f'Slide revisited: {os.path.basename(filepath)}', self.save_icon_data)
+
+    def on_region_missing(self, message):
+        self.region_missing = True
+        self.status_label.setText("Status: Waiting for capture area")
+        self.notification.showMessage(f"{message}. Capture paused until it is back.", self.pause_icon_data)
+
+    def on_video_paused(self):
+        self.paused_for_video = True
+        if not self.video_notification_shown:  # Only show notification once per pause
+            self.status_label.setText("Status: Paused (video detected)")
+            self.notification.showMessage("Video detected. Capture paused.", self.pause_icon_data)
+            self.video_notification_shown = True
+
+    def on_video_resumed(self):
+        self.paused_for_video = False       # We are no longer paused
+        self.video_notification_shown = False  # Reset notification for next video
+        if self.is_running:
             self.status_label.setText("Status: Capturing...")
             self.notification.showMessage("Capturing resumed.", self.start_icon_data)
 
-
-        # 4. Proceed with screenshot comparison (if not paused for video)
-        try:
-            screenshot = pyautogui.screenshot()
-            screenshot_np = np.array(screenshot)
-            screenshot_gray = cv2.cvtColor(screenshot_np, cv2.COLOR_BGR2GRAY)
-
-            if self.previous_screenshot is not None:
-                # --- SSIM Comparison ---
-                (score, diff) = compare_ssim(self.previous_screenshot, screenshot_gray, full=True)
-                diff = (diff * 255).astype("uint8")
-                _, diff_binary = cv2.threshold(diff, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
-                non_zero_count = np.count_nonzero(diff_binary)
-
-                # Get the dimensions of the screenshot (for percentage calculation, if needed)
-                height, width = screenshot_gray.shape
-                total_pixels = height * width
-
-                # --- Adaptive Sensitivity Logic ---
-                if self.adaptive_sensitivity:
-                    current_sensitivity = self._calculate_adaptive_sensitivity(screenshot_gray)
-                    self.sensitivity_spinbox.setValue(current_sensitivity)  # Update UI
-                else:
-                    current_sensitivity = self.sensitivity  # Use the user-set value
-
-                # ---  Change Detection Decision ---
-                if (1 - score) > current_sensitivity and non_zero_count > self.min_diff_pixels:
-                    filename = f'screenshot_{datetime.now().strftime("%Y%m%d_%H%M%S")}.png'
-                    filepath = os.path.join(self.current_date_folder, filename)
-                    screenshot.save(filepath)
-                    self.notification.showMessage(f'Screenshot saved: {filename}', self.save_icon_data)
-                    self.last_screenshot_path = filepath
-                    self.update_preview(filepath)
-                    self.open_button.setEnabled(True)
-                    self.add_to_history(filepath)
-                    self.add_thumbnail(filepath)
-
-            self.previous_screenshot = screenshot_gray
-
-        except Exception as e:
-            self.notification.showMessage(f"Error: {e}", self.error_icon_data)
+    def on_compare_stats(self, stats):
+        """Shows how much comparison work was skipped or decided early."""
+        lines = [f"Unchanged frames skipped: {stats['prefilter_skips']}/{stats['prefilter_checks']} "
+                 f"({stats['skip_ratio']:.1%})",
+                 "Comparisons decided at:"]
+        for level, rate in stats["hit_rates"].items():
+            name = "full resolution" if level == 1 else f"1/{level} scale"
+            lines.append(f"  {name}: {rate:.1%}")
+        lines.append(f"Frame buffers: {stats['buffer_bytes'] / (1024 * 1024):.0f} MB "
+                     f"({stats['buffer_allocations']} allocations)")
+        self.status_label.setToolTip("\n".join(lines))
+        if self.region_missing:  # Stats only arrive from ticks that grabbed the region
+            self.region_missing = False
+            if self.is_running and not self.paused_for_video:
+                self.status_label.setText("Status: Capturing...")
+
+        schedule = f"Interval: {stats['interval']:.1f} s"
+        if stats["overruns"]:
+            schedule += f" | Overruns: {stats['overruns']} ({stats['skipped_ticks']} ticks skipped)"
+        self.schedule_label.setText(schedule)
+
+    def on_capture_error(self, message):
+        self.notification.showMessage(f"Error: {message}", self.error_icon_data)
+        if self.is_running:
             self.stop_capture()
 
-
     def update_preview(self, image_path):
-        pixmap = QPixmap(image_path)
+        pixmap = QPixmap.fromImage(capture_qimage(image_path)) if is_delta(image_path) else QPixmap(image_path)
         if pixmap.isNull():
             self.notification.showMessage(f"Error loading image: {os.path.basename(image_path)}", self.error_icon_data)
             return
@@ -967,9 +2286,7 @@ class ScreenshotApp(QtWidgets.QWidget):
 
     def add_thumbnail(self, image_path):
         """Adds a thumbnail to the gallery."""
-        thumbnail_card = ThumbnailCard(image_path)
-        thumbnail_card.clicked.connect(self.thumbnail_clicked_card)
-        self.thumbnail_layout.addWidget(thumbnail_card)
+        self.thumbnail_model.add_path(image_path)
 
 
     def thumbnail_clicked_card(self, image_path):
@@ -987,6 +2304,7 @@ class ScreenshotApp(QtWidgets.QWidget):
         """Opens the image using the default system viewer."""
         if os.path.exists(image_path):
             try:
+                image_path = materialize(image_path)  # Viewers can't read delta captures
                 if sys.platform == "win32":
                     os.startfile(image_path)
                 elif sys.platform == "darwin":
@@ -999,79 +2317,221 @@ class ScreenshotApp(QtWidgets.QWidget):
         else:
              QMessageBox.critical(self, "Error", f"File does not exist: {image_path}")
 
+    def open_capture_index(self):
+        """Opens the capture index of the output folder and reconciles it in the background."""
+        self.stop_retention()
+        if self.capture_index is not None:
+            self.capture_index.close()
+            self.capture_index = None
+
+        if os.path.isdir(self.base_output_path):
+            try:
+                self.capture_index = CaptureIndex(self.base_output_path)
+            except Exception as e:  # sqlite3.Error, or a read-only folder
+                print(f"Could not open capture index: {e}")
+
+        # Whatever is indexed already shows up immediately
+        self.update_history_list()
+        if self.capture_index is not None:
+            threading.Thread(target=self.reconcile_capture_index, args=(self.capture_index,),
+                             name="slide-snap-reconcile", daemon=True).start()
+            self.retention = RetentionManager(self.capture_index, self.retention_policy(),
+                                              on_removed=self.captures_removed.emit)
+            self.retention.start()
+            self.retention.request()  # Applies the limits to what is already there
+
+    def retention_policy(self):
+        gigabyte = 1024 ** 3
+        return RetentionPolicy(max_bytes=int(self.retention_max_gb * gigabyte),
+                               max_age_days=self.retention_max_age_days,
+                               max_files_per_day=self.retention_max_per_day,
+                               min_free_bytes=int(self.retention_min_free_gb * gigabyte))
+
+    def update_retention_policy(self):
+        self.retention_max_gb = self.retention_max_spinbox.value()
+        self.retention_max_age_days = self.retention_age_spinbox.value()
+        self.retention_max_per_day = self.retention_per_day_spinbox.value()
+        self.retention_min_free_gb = self.retention_free_spinbox.value()
+        if self.retention is not None:
+            self.retention.policy = self.retention_policy()  # Also used by a running capture
+            self.retention.request()
+
+    def stop_retention(self):
+        if self.retention is not None:
+            self.retention.close()
+            self.retention = None
+
+    def on_captures_removed(self, paths):
+        """Drops captures deleted by the retention policy from the history, gallery and preview."""
+        for path in paths:
+            self.history_model.remove_capture(path)
+            self.remove_thumbnail(path)
+            if path == self.last_screenshot_path:
+                self.last_screenshot_path = ""
+                self.set_default_preview()
+                self.open_button.setEnabled(False)
+
+    def reconcile_capture_index(self, capture_index):
+        """Runs on a background thread, picks up files changed outside the app."""
+        try:
+            added, removed = capture_index.reconcile()
+        except Exception as e:
+            print(f"Error reconciling capture index: {e}")
+            return
+        if (added or removed) and capture_index is self.capture_index:
+            self.history_reconciled.emit()
+
     def add_to_history(self, filepath):
-        pass # You can implement this if needed
+        if self.capture_index is not None and self.capture_index.add(filepath):
+            self.history_model.add_capture(filepath)
 
     def update_history_list(self):
-        """Updates the history list with collapsible date and hour sections."""
+        """Updates the history tree with collapsible date and hour sections."""
+        # Only the dates are loaded here, hours and files load on expand
+        self.history_model.set_capture_index(self.capture_index)
 
-        # Clear existing items from the QListWidget
-        self.history_list_widget.clear()
+    def history_item_clicked(self, index):
+        filepath = index.data(Qt.UserRole)
+        if filepath:
+            self.open_image(filepath)
 
-        if not os.path.exists(self.base_output_path):
+    def show_history_context_menu(self, position):
+        """Offers the PDF export on date and hour rows of the history."""
+        index = self.history_tree_view.indexAt(position)
+        if not index.isValid():
+            return
+        node = index.internalPointer()
+        if node.kind == HistoryNode.DATE:
+            date, hour = node.key, None
+        elif node.kind == HistoryNode.HOUR:
+            date, hour = node.parent.key, node.key
+        else:
             return
 
-        dated_files = {}
-
-        # Gather files and group them by date and hour
-        for date_folder in sorted(os.listdir(self.base_output_path), reverse=True):
-            date_path = os.path.join(self.base_output_path, date_folder)
-            if os.path.isdir(date_path):
-                for filename in os.listdir(date_path):
-                    if filename.endswith(".png"):
-                        filepath = os.path.join(date_path, filename)
-                        try:
-                            dt = datetime.strptime(filename, "screenshot_%Y%m%d_%H%M%S.png")
-                            date_str = dt.strftime("%Y.%m.%d")
-                            hour_str = dt.strftime("%H")
-                            if date_str not in dated_files:
-                                dated_files[date_str] = {}
-                            if hour_str not in dated_files[date_str]:
-                                dated_files[date_str][hour_str] = []
-                            dated_files[date_str][hour_str].append((filepath, filename))
-                        except ValueError:
-                            print(f"Skipping file with unexpected name format: {filename}")
-                            continue
-
-        # Create QListWidgetItems
-        for date_str in sorted(dated_files.keys(), reverse=True):
-            date_item = QListWidgetItem(date_str)
-            date_item.setFont(QtGui.QFont("Arial", 12, QtGui.QFont.Bold))
-            self.history_list_widget.addItem(date_item)
-
-            for hour_str in sorted(dated_files[date_str].keys(), reverse=True):
-                hour_item = QListWidgetItem(f"  Hour: {hour_str}")
-                hour_item.setFont(QtGui.QFont("Arial", 11, QtGui.QFont.Bold))
-                self.history_list_widget.addItem(hour_item)
-
-                for filepath, filename in sorted(dated_files[date_str][hour_str], key=lambda x: x[1], reverse=True):
-                    file_item = QListWidgetItem(f"    {filename}")
-                    file_item.setData(Qt.UserRole, filepath)  # Store the filepath
-                    file_item.setFont(QtGui.QFont("Arial", 10))
-                    file_item.setToolTip(filepath)  # Show filepath as tooltip
-                    self.history_list_widget.addItem(file_item)
-
-        # Connect the itemClicked signal to open the image
-        self.history_list_widget.itemClicked.connect(self.history_item_clicked)
-
-    def history_item_clicked(self, item):
-        filepath = item.data(Qt.UserRole)
-        if filepath:
-            self.open_image(filepath)
+        menu = QMenu(self)
+        export_action = QAction("Export to PDF...", self)
+        export_action.setEnabled(self.pdf_export_cancelled is None)  # One export at a time
+        export_action.triggered.connect(lambda: self.export_session_pdf(date, hour))
+        menu.addAction(export_action)
+        menu.exec_(self.history_tree_view.viewport().mapToGlobal(position))
+
+    # (label, max width in pixels or None, JPEG quality or None for lossless)
+    PDF_PRESETS = [
+        ("Original resolution (lossless)", None, None),
+        ("Original resolution, JPEG", None, 90),
+        ("1920 px wide, JPEG", 1920, 85),
+        ("1280 px wide, JPEG (smallest)", 1280, 75),
+    ]
+
+    def export_session_pdf(self, date, hour=None):
+        """Asks for a file and page quality, then writes the captures of date (and hour) to a PDF."""
+        if self.capture_index is None or self.pdf_export_cancelled is not None:
+            return
+        import pdf_export
+        paths = pdf_export.session_files(self.capture_index, date, hour)
+        if not paths:
+            QMessageBox.information(self, "Information", "No screenshots to export.")
+            return
+
+        name = f"slides_{date}" + (f"_{hour}" if hour else "") + ".pdf"
+        output_path, _ = QFileDialog.getSaveFileName(self, "Export to PDF", os.path.join(self.base_output_path, name),
+                                                     "PDF Files (*.pdf)")
+        if not output_path:
+            return
+        labels = [label for label, _, _ in self.PDF_PRESETS]
+        label, ok = QtWidgets.QInputDialog.getItem(self, "Export to PDF", f"{len(paths)} pages. Page quality:",
+                                                   labels, min(self.pdf_preset, len(labels) - 1), False)
+        if not ok:
+            return
+        self.pdf_preset = labels.index(label)
+        _, max_width, quality = self.PDF_PRESETS[self.pdf_preset]
+
+        self.pdf_export_cancelled = threading.Event()
+        progress = QtWidgets.QProgressDialog(f"Exporting {os.path.basename(output_path)}...", "Cancel",
+                                             0, len(paths), self)
+        progress.setWindowTitle("Export to PDF")
+        progress.setMinimumDuration(500)
+        progress.canceled.connect(self.pdf_export_cancelled.set)
+
+        signals = PdfExportSignals(self)
+        signals.progress.connect(lambda done, total: progress.setValue(done))
+        signals.finished.connect(lambda path, pages: self.on_pdf_exported(progress, path, pages))
+        signals.failed.connect(lambda message: self.on_pdf_export_failed(progress, message))
+        title = f"Slides {date}" + (f" {hour}:00" if hour else "")
+        QtCore.QThreadPool.globalInstance().start(
+            PdfExportTask(paths, output_path, max_width, quality, title, self.pdf_export_cancelled, signals))
+
+    def on_pdf_exported(self, progress, path, pages):
+        self.pdf_export_cancelled = None
+        progress.close()
+        self.notification.showMessage(f"Exported {pages} pages to {os.path.basename(path)}", self.save_icon_data)
+
+    def on_pdf_export_failed(self, progress, message):
+        self.pdf_export_cancelled = None
+        progress.close()
+        if message:  # Empty when cancelled
+            self.notification.showMessage(f"PDF export failed: {message}", self.error_icon_data)
 
 
     def closeEvent(self, event):
         """Saves settings before closing the application."""
+        self.stop_worker(wait=True)
+        self.stop_archive_recompression()
+        self.stop_retention()
+        if self.pdf_export_cancelled is not None:
+            self.pdf_export_cancelled.set()  # The partial PDF is removed
         self.save_settings()
+        if self.capture_index is not None:
+            self.capture_index.close()
         super().closeEvent(event)
 
     def load_settings(self):
         """Loads application settings."""
         self.base_output_path = self.settings.value("output_folder", self.base_output_path)
         self.screenshot_interval = float(self.settings.value("interval", self.screenshot_interval))
+        self.adaptive_interval = self.settings.value("adaptive_interval", self.adaptive_interval, type=bool)
+        self.min_interval = float(self.settings.value("min_interval", self.min_interval))
+        self.max_interval = float(self.settings.value("max_interval", self.max_interval))
         self.sensitivity = float(self.settings.value("sensitivity", self.sensitivity))  # Load as float
         self.video_check_interval = int(self.settings.value("video_check_interval", self.video_check_interval))
         self.adaptive_sensitivity = self.settings.value("adaptive_sensitivity", self.adaptive_sensitivity, type=bool)
+        self.compare_mode = self.settings.value("compare_mode", self.compare_mode)
+        self.ambiguity_band = float(self.settings.value("ambiguity_band", self.ambiguity_band))
+        self.prefilter = self.settings.value("prefilter", self.prefilter, type=bool)
+        self.parallel_compare = self.settings.value("parallel_compare", self.parallel_compare, type=bool)
+        self.compare_workers = int(self.settings.value("compare_workers", self.compare_workers))
+        self.dedup = self.settings.value("dedup", self.dedup, type=bool)
+        self.dedup_distance = int(self.settings.value("dedup_distance", self.dedup_distance))
+        self.metrics_export_format = self.settings.value("metrics_export_format", self.metrics_export_format)
+        self.metrics_export_path = self.settings.value("metrics_export_path", self.metrics_export_path)
+        self.metrics_export_interval = int(self.settings.value("metrics_export_interval",
+                                                               self.metrics_export_interval))
+        self.profile_cprofile = self.settings.value("profile_cprofile", self.profile_cprofile, type=bool)
+        self.pdf_preset = int(self.settings.value("pdf_preset", self.pdf_preset))
+        self.archive_after_days = int(self.settings.value("archive_after_days", self.archive_after_days))
+        self.archive_format = self.settings.value("archive_format", self.archive_format)
+        self.archive_cpu_budget = int(self.settings.value("archive_cpu_budget", self.archive_cpu_budget))
+        self.retention_max_gb = float(self.settings.value("retention_max_gb", self.retention_max_gb))
+        self.retention_max_age_days = int(self.settings.value("retention_max_age_days", self.retention_max_age_days))
+        self.retention_max_per_day = int(self.settings.value("retention_max_per_day", self.retention_max_per_day))
+        self.retention_min_free_gb = float(self.settings.value("retention_min_free_gb", self.retention_min_free_gb))
+        self.capture_backend = self.settings.value("capture_backend", self.capture_backend)
+        self.capture_region = self.settings.value("capture_region", self.capture_region)
+        try:
+            CaptureRegion.from_spec(self.capture_region)
+        except ValueError:
+            print(f"Ignoring invalid capture region setting: {self.capture_region}")
+            self.capture_region = "desktop"
+        self.image_format = self.settings.value("image_format", self.image_format)
+        self.image_level = int(self.settings.value("image_level", self.image_level))
+        self.writer_policy = self.settings.value("writer_policy", self.writer_policy)
+        self.writer_queue_size = int(self.settings.value("writer_queue_size", self.writer_queue_size))
+        self.delta_storage = self.settings.value("delta_storage", self.delta_storage, type=bool)
+        levels = self.settings.value("pyramid_levels", ",".join(str(level) for level in self.pyramid_levels))
+        try:
+            self.pyramid_levels = tuple(int(level) for level in str(levels).split(",") if level.strip())
+        except ValueError:
+            print(f"Ignoring invalid pyramid levels setting: {levels}")
 
 
         # Load window geometry and state
@@ -1087,9 +2547,39 @@ class ScreenshotApp(QtWidgets.QWidget):
         """Saves application settings."""
         self.settings.setValue("output_folder", self.base_output_path)
         self.settings.setValue("interval", self.screenshot_interval)
+        self.settings.setValue("adaptive_interval", self.adaptive_interval)
+        self.settings.setValue("min_interval", self.min_interval)
+        self.settings.setValue("max_interval", self.max_interval)
         self.settings.setValue("sensitivity", self.sensitivity)  # Save as float
         self.settings.setValue("video_check_interval", self.video_check_interval)
         self.settings.setValue("adaptive_sensitivity", self.adaptive_sensitivity)
+        self.settings.setValue("compare_mode", self.compare_mode)
+        self.settings.setValue("ambiguity_band", self.ambiguity_band)
+        self.settings.setValue("prefilter", self.prefilter)
+        self.settings.setValue("parallel_compare", self.parallel_compare)
+        self.settings.setValue("compare_workers", self.compare_workers)
+        self.settings.setValue("dedup", self.dedup)
+        self.settings.setValue("dedup_distance", self.dedup_distance)
+        self.settings.setValue("metrics_export_format", self.metrics_export_format)
+        self.settings.setValue("metrics_export_path", self.metrics_export_path)
+        self.settings.setValue("metrics_export_interval", self.metrics_export_interval)
+        self.settings.setValue("profile_cprofile", self.profile_cprofile)
+        self.settings.setValue("pdf_preset", self.pdf_preset)
+        self.settings.setValue("archive_after_days", self.archive_after_days)
+        self.settings.setValue("archive_format", self.archive_format)
+        self.settings.setValue("archive_cpu_budget", self.archive_cpu_budget)
+        self.settings.setValue("retention_max_gb", self.retention_max_gb)
+        self.settings.setValue("retention_max_age_days", self.retention_max_age_days)
+        self.settings.setValue("retention_max_per_day", self.retention_max_per_day)
+        self.settings.setValue("retention_min_free_gb", self.retention_min_free_gb)
+        self.settings.setValue("capture_backend", self.capture_backend)
+        self.settings.setValue("capture_region", self.capture_region)
+        self.settings.setValue("image_format", self.image_format)
+        self.settings.setValue("image_level", self.image_level)
+        self.settings.setValue("writer_policy", self.writer_policy)
+        self.settings.setValue("writer_queue_size", self.writer_queue_size)
+        self.settings.setValue("delta_storage", self.delta_storage)
+        self.settings.setValue("pyramid_levels", ",".join(str(level) for level in self.pyramid_levels))
         self.settings.setValue("geometry", self.saveGeometry())
         self.settings.setValue("windowState", self.saveState())
 
@@ -1136,13 +2626,19 @@ class ScreenshotApp(QtWidgets.QWidget):
                                          QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
             if reply == QMessageBox.Yes:
                 try:
-                    os.remove(self.last_screenshot_path)
+                    deleted_path = self.last_screenshot_path
+                    os.remove(deleted_path)
+                    keyframe = release_keyframe(deleted_path) if is_delta(deleted_path) else None
+                    if self.capture_index is not None:
+                        self.capture_index.remove(deleted_path)
+                        if keyframe is not None:
+                            self.capture_index.remove(keyframe[0])
                     self.notification.showMessage("Screenshot deleted.", self.delete_icon_data)
                     self.last_screenshot_path = ""
                     self.set_default_preview()
                     self.open_button.setEnabled(False)
-                    self.update_history_list()
-                    self.remove_thumbnail(self.last_screenshot_path)
+                    self.history_model.remove_capture(deleted_path)
+                    self.remove_thumbnail(deleted_path)
 
                 except OSError as e:
                     QMessageBox.critical(self, "Error", f"Could not delete file: {e}")
@@ -1151,11 +2647,8 @@ class ScreenshotApp(QtWidgets.QWidget):
 
     def remove_thumbnail(self, image_path):
         """Removes the corresponding thumbnail from the gallery."""
-        for i in range(self.thumbnail_layout.count()):
-            widget = self.thumbnail_layout.itemAt(i).widget()
-            if isinstance(widget, ThumbnailCard) and widget.image_path == image_path:
-                widget.deleteLater()
-                break
+        self.thumbnail_model.remove_path(image_path)
+        self.thumbnail_cache.invalidate(image_path)
 
 
     def dragEnterEvent(self, event):
@@ -1165,7 +2658,7 @@ class ScreenshotApp(QtWidgets.QWidget):
     def dropEvent(self, event):
         for url in event.mimeData().urls():
             file_path = url.toLocalFile()
-            if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
+            if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp', DELTA_EXTENSION)):
                 self.update_preview(file_path)
                 self.last_screenshot_path = file_path
                 self.open_button.setEnabled(True)
@@ -1223,12 +2716,12 @@ class ScreenshotApp(QtWidgets.QWidget):
                     color: white;
                     border: 1px solid #767676;
                 }
-                QListWidget {
+                QListWidget, QTreeView {
                     background-color: #444;
                     border: 1px solid #555;
                 }
 
-                QListWidget::item:selected {
+                QListWidget::item:selected, QTreeView::item:selected {
                     background: #666;
                     color: white;
                 }
@@ -1284,11 +2777,11 @@ class ScreenshotApp(QtWidgets.QWidget):
                     color: black;
                     border: black 1px solid;
                 }
-                QListWidget{
+                QListWidget, QTreeView {
                    background-color: #fff;
                    border: 1px solid #aaa;
                 }
-                QListWidget::item:selected {
+                QListWidget::item:selected, QTreeView::item:selected {
                     background: #bbb;
                     color: black;
                 }
@@ -1329,9 +2822,16 @@ class ScreenshotApp(QtWidgets.QWidget):
 
 
 
-if __name__ == '__main__':
-    app = QApplication(sys.argv)
+def main(argv=None, startup_report=None):
+    app = QApplication(sys.argv if argv is None else argv)
     app.setStyle("Fusion")  # Use the Fusion style for a modern look
-    window = ScreenshotApp()
+    window = ScreenshotApp(startup_report)
+    if startup_report is not None:
+        startup_report.mark("window created")
     window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    QTimer.singleShot(0, window.finish_startup)  # Runs after the first events, i.e. once the window is up
+    return app.exec_()
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()  # Parallel compare workers in frozen builds
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""Perceptual hashes of the slides saved in a Slide Snap date folder.
+
+When a presenter goes back to an earlier slide, the frame differs from the
+previous one and would be saved again. SlideHashStore remembers a
+difference hash (dHash) of every saved slide, indexed for Hamming distance
+lookups, so the capture loop can recognise a revisit and record it instead
+of writing a duplicate file. The hash only narrows down the candidates:
+slides with the same layout and different text can hash a bit or two
+apart, so the caller confirms a match against the saved pixels. The store is kept next to the captures as a
+JSON lines file and reloaded when capture resumes on the same day.
+"""
+import json
+import os
+import threading
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+HASH_SIZE = 16  # 16x16 gradient bits. Slides sharing a layout can still hash alike, see find()
+
+
+def dhash(gray, size=HASH_SIZE):
+    """Returns the difference hash of a grayscale frame as a size*size bit int."""
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class SlideHashStore:
+    """Hashes of saved slides with multi-index Hamming search.
+
+    The hash is split into max_distance + 1 chunks, each with its own
+    lookup table. Two hashes within max_distance bits must agree exactly on
+    at least one chunk, so find() only measures the distance to the few
+    entries sharing a chunk instead of scanning every slide.
+
+    add() and find() may be called from different threads. With a folder,
+    every addition and revisit is appended to FILENAME in it.
+    """
+    FILENAME = ".slide_hashes.jsonl"
+
+    def __init__(self, folder=None, max_distance=8, bits=HASH_SIZE * HASH_SIZE):
+        self.folder = folder
+        self.max_distance = max_distance
+        self.revisits = 0
+        chunks = max_distance + 1
+        self._chunks = [(bits * i // chunks, bits * (i + 1) // chunks) for i in range(chunks)]
+        self._tables = [{} for _ in self._chunks]
+        self._paths = {}  # hash -> file paths, oldest first. Slides sharing a layout can share a hash
+        self._count = 0
+        self._lock = threading.Lock()
+        if folder is not None:
+            self._load()
+
+    def __len__(self):
+        return self._count
+
+    def _keys(self, value):
+        for table, (low, high) in zip(self._tables, self._chunks):
+            yield table, (value >> low) & ((1 << (high - low)) - 1)
+
+    def _index(self, value, path):
+        paths = self._paths.setdefault(value, [])
+        if path in paths:
+            return
+        paths.append(path)
+        self._count += 1
+        for table, key in self._keys(value):
+            table.setdefault(key, set()).add(value)
+
+    def _unindex(self, value, path):
+        paths = self._paths[value]
+        paths.remove(path)
+        self._count -= 1
+        if not paths:
+            del self._paths[value]
+            for table, key in self._keys(value):
+                table[key].discard(value)
+
+    def add(self, value, path):
+        """Remembers a saved slide."""
+        with self._lock:
+            self._index(value, path)
+        self._append({"hash": format(value, "x"), "file": os.path.basename(path)})
+
+    def find(self, value, verify=None):
+        """Returns the path of the closest saved slide within max_distance, or None.
+
+        verify(path) is called for each candidate, closest hash first and
+        newest first among equal hashes, and a candidate only matches if it
+        returns True. Slides whose file was
+        deleted are forgotten, so they can be saved again. Stores without a
+        folder only live in memory and skip that check.
+        """
+        paths = []
+        with self._lock:
+            candidates = set()
+            for table, key in self._keys(value):
+                candidates.update(table.get(key, ()))
+            for candidate in sorted(candidates, key=lambda c: hamming(value, c)):
+                if hamming(value, candidate) > self.max_distance:
+                    break
+                for path in reversed(list(self._paths[candidate])):
+                    if self.folder is None or os.path.exists(path):
+                        paths.append(path)
+                    else:
+                        self._unindex(candidate, path)
+        for path in paths:  # Outside the lock, verify() may read the file
+            if verify is None or verify(path):
+                return path
+        return None
+
+    def record_revisit(self, path, timestamp):
+        """Records that the slide saved as path was shown again at timestamp."""
+        self.revisits += 1
+        self._append({"revisit": os.path.basename(path),
+                      "time": datetime.fromtimestamp(timestamp).isoformat(timespec="seconds")})
+
+    def _append(self, record):
+        if self.folder is None:
+            return
+        try:
+            with open(os.path.join(self.folder, self.FILENAME), "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            print(f"Could not update slide hashes: {e}")
+
+    def _load(self):
+        filepath = os.path.join(self.folder, self.FILENAME)
+        if not os.path.exists(filepath):
+            return
+        with open(filepath, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line after a crash
+                if "hash" in record:
+                    self._index(int(record["hash"], 16), os.path.join(self.folder, record["file"]))
+                elif "revisit" in record:
+                    self.revisits += 1
@@ -0,0 +1,578 @@
+"""Command line entry point for Slide Snap.
+
+    python slide_snap.py                 # Starts the GUI
+    python slide_snap.py --headless      # Captures without any GUI
+    python slide_snap.py --replay FILE   # Runs the detector over recorded footage
+    python slide_snap.py --export-pdf 2024.05.02[:HH]  # Writes a day or hour of captures to a PDF
+    python slide_snap.py --recompress-archive  # Recompresses date folders older than --archive-after days
+
+Headless mode runs the same CaptureEngine as the GUI but never imports Qt,
+so it suits lecture-hall machines and Xvfb sessions. Settings come from the
+defaults, then a JSON config file (--config), then command line flags. Every
+event is logged to stdout as one JSON object per line. Stop with Ctrl+C or
+SIGTERM; frames already queued are still written.
+
+Replay mode (see replay.py) takes the same settings and logs the score and
+decision for every sampled frame, followed by a throughput summary.
+
+--profile records a Chrome trace (and with --cprofile a cProfile dump) of
+the run, see profiling.py. In headless mode SIGUSR1 starts and stops
+recording while capturing, no restart needed.
+
+--export-pdf writes the captures of a date, or of one hour with DATE:HH,
+from the output folder into a single PDF, one page per slide, see
+pdf_export.py. Pages are JPEG at --pdf-quality unless --pdf-lossless, and
+--pdf-max-width downscales wider captures.
+
+--recompress-archive re-encodes the captures of older date folders more
+compactly (see archive.py) and exits. With --archive-while-capturing, a
+headless capture does the same in the background, within --archive-cpu-budget.
+
+--max-total-gb, --max-age-days, --max-files-per-day and --min-free-gb
+delete the oldest captures to bound disk usage while capturing headless,
+see retention.py.
+
+--delta-storage writes full keyframes only now and then and otherwise just
+the rectangles that changed, as .sdelta files, see delta_store.py.
+
+--startup-report prints how long the GUI took to start, with the slowest
+imports, see startup.py.
+"""
+import time
+
+LAUNCHED = time.perf_counter()  # Taken before the other imports, for --startup-report
+
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+
+DEFAULTS = {
+    "output_folder": str(Path.home() / "Screenshots"),
+    "interval": 5.0,
+    "adaptive_interval": True,
+    "min_interval": 1.0,
+    "max_interval": 10.0,
+    "sensitivity": 0.005,
+    "adaptive_sensitivity": True,
+    "video_detection": True,
+    "video_check_interval": 5,
+    "min_diff_pixels": 10000,
+    "compare_mode": "full",
+    "pyramid_levels": [8, 4],
+    "ambiguity_band": 0.5,
+    "prefilter": True,
+    "parallel_compare": False,
+    "compare_workers": 0,
+    "dedup": False,
+    "dedup_distance": 8,
+    "capture_backend": "auto",
+    "region": "desktop",
+    "image_format": "png",
+    "image_level": None,
+    "writer_policy": "block",
+    "writer_queue_size": 4,
+    "delta_storage": False,
+    "metrics_file": None,
+    "metrics_format": "jsonl",
+    "metrics_interval": 60.0,
+    "archive_after_days": 30,
+    "archive_format": "webp",
+    "archive_cpu_budget": 0.25,
+    "archive_while_capturing": False,
+    "max_total_gb": 0,
+    "max_age_days": 0,
+    "max_files_per_day": 0,
+    "min_free_gb": 0,
+}
+
+
+class JsonLog:
+    """Writes one JSON object per line. Safe to call from several threads."""
+
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def __call__(self, event, **fields):
+        record = {"time": datetime.now().isoformat(timespec="milliseconds"), "event": event}
+        record.update(fields)
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+def load_config(path):
+    """Reads a JSON config file. Unknown keys are rejected to catch typos."""
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"{path}: expected a JSON object")
+    unknown = sorted(set(config) - set(DEFAULTS))
+    if unknown:
+        raise ValueError(f"{path}: unknown settings: {', '.join(unknown)}")
+    return config
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Slide Snap: automatic screenshots of slide changes")
+    parser.add_argument("--headless", action="store_true", help="capture without the GUI")
+    parser.add_argument("--replay", metavar="SOURCE",
+                        help="run the detector over a video file or image folder instead of the screen")
+    parser.add_argument("--replay-output", metavar="FOLDER",
+                        help="with --replay, also save the frames that would have been captured here")
+    parser.add_argument("--profile", action="store_true",
+                        help="record a Chrome trace of the run (headless: toggle later with SIGUSR1)")
+    parser.add_argument("--cprofile", action="store_true", help="with profiling, also write a cProfile dump")
+    parser.add_argument("--profile-dir", metavar="FOLDER",
+                        help='where profiles are written, default "profiles" in the output folder')
+    parser.add_argument("--export-pdf", metavar="DATE[:HOUR]",
+                        help="write the captures of a date (YYYY.MM.DD) or hour (YYYY.MM.DD:HH) to one PDF")
+    parser.add_argument("--pdf-output", metavar="FILE",
+                        help='PDF to write, default "slides_<date>[_<hour>].pdf" in the output folder')
+    parser.add_argument("--pdf-max-width", type=int, metavar="PIXELS", help="downscale wider pages to this width")
+    parser.add_argument("--pdf-quality", type=int, default=85, help="JPEG quality of the pages (default: 85)")
+    parser.add_argument("--pdf-lossless", action="store_true", help="store the pages losslessly instead of JPEG")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="print the GUI startup time with an import-time breakdown to stderr")
+    parser.add_argument("--config", help="JSON file with settings, overridden by flags")
+    parser.add_argument("--output", dest="output_folder", help="folder the date folders are created in")
+    parser.add_argument("--interval", type=float, help="seconds between captures")
+    parser.add_argument("--adaptive-interval", dest="adaptive_interval", action="store_true", default=None,
+                        help="poll at --min-interval after a change and back off to --max-interval")
+    parser.add_argument("--fixed-interval", dest="adaptive_interval", action="store_false",
+                        help="always poll every --interval seconds")
+    parser.add_argument("--min-interval", type=float, help="adaptive interval right after a change")
+    parser.add_argument("--max-interval", type=float, help="longest adaptive interval on a static screen")
+    parser.add_argument("--sensitivity", type=float, help="SSIM change needed to save, lower is more sensitive")
+    parser.add_argument("--adaptive", dest="adaptive_sensitivity", action="store_true", default=None,
+                        help="derive the sensitivity from the screen content")
+    parser.add_argument("--no-adaptive", dest="adaptive_sensitivity", action="store_false",
+                        help="always use --sensitivity")
+    parser.add_argument("--video-detection", dest="video_detection", action="store_true", default=None,
+                        help="pause while a video is playing")
+    parser.add_argument("--no-video-detection", dest="video_detection", action="store_false",
+                        help="never pause for video")
+    parser.add_argument("--video-check-interval", type=float, help="seconds between video checks")
+    parser.add_argument("--min-diff-pixels", type=int, help="changed pixels needed to save")
+    parser.add_argument("--dedup", dest="dedup", action="store_true", default=None,
+                        help="record revisited slides instead of saving them again")
+    parser.add_argument("--no-dedup", dest="dedup", action="store_false", help="save revisited slides again")
+    parser.add_argument("--dedup-distance", type=int, help="max differing hash bits for a revisit")
+    parser.add_argument("--compare-mode", choices=("full", "pyramid", "tiles"), help="comparison strategy")
+    parser.add_argument("--parallel-compare", dest="parallel_compare", action="store_true", default=None,
+                        help="compare large frames in bands on a process pool")
+    parser.add_argument("--compare-workers", type=int, help="processes for --parallel-compare, 0 = all cores")
+    parser.add_argument("--capture-backend", help='screen capture backend, "auto" picks the fastest')
+    parser.add_argument("--region",
+                        help='what to capture: "desktop", "monitor:N", "rect:LEFT,TOP,WIDTH,HEIGHT" or "window:TITLE"')
+    parser.add_argument("--format", dest="image_format", choices=("png", "webp", "jpeg"), help="file format")
+    parser.add_argument("--level", dest="image_level", type=int, help="PNG compression or WebP/JPEG quality")
+    parser.add_argument("--when-busy", dest="writer_policy", choices=("block", "drop_oldest", "coalesce"),
+                        help="what to do when the write queue is full")
+    parser.add_argument("--delta-storage", dest="delta_storage", action="store_true", default=None,
+                        help="store keyframes plus the changed rectangles of each capture")
+    parser.add_argument("--metrics-file", help="periodically export stage timings and counters to this file")
+    parser.add_argument("--metrics-format", choices=("jsonl", "prometheus"),
+                        help="append JSON lines, or rewrite a Prometheus text file (node_exporter textfile)")
+    parser.add_argument("--metrics-interval", type=float, help="seconds between metrics exports")
+    parser.add_argument("--recompress-archive", action="store_true",
+                        help="recompress the captures of older date folders, then exit")
+    parser.add_argument("--archive-after", dest="archive_after_days", type=int,
+                        help="recompress date folders at least this many days old")
+    parser.add_argument("--archive-format", choices=("png", "webp", "palette"),
+                        help="optimized PNG, lossless WebP or 256-color palette PNG")
+    parser.add_argument("--archive-cpu-budget", type=float,
+                        help="share of all CPU cores recompression may use while capturing, e.g. 0.25")
+    parser.add_argument("--archive-while-capturing", dest="archive_while_capturing", action="store_true",
+                        default=None, help="headless: recompress older folders in the background")
+    parser.add_argument("--max-total-gb", type=float,
+                        help="delete the oldest captures when all of them exceed this size, 0 = no limit")
+    parser.add_argument("--max-age-days", type=int, help="delete captures older than this, 0 = keep forever")
+    parser.add_argument("--max-files-per-day", type=int, help="keep only the newest captures of each day")
+    parser.add_argument("--min-free-gb", type=float,
+                        help="delete the oldest captures to keep this much disk space free, 0 = off")
+    return parser
+
+
+def resolve_settings(args):
+    """Merges the defaults, the config file and the flags, in that order."""
+    settings = dict(DEFAULTS)
+    if args.config:
+        settings.update(load_config(args.config))
+    for key in DEFAULTS:
+        value = getattr(args, key, None)
+        if value is not None:
+            settings[key] = value
+    return settings
+
+
+def create_engine(settings, output_folder, **options):
+    """Builds a CaptureEngine from resolved settings. options go to CaptureEngine."""
+    from capture_backends import CaptureRegion
+    from capture_engine import CaptureEngine, FrameComparator
+
+    compare_args = (settings["compare_mode"], settings["pyramid_levels"], settings["ambiguity_band"],
+                    settings["prefilter"])
+    if settings["parallel_compare"]:
+        from parallel_compare import ParallelFrameComparator
+        comparator = ParallelFrameComparator(*compare_args, workers=settings["compare_workers"] or None)
+    else:
+        comparator = FrameComparator(*compare_args)
+    writer_options = {"image_format": settings["image_format"], "level": settings["image_level"],
+                      "max_pending": settings["writer_queue_size"], "policy": settings["writer_policy"],
+                      "delta": settings["delta_storage"]}
+    return CaptureEngine(output_folder, settings["interval"], settings["sensitivity"],
+                         settings["adaptive_sensitivity"], settings["video_detection"],
+                         settings["video_check_interval"], settings["min_diff_pixels"], comparator,
+                         settings["capture_backend"], writer_options,
+                         region=CaptureRegion.from_spec(settings["region"]),
+                         adaptive_interval=settings["adaptive_interval"], min_interval=settings["min_interval"],
+                         max_interval=settings["max_interval"], dedup=settings["dedup"],
+                         dedup_distance=settings["dedup_distance"], **options)
+
+
+def start_metrics_export(settings, engine):
+    """Returns a started MetricsExporter for the engine, or None without --metrics-file."""
+    if not settings["metrics_file"]:
+        return None
+    from metrics import MetricsExporter
+
+    exporter = MetricsExporter(engine.metrics, settings["metrics_file"], settings["metrics_format"],
+                               settings["metrics_interval"])
+    exporter.start()
+    return exporter
+
+
+def create_profiler(args, engine, output_folder):
+    from profiling import Profiler
+
+    return Profiler(engine, args.profile_dir or os.path.join(output_folder, "profiles"), args.cprofile)
+
+
+def save_profile(profiler, log):
+    """Stops the profiler if it is recording and logs the files written."""
+    if not profiler.active:
+        return
+    try:
+        log("profile_saved", paths=profiler.stop())
+    except OSError as e:
+        log("error", message=f"Could not save profile: {e}")
+
+
+def create_retention(settings, index, log):
+    """Returns a started RetentionManager for index, or None when no limit is set."""
+    from retention import RetentionManager, RetentionPolicy
+
+    gigabyte = 1024 ** 3
+    policy = RetentionPolicy(max_bytes=int(settings["max_total_gb"] * gigabyte),
+                             max_age_days=settings["max_age_days"],
+                             max_files_per_day=settings["max_files_per_day"],
+                             min_free_bytes=int(settings["min_free_gb"] * gigabyte))
+    if index is None or not policy.enabled:
+        return None
+    retention = RetentionManager(index, policy, on_removed=lambda paths: log("retention_removed", paths=paths))
+    retention.start()
+    retention.request()  # Applies the limits to what is already there
+    return retention
+
+
+def create_recompressor(settings, output_folder, index, busy=None):
+    """Returns an ArchiveRecompressor that keeps index (may be None) up to date."""
+    from archive import ArchiveRecompressor
+
+    def on_replaced(old_path, new_path):
+        if index is not None:
+            if new_path != old_path:
+                index.remove(old_path)
+            index.add(new_path)
+
+    return ArchiveRecompressor(output_folder, settings["archive_format"], settings["archive_after_days"],
+                               cpu_budget=settings["archive_cpu_budget"], busy=busy, on_replaced=on_replaced)
+
+
+def recompress_archive(recompressor, log):
+    log("archive_started", format=recompressor.target, min_age_days=recompressor.min_age_days)
+    try:
+        summary = recompressor.run()
+    except Exception as e:
+        log("error", message=f"Archive recompression failed: {e}")
+        return False
+    log("archive_finished", **summary)
+    return True
+
+
+def run_recompress_archive(settings, log):
+    output_folder = settings["output_folder"]
+    if not os.path.isdir(output_folder):
+        log("error", message=f"Output folder does not exist: {output_folder}")
+        return 1
+    from capture_index import CaptureIndex
+
+    index = CaptureIndex(output_folder)
+    try:
+        recompressor = create_recompressor(settings, output_folder, index)
+    except ValueError as e:
+        index.close()
+        log("error", message=str(e))
+        return 1
+
+    def request_stop(signum, frame):
+        log("stopping", signal=signal.Signals(signum).name)
+        recompressor.stop()  # Files in progress are finished, the next run resumes
+
+    signal.signal(signal.SIGINT, request_stop)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, request_stop)
+    try:
+        return 0 if recompress_archive(recompressor, log) else 1
+    finally:
+        index.close()
+
+
+def run_replay(settings, source, save_folder, log, args):
+    """Replays a video or image folder through the detector and logs every frame."""
+    if not os.path.exists(source):
+        log("error", message=f"Replay source does not exist: {source}")
+        return 1
+    if save_folder is not None and not os.path.isdir(save_folder):
+        log("error", message=f"Output folder does not exist: {save_folder}")
+        return 1
+
+    import replay
+
+    clock = replay.SimulatedClock(datetime.now().timestamp())
+    failed = []
+    try:
+        engine = create_engine(settings, save_folder or ".", save_captures=save_folder is not None, clock=clock,
+                               on_error=failed.append)
+    except ValueError as e:
+        log("error", message=str(e))
+        return 1
+    log("replay_started", source=source, settings={key: settings[key] for key in sorted(settings)})
+    exporter = start_metrics_export(settings, engine)
+    profiler = create_profiler(args, engine, save_folder or ".")
+    if args.profile:
+        profiler.start()
+    try:
+        run = replay.replay
+        if profiler.profile is not None:
+            run = functools.partial(profiler.profile.runcall, run)  # Replay skips tick(), profile it all
+        summary = run(engine, replay.open_source(source, settings["interval"]), clock,
+                      on_frame=lambda record: log("frame", **record))
+    except Exception as e:
+        log("error", message=str(e))
+        return 1
+    finally:
+        engine.close()  # Waits for frames still being written with --replay-output
+        if exporter is not None:
+            exporter.close()
+        save_profile(profiler, log)
+    for message in failed:
+        log("error", message=message)
+    summary.update(engine.compare_summary())
+    summary["metrics"] = engine.metrics.snapshot()
+    log("replay_finished", **summary)
+    return 1 if failed else 0
+
+
+def run_export_pdf(settings, session, log, args):
+    """Writes the captures of a date or hour in the output folder to one PDF."""
+    output_folder = settings["output_folder"]
+    if not os.path.isdir(output_folder):
+        log("error", message=f"Output folder does not exist: {output_folder}")
+        return 1
+
+    import pdf_export
+    from capture_index import CaptureIndex
+
+    try:
+        date, hour = pdf_export.parse_session(session)
+    except ValueError as e:
+        log("error", message=str(e))
+        return 1
+    index = CaptureIndex(output_folder)
+    try:
+        index.reconcile()  # Picks up captures made while nothing was indexing
+        paths = pdf_export.session_files(index, date, hour)
+    finally:
+        index.close()
+    if not paths:
+        log("error", message=f"No captures for {session} in {output_folder}")
+        return 1
+
+    name = f"slides_{date}" + (f"_{hour}" if hour else "") + ".pdf"
+    output_path = args.pdf_output or os.path.join(output_folder, name)
+    quality = None if args.pdf_lossless else args.pdf_quality
+    log("export_started", path=output_path, images=len(paths), max_width=args.pdf_max_width, quality=quality)
+
+    last_logged = [time.monotonic()]
+
+    def on_progress(done, total):
+        now = time.monotonic()
+        if now - last_logged[0] >= 1.0 or done == total:
+            last_logged[0] = now
+            log("export_progress", done=done, total=total)
+
+    started = time.perf_counter()
+    try:
+        pages = pdf_export.export_pdf(paths, output_path, args.pdf_max_width, quality,
+                                      f"Slides {date}" + (f" {hour}:00" if hour else ""), on_progress)
+    except (OSError, ValueError) as e:
+        log("error", message=f"Could not export {output_path}: {e}")
+        return 1
+    log("export_finished", path=output_path, pages=pages, seconds=round(time.perf_counter() - started, 3))
+    return 0
+
+
+def run_headless(settings, log, args):
+    output_folder = settings["output_folder"]
+    if not os.path.isdir(output_folder):
+        log("error", message=f"Output folder does not exist: {output_folder}")
+        return 1
+
+    # Imported here so setting errors are reported before OpenCV loads
+    from capture_index import CaptureIndex
+
+    try:
+        index = CaptureIndex(output_folder)  # Keeps the GUI history in sync with headless captures
+    except Exception as e:
+        log("warning", message=f"Capture index unavailable: {e}")
+        index = None
+
+    state = {"video_paused": False, "failed": False}
+
+    def on_saved(filepath, region):
+        if index is not None:
+            index.add(filepath)
+        log("capture", path=filepath, region=list(region) if region else None)
+
+    def on_video_paused():
+        if not state["video_paused"]:  # Reported on every paused tick, log the transition only
+            state["video_paused"] = True
+            log("video_paused")
+
+    def on_video_resumed():
+        state["video_paused"] = False
+        log("video_resumed")
+
+    def on_error(message):
+        state["failed"] = True
+        log("error", message=message)
+
+    retention = create_retention(settings, index, log)
+    try:
+        engine = create_engine(settings, output_folder, retention=retention, on_saved=on_saved,
+                               on_revisit=lambda filepath: log("revisit", path=filepath),
+                               on_region_missing=lambda message: log("region_missing", message=message),
+                               on_video_paused=on_video_paused, on_video_resumed=on_video_resumed,
+                               on_error=on_error)
+    except ValueError as e:
+        log("error", message=str(e))
+        return 1
+    recompressor = None
+    if settings["archive_while_capturing"]:
+        try:
+            # Always throttled: it only runs while capturing
+            recompressor = create_recompressor(settings, output_folder, index, busy=lambda: True)
+        except ValueError as e:
+            log("error", message=str(e))
+            engine.close()
+            return 1
+
+    def request_stop(signum, frame):
+        log("stopping", signal=signal.Signals(signum).name)
+        engine.stop()
+
+    profiler = create_profiler(args, engine, output_folder)
+
+    def toggle_profile():
+        if profiler.active:
+            save_profile(profiler, log)
+        else:
+            profiler.start()
+            log("profile_started")
+
+    def request_profile(signum, frame):
+        # The handler runs on the capture thread, possibly inside a profiled
+        # tick; toggling waits for that tick, so it can't happen here.
+        threading.Thread(target=toggle_profile, name="slide-snap-profile").start()
+
+    signal.signal(signal.SIGINT, request_stop)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, request_stop)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, request_profile)
+
+    try:
+        engine.start()
+    except Exception as e:
+        log("error", message=str(e))
+        engine.close()
+        return 1
+
+    log("started", output_folder=output_folder, backend=engine.backend.name, region=str(engine.region),
+        settings={key: settings[key] for key in sorted(settings)})
+    exporter = start_metrics_export(settings, engine)
+    if args.profile:
+        toggle_profile()
+    archiver = None
+    if recompressor is not None:
+        archiver = threading.Thread(target=recompress_archive, args=(recompressor, log),
+                                    name="slide-snap-archive", daemon=True)
+        archiver.start()
+    try:
+        engine.run()
+    finally:
+        engine.close()  # Waits for queued frames
+        if archiver is not None:
+            recompressor.stop()
+            archiver.join()
+        if exporter is not None:
+            exporter.close()
+        save_profile(profiler, log)
+        log("stopped", metrics=engine.metrics.snapshot(), **engine.compare_summary())
+        if retention is not None:
+            retention.close()
+        if index is not None:
+            index.close()
+    return 1 if state["failed"] else 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        settings = resolve_settings(args)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    if args.recompress_archive:
+        return run_recompress_archive(settings, JsonLog())
+    if args.export_pdf:
+        return run_export_pdf(settings, args.export_pdf, JsonLog(), args)
+    if args.replay:
+        return run_replay(settings, args.replay, args.replay_output, JsonLog(), args)
+    if not args.headless:
+        report = None
+        if args.startup_report:
+            from startup import StartupReport
+            report = StartupReport(LAUNCHED)
+            report.install()
+        import screenshot_app
+        if report is not None:
+            report.mark("imports done")
+        return screenshot_app.main([sys.argv[0]], startup_report=report)
+    return run_headless(settings, JsonLog(), args)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Parallel compare workers in frozen builds
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""Startup timing for Slide Snap.
+
+    python slide_snap.py --startup-report
+
+StartupReport wraps the import statement to time every module the first
+time it is loaded, and records milestones (imports done, window created,
+window shown, history loaded, background warm-up done). Once startup is
+complete, it prints the milestones and the slowest imports to stderr, so
+a module that starts loading eagerly again shows up at once.
+"""
+import builtins
+import sys
+import threading
+import time
+
+
+class StartupReport:
+    """Import times and startup milestones, measured from started (a perf_counter() value)."""
+
+    def __init__(self, started=None, stream=None, top=20):
+        self.started = time.perf_counter() if started is None else started
+        self.stream = stream
+        self.top = top
+        self.milestones = []  # (name, seconds since started, thread name)
+        self.imports = {}  # Module name -> (cumulative seconds, self seconds, thread name)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._original_import = None
+        self.finished = False
+
+    def install(self):
+        """Starts timing imports. Call before the modules of interest are imported."""
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _loading(self, name, fromlist, level):
+        """Returns what an import statement is about to load, or None when it is all loaded already."""
+        if level:
+            return None  # Relative imports inside a package count towards the package
+        module = sys.modules.get(name)
+        if module is None:
+            return name
+        if fromlist and hasattr(module, "__path__"):  # from package import submodule
+            missing = [f"{name}.{item}" for item in fromlist
+                       if item != "*" and not hasattr(module, item) and f"{name}.{item}" not in sys.modules]
+            if missing:
+                return ", ".join(missing)
+        return None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original = self._original_import or builtins.__import__
+        loading = self._loading(name, fromlist, level)
+        if loading is None:
+            return original(name, globals, locals, fromlist, level)
+
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)  # Time spent in nested imports
+        started = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self._lock:
+                self.imports.setdefault(loading, (elapsed, elapsed - nested, threading.current_thread().name))
+
+    def mark(self, milestone):
+        with self._lock:
+            self.milestones.append((milestone, time.perf_counter() - self.started,
+                                    threading.current_thread().name))
+
+    def finish(self):
+        """Stops timing imports and prints the report. Only the first call prints."""
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+        self.uninstall()
+        stream = self.stream or sys.stderr
+        stream.write(self.format())
+        stream.flush()
+
+    def format(self):
+        with self._lock:
+            milestones = list(self.milestones)
+            imports = dict(self.imports)
+        lines = ["Slide Snap startup report", "", "Milestones (seconds since launch):"]
+        for name, seconds, thread in milestones:
+            suffix = "" if thread == "MainThread" else f"  [{thread}]"
+            lines.append(f"  {seconds:8.3f}  {name}{suffix}")
+
+        total = sum(self_time for _, self_time, _ in imports.values())
+        lines += ["", f"Slowest imports ({len(imports)} modules, {total * 1000:.0f} ms in total), "
+                      "milliseconds cumulative / self:"]
+        slowest = sorted(imports.items(), key=lambda item: item[1][0], reverse=True)[:self.top]
+        for module, (cumulative, self_time, thread) in slowest:
+            suffix = "" if thread == "MainThread" else f"  [{thread}]"
+            lines.append(f"  {cumulative * 1000:8.1f} {self_time * 1000:8.1f}  {module}{suffix}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,65 @@
+"""Revisit detection must not mistake slides that share a layout for each other."""
+import itertools
+import os
+import sys
+import time
+
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from capture_engine import CaptureEngine  # noqa: E402
+
+
+def slide(title):
+    """A 640x360 slide: same bullets and layout every time, only the title text differs."""
+    image = np.full((360, 640, 3), 255, np.uint8)
+    cv2.putText(image, title, (40, 110), cv2.FONT_HERSHEY_SIMPLEX, 3, (0, 0, 0), 6)
+    for row in range(3):
+        cv2.circle(image, (60, 180 + row * 50), 8, (0, 0, 0), -1)
+        cv2.putText(image, "Same bullet text", (90, 192 + row * 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+    return image
+
+
+def make_engine(folder, save_captures):
+    # dedup_distance 255 makes every saved slide a hash candidate, so only the pixel check decides
+    clock = itertools.count(1_700_000_000).__next__
+    return CaptureEngine(folder, adaptive_sensitivity=False, video_detection=False, min_diff_pixels=500,
+                         dedup=True, dedup_distance=255, save_captures=save_captures, clock=clock)
+
+
+def show(engine, image):
+    engine.process(image, cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+    return engine.last_revisit
+
+
+def test_same_layout_slides_are_not_revisits(tmp_path):
+    engine = make_engine(str(tmp_path), save_captures=False)
+    try:
+        show(engine, np.full((360, 640, 3), 255, np.uint8))
+        assert show(engine, slide("Slide 1")) is None
+        assert show(engine, slide("Slide 2")) is None
+        assert show(engine, slide("Slide 3")) is None
+        assert show(engine, slide("Slide 1")) is not None
+        assert engine.metrics.snapshot()["counters"]["revisits"] == 1
+    finally:
+        engine.close()
+
+
+def test_revisit_is_checked_against_the_saved_file(tmp_path):
+    engine = make_engine(str(tmp_path), save_captures=True)
+    try:
+        show(engine, np.full((360, 640, 3), 255, np.uint8))
+        for count, title in enumerate(("Slide 1", "Slide 2"), 1):
+            assert show(engine, slide(title)) is None
+            deadline = time.monotonic() + 10
+            while len(engine.hash_store) < count and time.monotonic() < deadline:
+                time.sleep(0.01)  # Hashes are added once the writer has saved the file
+        assert show(engine, slide("Slide 3")) is None
+        first = show(engine, slide("Slide 1"))
+        assert first is not None and os.path.exists(first)
+    finally:
+        engine.close()